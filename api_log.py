@@ -1,6 +1,7 @@
 
 import streamlit as st
-import google.generativeai as genai
+from client_pool import build_generative_model, close_generative_model
+from config import config
 
 # This system stores the API key in session state only, to have it persist, use setup,py
 
@@ -9,10 +10,14 @@ def validate_api_key(api_key):
     if not api_key or not api_key.strip():
         return False, "API key cannot be empty"
 
+    # The offline mock backend accepts any key so the app can run without network access
+    if config.LLM_BACKEND == "mock":
+        return True, "API key accepted (mock backend)."
+
+    model = None
     try:
-        # Configure and test the API key
-        genai.configure(api_key=api_key.strip())
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        # Test the API key on a private client so other sessions' keys are left untouched
+        model = build_generative_model(api_key.strip(), "gemini-2.5-flash")
 
         # Make a simple test call
         response = model.generate_content("Say 'API key is valid'")
@@ -31,6 +36,9 @@ def validate_api_key(api_key):
             return False, "API quota exceeded. Please check your Gemini API usage limits."
         else:
             return False, f"Error validating API key: {error_msg}"
+    finally:
+        if model is not None:
+            close_generative_model(model)
 
 def show_login_page():
     """Display the API key login page"""
@@ -0,0 +1,136 @@
+# File Name: benchmark_db.py
+"""
+Measure SQLite throughput under concurrent sessions.
+
+Compares opening a fresh connection per query in rollback-journal mode (the old
+get_db_connection) with the pooled WAL connections of db_connection.py, on
+one file and with the sessions' users spread over shard files (db_shards.py).
+Each simulated session loops over the queries a page rerun makes: look up the
+current plan, load the plan's knowledge items and, for a share of the iterations,
+save a knowledge item.
+
+    python benchmark_db.py [--sessions 8] [--seconds 5] [--write-ratio 0.2] [--shards 4]
+"""
+import argparse
+import contextlib
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from db_connection import ConnectionManager
+from db_migrations import migrate
+
+
+def seed(database_file, plans=20, items_per_plan=200):
+    conn = sqlite3.connect(database_file)
+    migrate(conn)
+    with conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('bench', 'x')")
+        for p in range(plans):
+            conn.execute(
+                "INSERT INTO plans (uid, plan_name, daily_content) VALUES (1, ?, ?)",
+                (f"Plan {p}", "[" + ",".join('{"day": %d, "status": "pending"}' % d for d in range(30)) + "]"),
+            )
+        conn.executemany(
+            "INSERT INTO knowledge_items (uid, pid, item_type, term, definition) VALUES (1, ?, 'concept', ?, ?)",
+            [(p + 1, f"term {p}-{i}", "definition " * 20) for p in range(plans) for i in range(items_per_plan)],
+        )
+    conn.close()
+
+
+@contextlib.contextmanager
+def per_query_connection(database_file):
+    conn = sqlite3.connect(database_file)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def run_session(get_connection, stop_at, write_ratio, counters, rng):
+    reads = writes = busy = 0
+    while time.monotonic() < stop_at:
+        pid = rng.randint(1, 20)
+        try:
+            with get_connection() as conn:
+                conn.execute("SELECT pid, plan_name FROM plans WHERE pid = ? AND uid = 1", (pid,)).fetchone()
+            with get_connection() as conn:
+                conn.execute("SELECT * FROM knowledge_items WHERE uid = 1 AND pid = ?", (pid,)).fetchall()
+            reads += 2
+            if rng.random() < write_ratio:
+                with get_connection() as conn:
+                    conn.execute(
+                        "INSERT INTO knowledge_items (uid, pid, item_type, term, definition) VALUES (1, ?, 'concept', ?, ?)",
+                        (pid, f"new {rng.random()}", "saved from a lesson"),
+                    )
+                writes += 1
+        except sqlite3.OperationalError:
+            # "database is locked" after the busy timeout
+            busy += 1
+    with counters["lock"]:
+        counters["reads"] += reads
+        counters["writes"] += writes
+        counters["busy"] += busy
+
+
+def benchmark(name, get_connection, sessions, seconds, write_ratio):
+    """`get_connection(n)` returns a context manager yielding a connection for session n."""
+    counters = {"lock": threading.Lock(), "reads": 0, "writes": 0, "busy": 0}
+    stop_at = time.monotonic() + seconds
+
+    def session(n):
+        run_session(lambda: get_connection(n), stop_at, write_ratio, counters, random.Random(n))
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ops = counters["reads"] + counters["writes"]
+    print(
+        f"{name:<22}{ops / seconds:>12.0f}{counters['reads'] / seconds:>12.0f}"
+        f"{counters['writes'] / seconds:>12.0f}{counters['busy']:>10}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--shards", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        baseline_file = os.path.join(directory, "baseline.db")
+        pooled_file = os.path.join(directory, "pooled.db")
+        shard_files = [os.path.join(directory, f"shard{n}.db") for n in range(args.shards)]
+        for database_file in [baseline_file, pooled_file] + shard_files:
+            seed(database_file)
+
+        print(f"{args.sessions} sessions, {args.seconds:.0f}s each, write ratio {args.write_ratio}")
+        print(f"{'mode':<22}{'ops/s':>12}{'reads/s':>12}{'writes/s':>12}{'busy':>10}")
+        benchmark(
+            "per-query connect", lambda n: per_query_connection(baseline_file),
+            args.sessions, args.seconds, args.write_ratio,
+        )
+        manager = ConnectionManager()
+        benchmark(
+            "pooled WAL", lambda n: manager.connection(pooled_file),
+            args.sessions, args.seconds, args.write_ratio,
+        )
+        # Each session is a different user, placed like ShardRouter's hash mode
+        benchmark(
+            f"WAL, {args.shards} shards", lambda n: manager.connection(shard_files[n % args.shards]),
+            args.sessions, args.seconds, args.write_ratio,
+        )
+        manager.close_all()
+
+
+if __name__ == '__main__':
+    main()
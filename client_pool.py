@@ -0,0 +1,128 @@
+# File Name: client_pool.py
+import threading
+import time
+
+from rate_limiter import key_fingerprint
+
+
+class GeminiModelClient:
+    """
+    A Gemini model bound to its own API client, and so to its own API key.
+
+    Unlike genai.configure(), this does not touch the SDK's process-global client, so
+    models for different keys can be used from different threads at the same time.
+    Requests are built and responses wrapped with the SDK's public helpers, the same
+    way GenerativeModel does, so `generate_content` returns the usual response type.
+    """
+
+    def __init__(self, api_key, model_name):
+        from google.ai import generativelanguage as glm
+        from google.api_core import client_options as client_options_lib
+
+        self.model_name = model_name if "/" in model_name else f"models/{model_name}"
+        self.client = glm.GenerativeServiceClient(
+            client_options=client_options_lib.ClientOptions(api_key=api_key)
+        )
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        from google.generativeai import protos
+        from google.generativeai.types import content_types, generation_types
+
+        request = protos.GenerateContentRequest(
+            model=self.model_name,
+            contents=content_types.to_contents(prompt),
+            generation_config=generation_types.to_generation_config_dict(generation_config or {}),
+        )
+        if stream:
+            return generation_types.GenerateContentResponse.from_iterator(self.client.stream_generate_content(request))
+        return generation_types.GenerateContentResponse.from_response(self.client.generate_content(request))
+
+    def close(self):
+        """Close the client's transport."""
+        try:
+            self.client.transport.close()
+        except Exception:
+            pass
+
+
+def build_generative_model(api_key, model_name):
+    """Build a GeminiModelClient for `api_key`."""
+    return GeminiModelClient(api_key, model_name)
+
+
+def close_generative_model(model):
+    """Close a model built by build_generative_model."""
+    model.close()
+
+
+class GenerativeModelPool:
+    """
+    Thread-safe pool of pre-built GenerativeModel clients keyed by (API key, model).
+
+    Page loads reuse warm clients instead of rebuilding them, and clients that have
+    not been used for `idle_timeout` seconds are closed and dropped.
+    """
+
+    def __init__(self, idle_timeout, factory=build_generative_model, closer=close_generative_model):
+        self.idle_timeout = idle_timeout
+        self._factory = factory
+        self._closer = closer
+        self._lock = threading.Lock()
+        self._models = {}  # (fingerprint, model_name) -> [model, last_used_at]
+        self._last_sweep = time.monotonic()
+
+    def get(self, api_key, model_name):
+        """Return the pooled model for this key, building it on first use."""
+        pool_key = (key_fingerprint(api_key), model_name)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._models.get(pool_key)
+            if entry is not None:
+                entry[1] = now
+                model = entry[0]
+            else:
+                model = None
+        self._sweep(now)
+        if model is not None:
+            return model
+
+        # Build outside the lock so a slow client construction never blocks other keys
+        model = self._factory(api_key, model_name)
+        with self._lock:
+            entry = self._models.get(pool_key)
+            if entry is None:
+                self._models[pool_key] = [model, now]
+                return model
+            entry[1] = now
+            duplicate, model = model, entry[0]
+        self._closer(duplicate)
+        return model
+
+    def _sweep(self, now):
+        if not self.idle_timeout or now - self._last_sweep < self.idle_timeout / 4:
+            return
+        with self._lock:
+            self._last_sweep = now
+            idle = [key for key, (_, last_used) in self._models.items() if now - last_used > self.idle_timeout]
+            evicted = [self._models.pop(key)[0] for key in idle]
+        for model in evicted:
+            self._closer(model)
+
+    def discard(self, api_key, model_name):
+        """Drop a client, e.g. after its key was rejected by the API."""
+        with self._lock:
+            entry = self._models.pop((key_fingerprint(api_key), model_name), None)
+        if entry is not None:
+            self._closer(entry[0])
+
+    def size(self):
+        with self._lock:
+            return len(self._models)
+
+    def close(self):
+        """Close every pooled client."""
+        with self._lock:
+            models = [entry[0] for entry in self._models.values()]
+            self._models.clear()
+        for model in models:
+            self._closer(model)
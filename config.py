@@ -7,6 +7,44 @@ class Config:
 
     GEMINI_MODEL = "gemini-2.5-flash"
 
+    # Which model provider AIManager talks to: "gemini", or "mock" for offline load tests.
+    LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+    LLM_MOCK_LATENCY_MS = float(os.environ.get("LLM_MOCK_LATENCY_MS", "800"))
+    LLM_MOCK_LATENCY_SIGMA = float(os.environ.get("LLM_MOCK_LATENCY_SIGMA", "0.5"))
+    LLM_MOCK_ERROR_RATE = float(os.environ.get("LLM_MOCK_ERROR_RATE", "0"))
+
+    # Per-API-key budgets for the rate limiter (override with environment variables).
+    GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", "10"))
+    GEMINI_TOKENS_PER_MINUTE = int(os.environ.get("GEMINI_TOKENS_PER_MINUTE", "250000"))
+    # Longest a single request will wait for its rate-limit slot before giving up.
+    GEMINI_MAX_RATE_LIMIT_WAIT = float(os.environ.get("GEMINI_MAX_RATE_LIMIT_WAIT", "30"))
+
+    # Thread pool shared by all sessions, and how many calls one API key may run at once.
+    GEMINI_MAX_WORKERS = int(os.environ.get("GEMINI_MAX_WORKERS", "16"))
+    GEMINI_MAX_CONCURRENCY_PER_KEY = int(os.environ.get("GEMINI_MAX_CONCURRENCY_PER_KEY", "4"))
+
+    # Retries for transient Gemini errors and the per-key circuit breaker.
+    GEMINI_RETRY_MAX_ATTEMPTS = int(os.environ.get("GEMINI_RETRY_MAX_ATTEMPTS", "4"))
+    GEMINI_RETRY_BASE_DELAY = float(os.environ.get("GEMINI_RETRY_BASE_DELAY", "1"))
+    GEMINI_RETRY_MAX_DELAY = float(os.environ.get("GEMINI_RETRY_MAX_DELAY", "20"))
+    GEMINI_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("GEMINI_BREAKER_FAILURE_THRESHOLD", "5"))
+    GEMINI_BREAKER_RESET_SECONDS = float(os.environ.get("GEMINI_BREAKER_RESET_SECONDS", "30"))
+
+    # Pooled per-key model clients are closed after this many idle seconds.
+    GEMINI_CLIENT_IDLE_TIMEOUT = float(os.environ.get("GEMINI_CLIENT_IDLE_TIMEOUT", "1800"))
+
+    # Per-call LLM telemetry (JSONL, rotated when it grows past the size limit).
+    LLM_TELEMETRY_ENABLED = os.environ.get("LLM_TELEMETRY_ENABLED", "1") != "0"
+    LLM_TELEMETRY_FILE = os.environ.get("LLM_TELEMETRY_FILE", "requests.jsonl")
+    LLM_TELEMETRY_MAX_BYTES = int(os.environ.get("LLM_TELEMETRY_MAX_BYTES", str(10 * 1024 * 1024)))
+    LLM_TELEMETRY_BACKUPS = int(os.environ.get("LLM_TELEMETRY_BACKUPS", "5"))
+
+    # Persistent LLM response cache, kept in its own file next to learning_os.db.
+    LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") != "0"
+    LLM_CACHE_FILE = os.environ.get("LLM_CACHE_FILE", "llm_cache.db")
+    LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
     def initialize(self):
         """
         Locate and return the GEMINI API key.
@@ -37,6 +75,10 @@ class Config:
         if api_key:
             return True, api_key
 
+        # 4) The offline mock backend needs no real key
+        if self.LLM_BACKEND == "mock":
+            return True, "mock-api-key"
+
         # If no API key found, redirect to login page
         return False, (
             "GEMINI_API_KEY not found. Please validate your API key first."
@@ -48,17 +90,87 @@ config = Config()
 
 
 ########### AI Manager (moved from ai_utils.py) ###########
-import google.generativeai as genai
+import asyncio
+import contextlib
+import json
+import queue
+import threading
 import time
+from concurrent.futures import Future
+from llm_backends import create_backend
+from llm_cache import LLMResponseCache, make_cache_key
+from llm_executor import LLMExecutor
+from llm_telemetry import LLMTelemetry, calling_page, extract_usage
+from rate_limiter import RateLimiter, estimate_tokens, key_fingerprint
+from retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy, is_transient_error
+from single_flight import SingleFlight
+from structured_output import JSON_GENERATION_CONFIG, StructuredOutputError, StructuredStream, parse_structured
+
+
+# Stack frames in these files belong to the LLM layer, not to the page that made the call
+LLM_LAYER_FILES = ("config.py", "contextlib.py", "structured_output.py")
+
+
+# Sentinel that ends a stream's chunk queue
+STREAM_END = object()
+
+
+class AIRequestError(Exception):
+    """Raised by the background LLM call path; the message is safe to show to users."""
+
 
 class AIManager:
     """Manages AI model initialization and common operations"""
 
     def __init__(self):
-        self.model = None
         self.is_initialized = False
-        self.last_request_time = 0
-        self.min_request_interval = 2  # seconds between requests
+        # Gemini (with warm per-key clients) or the offline mock, per config.LLM_BACKEND
+        self.backend = create_backend(config)
+        # Shared by every session in the process, but buckets are keyed by API key and model
+        self.rate_limiter = RateLimiter(
+            config.GEMINI_REQUESTS_PER_MINUTE,
+            config.GEMINI_TOKENS_PER_MINUTE,
+        )
+        self.executor = LLMExecutor(
+            config.GEMINI_MAX_WORKERS,
+            config.GEMINI_MAX_CONCURRENCY_PER_KEY,
+        )
+        self.retry_policy = RetryPolicy(
+            config.GEMINI_RETRY_MAX_ATTEMPTS,
+            config.GEMINI_RETRY_BASE_DELAY,
+            config.GEMINI_RETRY_MAX_DELAY,
+            CircuitBreaker(config.GEMINI_BREAKER_FAILURE_THRESHOLD, config.GEMINI_BREAKER_RESET_SECONDS),
+        )
+        # How structured (JSON) responses fared: ok / repaired / salvaged / regenerated / failed
+        self.structured_stats = {"ok": 0, "repaired": 0, "salvaged": 0, "regenerated": 0, "text_fallback": 0, "failed": 0}
+        self._structured_stats_lock = threading.Lock()
+        # Identical prompts that are already being generated are joined, not re-sent
+        self.single_flight = SingleFlight()
+        self.cache = None
+        if config.LLM_CACHE_ENABLED:
+            self.cache = LLMResponseCache(
+                config.LLM_CACHE_FILE,
+                config.LLM_CACHE_TTL_SECONDS,
+                config.LLM_CACHE_MAX_BYTES,
+            )
+        self.telemetry = None
+        if config.LLM_TELEMETRY_ENABLED:
+            self.telemetry = LLMTelemetry(
+                config.LLM_TELEMETRY_FILE,
+                config.LLM_TELEMETRY_MAX_BYTES,
+                config.LLM_TELEMETRY_BACKUPS,
+            )
+
+    @property
+    def model_label(self):
+        """
+        The model that answers calls, as stored with generated content so it can be
+        told apart from content made by another model or backend: the model name
+        for Gemini, prefixed with the backend name otherwise (e.g. "mock:...").
+        """
+        if self.backend.name == "gemini":
+            return config.GEMINI_MODEL
+        return f"{self.backend.name}:{config.GEMINI_MODEL}"
 
     def initialize(self):
         try:
@@ -67,59 +179,409 @@ class AIManager:
                 st.error(f"❌ AI Configuration Error: {api_key}")
                 return False
 
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel(config.GEMINI_MODEL)
+            # Build (or reuse) this key's client so the first request doesn't pay for it
+            self.backend.warm(api_key, config.GEMINI_MODEL)
             self.is_initialized = True
             return True
         except Exception as e:
             st.error(f"❌ Failed to initialize AI model: {str(e)}")
             return False
 
-    def rate_limit_check(self):
-        current_time = time.time()
-        elapsed = current_time - self.last_request_time
-        if elapsed < self.min_request_interval:
-            time.sleep(self.min_request_interval - elapsed)
-        self.last_request_time = time.time()
+    def rate_limit_check(self, api_key, estimated_tokens):
+        """
+        Reserve a slot in this API key's budget and wait only for this caller's turn.
 
-    def generate_content(self, prompt, show_spinner=False, spinner_text=None):
+        Returns the seconds waited. Raises AIRequestError (after releasing the
+        reservation) when the wait would exceed GEMINI_MAX_RATE_LIMIT_WAIT.
+        """
+        wait = self.rate_limiter.acquire(api_key, config.GEMINI_MODEL, estimated_tokens)
+        if wait > config.GEMINI_MAX_RATE_LIMIT_WAIT:
+            self.rate_limiter.refund(api_key, config.GEMINI_MODEL, estimated_tokens)
+            raise AIRequestError(f"⏳ Too many AI requests right now. Please try again in {int(wait) + 1} seconds.")
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _generate(self, api_key, prompt, cache_key=None, stats=None, prompt_type=None, generation_config=None):
+        """
+        Run one model call, retrying transient failures, and return the response text.
+
+        This runs on executor threads, so it must not touch Streamlit; failures are
+        raised and turned into UI messages by the calling page's script thread.
+        `stats` collects retry, wait, latency and token figures for telemetry.
+        """
+        if stats is None:
+            stats = {}
+        stats.update(retries=0, rate_limit_wait_ms=0.0, upstream_latency_ms=0.0)
+
+        def on_retry(attempt, delay, error):
+            stats["retries"] = attempt
+
+        return self.retry_policy.call(
+            api_key,
+            lambda: self._generate_once(api_key, prompt, cache_key, stats, prompt_type, generation_config),
+            on_retry=on_retry,
+        )
+
+    def _generate_once(self, api_key, prompt, cache_key, stats, prompt_type, generation_config):
+        estimated_tokens = estimate_tokens(prompt)
+        stats["rate_limit_wait_ms"] += round(self.rate_limit_check(api_key, estimated_tokens) * 1000, 1)
+        started_at = time.monotonic()
+        try:
+            response = self.backend.generate(
+                api_key, config.GEMINI_MODEL, prompt,
+                prompt_type=prompt_type, generation_config=generation_config,
+            )
+        finally:
+            stats["upstream_latency_ms"] += round((time.monotonic() - started_at) * 1000, 1)
+
+        usage = extract_usage(response)
+        stats.update(usage)
+        self.rate_limiter.record_usage(api_key, config.GEMINI_MODEL, estimated_tokens, usage["total_tokens"])
+
+        if response and getattr(response, 'text', None):
+            text = response.text.strip()
+            if cache_key is not None:
+                self.cache.put(cache_key, config.GEMINI_MODEL, text)
+            return text
+        raise AIRequestError("❌ AI returned empty response. Please try again.")
+
+    def _stream_once(self, api_key, prompt, cache_key, stats, prompt_type, generation_config, chunks):
+        """
+        Executor side of `stream_content`: put each text chunk on `chunks` as it arrives,
+        then STREAM_END, and return the full text.
+
+        The call goes through the rate limiter and the circuit breaker but is not
+        retried, because the page has already rendered whatever arrived; the caller
+        falls back to a regular call instead.
+        """
+        stats.update(retries=0, rate_limit_wait_ms=0.0, upstream_latency_ms=0.0, first_chunk_ms=None)
+        try:
+            estimated_tokens = estimate_tokens(prompt)
+            stats["rate_limit_wait_ms"] = round(self.rate_limit_check(api_key, estimated_tokens) * 1000, 1)
+            # After the rate-limit wait, which can raise: a half-open trial taken here
+            # is always settled by the try below
+            self.retry_policy.breaker.before_call(api_key)
+            started_at = time.monotonic()
+            usage = {}
+            parts = []
+            try:
+                for chunk in self.backend.stream(
+                    api_key, config.GEMINI_MODEL, prompt,
+                    prompt_type=prompt_type, generation_config=generation_config, usage=usage,
+                ):
+                    if stats["first_chunk_ms"] is None:
+                        stats["first_chunk_ms"] = round((time.monotonic() - started_at) * 1000, 1)
+                    parts.append(chunk)
+                    chunks.put(chunk)
+            except Exception as e:
+                if is_transient_error(e):
+                    self.retry_policy.breaker.record_failure(api_key)
+                else:
+                    self.retry_policy.breaker.release(api_key)
+                raise
+            finally:
+                stats["upstream_latency_ms"] = round((time.monotonic() - started_at) * 1000, 1)
+            self.retry_policy.breaker.record_success(api_key)
+
+            stats.update(usage)
+            self.rate_limiter.record_usage(api_key, config.GEMINI_MODEL, estimated_tokens, usage.get("total_tokens", 0))
+            text = "".join(parts).strip()
+            if not text:
+                raise AIRequestError("❌ AI returned empty response. Please try again.")
+            if cache_key is not None:
+                self.cache.put(cache_key, config.GEMINI_MODEL, text)
+            return text
+        finally:
+            chunks.put(STREAM_END)
+
+    def _resolve_api_key(self):
+        """Return the current session's API key, or None after showing an error."""
         if not self.is_initialized:
             if not self.initialize():
                 return None
+        success, api_key = config.initialize()
+        if not success:
+            st.error(f"❌ AI Configuration Error: {api_key}")
+            return None
+        return api_key
+
+    def _handle_error(self, e):
+        """Show a failed call to the user. Must run on the page's script thread."""
+        if isinstance(e, (AIRequestError, CircuitOpenError)):
+            st.error(str(e))
+            return
+        error_msg = str(e)
+        if "API_KEY_INVALID" in error_msg or "invalid" in error_msg.lower():
+            st.error("❌ Invalid API key. Please update your API key.")
+            # Clear the session and redirect to login
+            st.session_state['api_key_validated'] = False
+            if 'gemini_api_key' in st.session_state:
+                del st.session_state['gemini_api_key']
+            st.switch_page("login.py")
+        else:
+            st.error(f"❌ AI Error: {error_msg}")
+
+    def _request_key(self, prompt, generation_config):
+        # The backend is part of the key so mock responses never answer real requests
+        return make_cache_key(
+            config.GEMINI_MODEL, prompt,
+            {"backend": self.backend.name, "generation_config": generation_config},
+        )
+
+    def _forget_cached(self, prompt, generation_config):
+        """Drop a cached response that turned out to be unusable, so it is not replayed."""
+        if self.cache is not None:
+            self.cache.delete(self._request_key(prompt, generation_config))
+
+    def _count_structured(self, outcome):
+        # The manager is shared by every session and its executor threads
+        with self._structured_stats_lock:
+            self.structured_stats[outcome] += 1
+
+    def submit(self, prompt, api_key=None, use_cache=True, prompt_type=None, page=None, generation_config=None):
+        """
+        Schedule a generation in the background and return a concurrent.futures.Future.
+
+        The future resolves to the response text or raises the underlying error. Call
+        this from the page's script thread (the API key is read from the session) and
+        collect results with `future.result()` or `generate_many`. Cached responses are
+        returned as an already-completed future; pass use_cache=False to force a fresh
+        generation (the new response still refreshes the cache). An identical prompt
+        that is already running for the same API key is joined rather than sent again.
+
+        `prompt_type` labels the call in telemetry; `page` defaults to the calling page.
+        """
+        if api_key is None:
+            api_key = self._resolve_api_key()
+            if api_key is None:
+                raise AIRequestError("❌ AI is not configured.")
+
+        record = None
+        if self.telemetry is not None:
+            page = page or calling_page(LLM_LAYER_FILES)
+            record = self.telemetry.start(api_key, config.GEMINI_MODEL, page, prompt_type, prompt)
+
+        request_key = self._request_key(prompt, generation_config)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = request_key
+            cached = self.cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                future = Future()
+                future.queue_wait = 0.0
+                future.set_result(cached)
+                if record is not None:
+                    self.telemetry.finish(record, future, cache_hit=True, coalesced=False)
+                return future
+
+        def start():
+            stats = {}
+            future = self.executor.submit(
+                api_key, self._generate, api_key, prompt, cache_key, stats, prompt_type, generation_config
+            )
+            future.call_stats = stats
+            return future
+
+        # Only callers with the same key are coalesced: a call's errors (invalid key,
+        # rate limit, open circuit) belong to its key and must not reach other sessions
+        future, shared = self.single_flight.do((key_fingerprint(api_key), request_key), start)
+        if record is not None:
+            future.add_done_callback(
+                lambda done: self.telemetry.finish(record, done, cache_hit=False, coalesced=shared)
+            )
+        return future
+
+    def generate_content_async(self, prompt, api_key=None, use_cache=True, prompt_type=None, page=None,
+                               generation_config=None):
+        """
+        asyncio variant of `submit`: await the returned coroutine to get the response text.
+
+        The calling page is taken here, on the caller's thread, because the coroutine
+        itself runs inside the event loop.
+        """
+        page = page or calling_page(LLM_LAYER_FILES)
+
+        async def run():
+            future = self.submit(
+                prompt, api_key=api_key, use_cache=use_cache, prompt_type=prompt_type, page=page,
+                generation_config=generation_config,
+            )
+            return await asyncio.wrap_future(future)
+
+        return run()
+
+    def generate_many(self, prompts, show_spinner=False, spinner_text=None, use_cache=True, prompt_type=None,
+                      generation_config=None):
+        """
+        Run independent prompts concurrently and return their texts in the same order.
+        Failed prompts come back as None after their error has been shown.
+        """
+        api_key = self._resolve_api_key()
+        if api_key is None:
+            return [None] * len(prompts)
+
+        page = calling_page(LLM_LAYER_FILES)
+        futures = [
+            self.submit(
+                prompt, api_key=api_key, use_cache=use_cache, prompt_type=prompt_type, page=page,
+                generation_config=generation_config,
+            )
+            for prompt in prompts
+        ]
+        results = []
+        text = spinner_text if spinner_text is not None else "🤖 AI is thinking..."
+        with st.spinner(text) if show_spinner else contextlib.nullcontext():
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    self._handle_error(e)
+                    results.append(None)
+        return results
+
+    def generate_content(self, prompt, show_spinner=False, spinner_text=None, use_cache=True, prompt_type=None,
+                         generation_config=None):
+        api_key = self._resolve_api_key()
+        if api_key is None:
+            return None
 
         try:
-            self.rate_limit_check()
+            future = self.submit(
+                prompt, api_key=api_key, use_cache=use_cache,
+                prompt_type=prompt_type, generation_config=generation_config,
+            )
             if show_spinner:
                 # Allow callers to provide a custom spinner_text; fall back to the old message
                 text = spinner_text if spinner_text is not None else "🤖 AI is thinking..."
                 with st.spinner(text):
-                    response = self.model.generate_content(prompt)
-            else:
-                # Do not show a spinner here by default. Pages should provide their own
-                # user-facing messages where needed so each page can have a unique message.
-                response = self.model.generate_content(prompt)
-
-            if response and getattr(response, 'text', None):
-                return response.text.strip()
-            else:
-                st.error("❌ AI returned empty response. Please try again.")
-                return None
+                    return future.result()
+            # Do not show a spinner here by default. Pages should provide their own
+            # user-facing messages where needed so each page can have a unique message.
+            return future.result()
 
         except Exception as e:
-            error_msg = str(e)
-            if "API_KEY_INVALID" in error_msg or "invalid" in error_msg.lower():
-                st.error("❌ Invalid API key. Please update your API key.")
-                # Clear the session and redirect to login
-                st.session_state['api_key_validated'] = False
-                if 'gemini_api_key' in st.session_state:
-                    del st.session_state['gemini_api_key']
-                st.switch_page("login.py")
-            else:
-                st.error(f"❌ AI Error: {error_msg}")
+            self._handle_error(e)
             return None
 
+    def stream_content(self, prompt, use_cache=True, prompt_type=None, generation_config=None):
+        """
+        Generate a response and yield its text chunk by chunk as the model produces it.
+
+        Runs on the executor like `submit`, and a completed stream is written to the
+        response cache, so a cached prompt is yielded as one chunk. Streams are never
+        coalesced with other requests. Errors are raised to the caller once the
+        chunks received so far have been yielded.
+        """
+        api_key = self._resolve_api_key()
+        if api_key is None:
+            raise AIRequestError("❌ AI is not configured.")
+
+        record = None
+        if self.telemetry is not None:
+            record = self.telemetry.start(api_key, config.GEMINI_MODEL, calling_page(LLM_LAYER_FILES), prompt_type, prompt)
+
+        # Same key as `submit`, so streamed and regular calls share cached responses
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._request_key(prompt, generation_config)
+            cached = self.cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                if record is not None:
+                    self.telemetry.finish(record, response=cached, cache_hit=True, coalesced=False, streamed=True)
+                yield cached
+                return
+
+        chunks = queue.Queue()
+        stats = {}
+        future = self.executor.submit(
+            api_key, self._stream_once, api_key, prompt, cache_key, stats, prompt_type, generation_config, chunks
+        )
+        future.call_stats = stats
+        if record is not None:
+            future.add_done_callback(
+                lambda done: self.telemetry.finish(record, done, cache_hit=False, coalesced=False, streamed=True)
+            )
+        while True:
+            chunk = chunks.get()
+            if chunk is STREAM_END:
+                break
+            yield chunk
+        future.result()
+
+    def stream_json(self, prompt, schema, array_key=None, use_cache=True, prompt_type=None):
+        """
+        Stream a JSON-mode response, yielding each validated element of the array at
+        `array_key` (or of the top-level array) as soon as it is complete.
+
+        Returns a StructuredStream: iterate over it for the elements, then read its
+        `document` for the whole validated response. The document is None after an
+        error, which is kept in `error` but not shown: the caller is expected to fall
+        back to `generate_json`, which reports it if it happens again. A response
+        that is not valid JSON as a whole is dropped from the cache.
+        """
+        def chunks():
+            try:
+                yield from self.stream_content(
+                    prompt, use_cache=use_cache, prompt_type=prompt_type, generation_config=JSON_GENERATION_CONFIG,
+                )
+            except Exception as e:
+                stream.error = e
+                return
+            try:
+                parse_structured(stream.text, schema)
+            except StructuredOutputError:
+                self._forget_cached(prompt, JSON_GENERATION_CONFIG)
+
+        stream = StructuredStream(chunks(), schema, array_key)
+        return stream
+
+    def generate_json(self, prompt, schema, show_spinner=False, spinner_text=None, use_cache=True, prompt_type=None,
+                      text_fallback=None):
+        """
+        Generate a JSON response in JSON mode and validate it against `schema`
+        (see structured_output.py).
+
+        Malformed output is repaired or salvaged locally; only if nothing usable is
+        left is the prompt regenerated once, bypassing the cache. A repaired response
+        is cached as its validated JSON and an unusable one is dropped from the cache,
+        so neither is replayed. Returns the parsed value, or None after showing an error.
+
+        Conversational callers can pass `text_fallback(text)`, which turns a response
+        that is not usable JSON (e.g. a plain-text answer) into the value to return
+        instead of regenerating.
+        """
+        for attempt in range(2):
+            text = self.generate_content(
+                prompt, show_spinner=show_spinner, spinner_text=spinner_text,
+                use_cache=use_cache and attempt == 0, prompt_type=prompt_type,
+                generation_config=JSON_GENERATION_CONFIG,
+            )
+            if text is None:
+                return None
+            try:
+                value, outcome = parse_structured(text, schema)
+            except StructuredOutputError:
+                if text_fallback is not None:
+                    self._count_structured("text_fallback")
+                    return text_fallback(text)
+                self._forget_cached(prompt, JSON_GENERATION_CONFIG)
+                continue
+            if outcome != "ok" and self.cache is not None:
+                self.cache.put(
+                    self._request_key(prompt, JSON_GENERATION_CONFIG), config.GEMINI_MODEL,
+                    json.dumps(value, ensure_ascii=False),
+                )
+            self._count_structured(outcome)
+            if attempt:
+                self._count_structured("regenerated")
+            return value
+
+        self._count_structured("failed")
+        st.error("❌ AI returned data in an unexpected format. Please try again.")
+        return None
+
 
 @st.cache_resource
 def get_ai_manager():
     return AIManager()
-
@@ -0,0 +1,88 @@
+# File Name: db_cache.py
+import functools
+import inspect
+import threading
+from collections import OrderedDict
+
+
+class ReadCache:
+    """
+    Process-wide read-through cache for query results, shared by every session.
+
+    Each cached getter names the scopes its result depends on, e.g. ("plan", pid) and
+    ("user", uid). Every scope has a version counter that write functions bump with
+    `invalidate` after they commit; an entry is stamped with the versions it was read
+    under and is only served while they are unchanged, so stale rows are never
+    returned. The version snapshot is taken before the query runs, so a write that
+    commits while the query is in flight leaves the new entry already stale.
+
+    Only writes made through this process are seen; a database file changed by
+    another process (e.g. a migration script) needs `clear`.
+    """
+
+    def __init__(self, max_entries=2048, before_read=None):
+        self.max_entries = max_entries
+        self._before_read = before_read  # called with the scopes before every lookup
+        self._entries = OrderedDict()  # (function, arguments) -> (versions, value), in LRU order
+        self._versions = {}  # scope -> version
+        self._generation = 0  # bumped by clear, invalidates every entry
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, **scopes):
+        """
+        Decorator for a getter whose result depends on the given scopes, each mapped
+        to the argument holding its id: @read_cache.cached(plan="pid", user="uid").
+        Arguments must be hashable. List results are copied on the way out, so
+        callers may modify them.
+        """
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                keys = [(scope, bound.arguments[name]) for scope, name in scopes.items()]
+                if self._before_read is not None:
+                    self._before_read(keys)
+                cache_key = (func.__qualname__, tuple(bound.arguments.items()))
+                with self._lock:
+                    stamp = (self._generation,) + tuple(self._versions.get(key, 0) for key in keys)
+                    entry = self._entries.get(cache_key)
+                    if entry is not None and entry[0] == stamp:
+                        self._entries.move_to_end(cache_key)
+                        self.hits += 1
+                        return _copy(entry[1])
+                    self.misses += 1
+                value = func(*args, **kwargs)
+                with self._lock:
+                    self._entries[cache_key] = (stamp, value)
+                    self._entries.move_to_end(cache_key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                return _copy(value)
+
+            return wrapper
+        return decorator
+
+    def invalidate(self, keys):
+        """Bump the version of each scope in `keys` (call after the write commits)."""
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _copy(value):
+    # Rows are immutable; only the containing list can be changed by a caller
+    return list(value) if isinstance(value, list) else value
@@ -0,0 +1,157 @@
+# File Name: db_connection.py
+import atexit
+import contextlib
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+# Applied to every new connection. WAL lets readers run while a session writes,
+# synchronous=NORMAL is durable across application crashes in WAL mode,
+# busy_timeout makes a writer wait for the lock instead of failing immediately, and
+# foreign_keys enforces references and the ON DELETE CASCADE of plan data.
+DEFAULT_PRAGMAS = (
+    ("foreign_keys", "ON"),
+    ("journal_mode", "WAL"),
+    ("busy_timeout", 5000),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+)
+
+
+class ConnectionManager:
+    """
+    Bounded pool of persistent SQLite connections per database file, shared by all
+    threads.
+
+    `connection(database_file)` checks a connection out for the length of a `with`
+    block and returns it to the pool afterwards, so connections do not depend on the
+    short-lived threads Streamlit runs each script run on: they are opened (with
+    tuned pragmas and a prepared-statement cache) once and reused by later runs. A
+    thread that already holds a connection to the file gets the same one back, so
+    nested calls share its transaction, which only the outermost block commits or
+    rolls back. At most `max_connections` per file are open;
+    further callers wait up to `timeout` seconds for one to be returned. Everything
+    is closed at interpreter exit.
+    """
+
+    def __init__(self, pragmas=DEFAULT_PRAGMAS, cached_statements=256, max_connections=8, timeout=30.0):
+        self.pragmas = pragmas
+        self.cached_statements = cached_statements
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = {}  # database file -> idle connections, most recently used last
+        self._open = Counter()  # database file -> connections open (idle or checked out)
+        self._local = threading.local()  # .held: database file -> connection checked out by this thread
+        self._closed = False
+        self.opened = 0
+        self.closed = 0
+        self.waits = 0
+        atexit.register(self.close_all)
+
+    @contextlib.contextmanager
+    def connection(self, database_file):
+        """
+        Check out a connection to `database_file` for a `with` block. Like `with conn:`
+        the outermost block's transaction is committed on success and rolled back on
+        an error; a nested block on the same thread only passes the connection on.
+        """
+        held_by_thread = getattr(self._local, "held", None)
+        if held_by_thread is None:
+            held_by_thread = self._local.held = {}
+        held = held_by_thread.get(database_file)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._acquire(database_file)
+        held_by_thread[database_file] = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            del held_by_thread[database_file]
+            self._release(database_file, conn)
+
+    def _acquire(self, database_file):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                idle = self._idle.get(database_file)
+                if idle:
+                    return idle.pop()
+                if self._open[database_file] < self.max_connections:
+                    self._open[database_file] += 1
+                    self.opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        f"No free connection to {database_file} after {self.timeout:.0f}s"
+                    )
+                self.waits += 1
+                self._cond.wait(remaining)
+        try:
+            return self._connect(database_file)
+        except Exception:
+            with self._cond:
+                self._open[database_file] -= 1
+                self._cond.notify()
+            raise
+
+    def _connect(self, database_file):
+        # check_same_thread is off because a pooled connection moves between threads;
+        # the pool hands it to one thread at a time.
+        conn = sqlite3.connect(database_file, cached_statements=self.cached_statements, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # Allows returned data to be accessed like a dictionary using column names
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _release(self, database_file, conn):
+        try:
+            if conn.in_transaction:
+                # Left open by a failed commit or an explicit BEGIN; don't hand it on
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(database_file, conn)
+            return
+        with self._cond:
+            if not self._closed:
+                self._idle.setdefault(database_file, []).append(conn)
+                self._cond.notify()
+                return
+        self._discard(database_file, conn)
+
+    def _discard(self, database_file, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._open[database_file] -= 1
+            self.closed += 1
+            self._cond.notify()
+
+    def close_all(self):
+        """
+        Close every idle connection and those still checked out once they are
+        returned (called at interpreter exit).
+        """
+        with self._cond:
+            self._closed = True
+            idle = [(database_file, conn) for database_file, conns in self._idle.items() for conn in conns]
+            self._idle.clear()
+        for database_file, conn in idle:
+            self._discard(database_file, conn)
+
+    def stats(self):
+        with self._cond:
+            idle = sum(len(conns) for conns in self._idle.values())
+            open_ = sum(self._open.values())
+            return {
+                "open": open_, "idle": idle, "in_use": open_ - idle,
+                "opened": self.opened, "closed": self.closed, "waits": self.waits,
+            }
@@ -1,16 +1,144 @@
 # File Name: db_functions.py
+import hashlib
+import json
+import os
 import sqlite3
+import threading
+
+from db_cache import ReadCache
+from db_connection import ConnectionManager
+from db_migrations import migrate, parse_plan_days
+from db_shards import ShardRouter
+from db_transfer import IMPORT_CHUNK_SIZE, export_records, import_records
+from db_write_queue import WriteBehindQueue
+from spaced_repetition import LEARN_AHEAD_MINUTES, next_schedule
 
 DATABASE_FILE = 'learning_os.db'
 
+# Columns that callers may request from the plans table (guards the projected queries)
+PLAN_COLUMNS = (
+    "pid", "uid", "plan_name", "daily_content", "special_instructions", "created_at",
+    "total_days", "completed_days", "last_activity_at",
+)
+# Everything except the daily_content blob, for lists and page headers
+PLAN_SUMMARY_COLUMNS = (
+    "pid", "uid", "plan_name", "special_instructions", "created_at",
+    "total_days", "completed_days", "last_activity_at",
+)
+
+# Columns that callers may request from the knowledge_items table
+KNOWLEDGE_ITEM_COLUMNS = ("item_id", "uid", "pid", "item_type", "term", "definition", "created_at")
+
+# Compatibility layer: days live in plan_days, and daily_content is rebuilt from them
+# as the JSON array pages used to store. Plans whose original JSON could not be split
+# into days keep it in plans.daily_content.
+DAILY_CONTENT_SQL = """
+    CASE WHEN EXISTS (SELECT 1 FROM plan_days WHERE plan_days.pid = plans.pid) THEN (
+        SELECT json_group_array(json_object('day', day, 'topic', topic, 'details', details, 'status', status))
+        FROM (SELECT * FROM plan_days WHERE plan_days.pid = plans.pid ORDER BY position)
+    ) ELSE plans.daily_content END
+"""
+
+
+def plan_select_list(columns):
+    """SQL select list for plan columns, rebuilding daily_content from plan_days."""
+    unknown = [column for column in columns if column not in PLAN_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown plan columns: {unknown}")
+    return ", ".join(
+        f"{DAILY_CONTENT_SQL} AS daily_content" if column == "daily_content" else column
+        for column in columns
+    )
+
 
-def get_db_connection():
+# A bounded pool of persistent, tuned connections per database file (see db_connection.py)
+connection_manager = ConnectionManager()
+_migrated_files = set()
+_migration_lock = threading.Lock()
+
+
+def ensure_schema(database_file):
+    """
+    Apply pending schema migrations to a database file, once per process.
     """
-    Establish and return a database connection.
+    if database_file in _migrated_files:
+        return
+    with _migration_lock:
+        if database_file in _migrated_files:
+            return
+        os.makedirs(os.path.dirname(database_file) or ".", exist_ok=True)
+        conn = sqlite3.connect(database_file)
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+        _migrated_files.add(database_file)
+
+
+def get_db_connection(database_file=None):
     """
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row  # Allows returned data to be accessed like a dictionary using column names
-    return conn
+    Check out a pooled connection to `database_file` (default: the main database)
+    for a `with` block: `with get_db_connection() as conn:`. The block is committed
+    or rolled back like `with conn:`, and the connection goes back to the pool
+    afterwards instead of being closed.
+    """
+    database_file = database_file or DATABASE_FILE
+    ensure_schema(database_file)
+    return connection_manager.connection(database_file)
+
+
+# Where each user's plans and knowledge items live (see db_shards.py). In the default
+# "single" mode that is DATABASE_FILE; users and plan_catalog always stay there.
+router = ShardRouter.from_environment()
+_plan_owners = {}  # pid -> uid from plan_catalog; a plan never changes owner
+
+
+def user_database(uid):
+    """Return the database file that holds a user's plans and knowledge items."""
+    return router.shard_file(uid) if router.sharded else DATABASE_FILE
+
+
+def plan_database(pid):
+    """Return the database file that holds a plan, found through its owner."""
+    if not router.sharded:
+        return DATABASE_FILE
+    uid = _plan_owners.get(pid)
+    if uid is None:
+        with get_db_connection() as conn:
+            owner = conn.execute("SELECT uid FROM plan_catalog WHERE pid = ?", (pid,)).fetchone()
+        if owner is None:
+            return DATABASE_FILE  # Unknown plan; queries against the catalog find nothing
+        uid = _plan_owners[pid] = owner[0]
+    return user_database(uid)
+
+
+# Plan and knowledge item reads are served from a process-wide cache shared by all
+# sessions; every write below bumps the versions of the user and plan it touched.
+# Lookups first wait for the caller's queued writes (read-your-writes).
+read_cache = ReadCache(before_read=lambda keys: write_queue.wait_for(keys))
+
+# Page writes (knowledge items, day status, instructions) are committed in batches
+# by a background writer; see the queue_* functions and db_write_queue.py. Each
+# returns a Future of its outcome, so a page can report failures and duplicates.
+write_queue = WriteBehindQueue(get_db_connection, on_commit=read_cache.invalidate)
+
+
+def invalidate_plan(uid, pid):
+    """Mark cached reads of this user and plan as stale (call after committing a write)."""
+    read_cache.invalidate([("user", uid), ("plan", pid)])
+
+
+def wait_for_pending_writes(uid=None, pid=None):
+    """
+    Read-your-writes: wait until queued writes for this user or plan are committed.
+    Returns immediately when none are pending.
+    """
+    keys = []
+    if uid is not None:
+        keys.append(("user", uid))
+    if pid is not None:
+        keys.append(("plan", pid))
+    write_queue.wait_for(keys)
 
 
 # --- User Functions ---
@@ -42,95 +170,578 @@ def get_user_by_username(username):
 
 # --- Plan Functions ---
 
+def replace_plan_days(conn, pid, daily_content_json):
+    """
+    Store a plan's days in plan_days, inside the caller's transaction.
+    Returns the value to keep in plans.daily_content: '[]' once the days are stored,
+    or the original text if it isn't a list of days.
+    """
+    rows = parse_plan_days(daily_content_json)
+    conn.execute("DELETE FROM plan_days WHERE pid = ?", (pid,))
+    if rows is None:
+        return daily_content_json
+    conn.executemany(
+        "INSERT INTO plan_days (pid, position, day, topic, details, status) VALUES (?, ?, ?, ?, ?, ?)",
+        [(pid,) + row for row in rows],
+    )
+    return "[]"
+
+
+def allocate_plan_id(uid):
+    """
+    Reserve a plan id in the catalog for a sharded deployment (ids must be unique
+    across shards). Returns None when not sharded: the plans table assigns it.
+    """
+    if not router.sharded:
+        return None
+    with get_db_connection() as catalog:
+        pid = catalog.execute("INSERT INTO plan_catalog (uid) VALUES (?)", (uid,)).lastrowid
+        catalog.commit()
+    _plan_owners[pid] = uid
+    return pid
+
+
+def ensure_shard_user(conn, uid):
+    """
+    Add a stub row for the user to their shard, inside the caller's transaction, so
+    the shard's foreign keys resolve; the credentials stay in the catalog.
+    """
+    if router.sharded:
+        conn.execute("INSERT OR IGNORE INTO users (uid, username, password_hash) VALUES (?, ?, '')", (uid, f"uid:{uid}"))
+
+
 def add_plan(uid, plan_name, daily_content_json, special_instructions=None):
     """
     Add a learning plan for a specific user.
     """
-    sql = "INSERT INTO plans (uid, plan_name, daily_content, special_instructions) VALUES (?, ?, ?, ?)"
-    with get_db_connection() as conn:
-        conn.execute(sql, (uid, plan_name, daily_content_json, special_instructions))
+    sql = "INSERT INTO plans (pid, uid, plan_name, daily_content, special_instructions) VALUES (?, ?, ?, ?, ?)"
+    pid = allocate_plan_id(uid)
+    with get_db_connection(user_database(uid)) as conn:
+        ensure_shard_user(conn, uid)
+        pid = conn.execute(sql, (pid, uid, plan_name, "[]", special_instructions)).lastrowid
+        stored = replace_plan_days(conn, pid, daily_content_json)
+        if stored != "[]":
+            conn.execute("UPDATE plans SET daily_content = ? WHERE pid = ?", (stored, pid))
         conn.commit()
+    invalidate_plan(uid, pid)
+    return pid
 
 
+@read_cache.cached(user="uid")
 def get_plans_by_user(uid):
     """
     Query all learning plans for a specific user.
     """
-    sql = "SELECT * FROM plans WHERE uid = ? ORDER BY created_at DESC"
-    with get_db_connection() as conn:
+    sql = f"SELECT {plan_select_list(PLAN_COLUMNS)} FROM plans WHERE uid = ? ORDER BY created_at DESC"
+    with get_db_connection(user_database(uid)) as conn:
         plans = conn.execute(sql, (uid,)).fetchall()
         return plans
 
 
+@read_cache.cached(plan="pid")
+def get_plan_by_id(uid, pid, columns=PLAN_COLUMNS):
+    """
+    Query a single learning plan of a user by its primary key.
+    Only the requested columns are read, so pages that don't need the daily_content
+    blob can skip it. Returns None if the plan doesn't exist or belongs to another user.
+    """
+    sql = f"SELECT {plan_select_list(columns)} FROM plans WHERE pid = ? AND uid = ?"
+    with get_db_connection(user_database(uid)) as conn:
+        plan = conn.execute(sql, (pid, uid)).fetchone()
+        return plan
+
+
+@read_cache.cached(user="uid")
+def get_plan_summaries_by_user(uid, limit=-1, offset=0):
+    """
+    Query the learning plans of a user, newest first, without their daily content.
+    Progress comes from the trigger-maintained total_days / completed_days columns.
+    """
+    sql = f"""
+        SELECT {', '.join(PLAN_SUMMARY_COLUMNS)} FROM plans
+        WHERE uid = ? ORDER BY created_at DESC LIMIT ? OFFSET ?
+    """
+    with get_db_connection(user_database(uid)) as conn:
+        plans = conn.execute(sql, (uid, limit, offset)).fetchall()
+        return plans
+
+
+@read_cache.cached(user="uid")
+def count_plans_by_user(uid):
+    """
+    Count the learning plans of a user.
+    """
+    sql = "SELECT COUNT(*) FROM plans WHERE uid = ?"
+    with get_db_connection(user_database(uid)) as conn:
+        return conn.execute(sql, (uid,)).fetchone()[0]
+
+
 def update_plan_content(pid, new_daily_content_json):
     """
-    Update the daily content of a specific plan (usually for progress updates).
+    Replace the daily content of a specific plan (e.g. after adjusting the plan).
+    To mark a single day as completed, use set_plan_day_status instead.
     """
-    sql = "UPDATE plans SET daily_content = ? WHERE pid = ?"
-    with get_db_connection() as conn:
-        conn.execute(sql, (new_daily_content_json, pid))
+    sql = "UPDATE plans SET daily_content = ? WHERE pid = ? RETURNING uid"
+    wait_for_pending_writes(pid=pid)
+    with get_db_connection(plan_database(pid)) as conn:
+        owners = conn.execute(sql, (replace_plan_days(conn, pid, new_daily_content_json), pid)).fetchall()
+        conn.commit()
+    for (uid,) in owners:
+        invalidate_plan(uid, pid)
+
+
+@read_cache.cached(plan="pid")
+def get_plan_days(pid):
+    """
+    Query the days of a plan in order.
+    """
+    sql = "SELECT position, day, topic, details, status, completed_at FROM plan_days WHERE pid = ? ORDER BY position"
+    with get_db_connection(plan_database(pid)) as conn:
+        days = conn.execute(sql, (pid,)).fetchall()
+        return days
+
+
+def _update_plan_day_status(conn, pid, position, status):
+    sql = """
+        UPDATE plan_days
+        SET status = ?, completed_at = CASE WHEN ? = 'completed' THEN CURRENT_TIMESTAMP END
+        WHERE pid = ? AND position = ?
+    """
+    conn.execute(sql, (status, status, pid, position))
+
+
+def set_plan_day_status(pid, position, status):
+    """
+    Set the status ('pending' or 'completed') of one day of a plan.
+    `position` is the 0-based index of the day within the plan.
+    """
+    with get_db_connection(plan_database(pid)) as conn:
+        _update_plan_day_status(conn, pid, position, status)
+        owner = conn.execute("SELECT uid FROM plans WHERE pid = ?", (pid,)).fetchone()
         conn.commit()
+    if owner is not None:
+        invalidate_plan(owner[0], pid)
+
+
+def queue_plan_day_status(uid, pid, position, status):
+    """
+    Like set_plan_day_status, but committed in the background by the write queue.
+    Returns a Future that resolves once the status is committed.
+    """
+    return write_queue.submit(
+        [("user", uid), ("plan", pid)],
+        lambda conn: _update_plan_day_status(conn, pid, position, status),
+        target=user_database(uid),
+    )
+
+
+@read_cache.cached(plan="pid")
+def get_plan_progress(pid):
+    """
+    Return (completed_days, total_days) for a plan.
+    """
+    sql = "SELECT completed_days, total_days FROM plans WHERE pid = ?"
+    with get_db_connection(plan_database(pid)) as conn:
+        progress = conn.execute(sql, (pid,)).fetchone()
+        return (progress[0], progress[1]) if progress else (0, 0)
+
+
+def _update_plan_instructions(conn, uid, pid, new_instructions):
+    sql = "UPDATE plans SET special_instructions = ? WHERE pid = ? AND uid = ?"
+    conn.execute(sql, (new_instructions, pid, uid))
 
 
 def update_plan_instructions(uid, pid, new_instructions):
     """
     Update the special instructions for a specific plan belonging to a user.
     """
-    sql = "UPDATE plans SET special_instructions = ? WHERE pid = ? AND uid = ?"
-    with get_db_connection() as conn:
-        conn.execute(sql, (new_instructions, pid, uid))
+    with get_db_connection(user_database(uid)) as conn:
+        _update_plan_instructions(conn, uid, pid, new_instructions)
         conn.commit()
+    invalidate_plan(uid, pid)
 
 
-def delete_plan(uid, pid):
+def queue_plan_instructions(uid, pid, new_instructions):
+    """
+    Like update_plan_instructions, but committed in the background by the write queue.
+    Returns a Future that resolves once the instructions are committed.
+    """
+    return write_queue.submit(
+        [("user", uid), ("plan", pid)],
+        lambda conn: _update_plan_instructions(conn, uid, pid, new_instructions),
+        target=user_database(uid),
+    )
+
+
+# Knowledge items of a plan deleted per transaction by delete_plan
+DELETE_CHUNK_SIZE = 2000
+
+
+def delete_plan(uid, pid, chunk_size=DELETE_CHUNK_SIZE):
+    """
+    Delete a learning plan of a user with its days, lessons, knowledge items and
+    their review schedules (through ON DELETE CASCADE), in one transaction.
+    Knowledge items, which also carry FTS and schedule rows, are deleted first in
+    statements of at most `chunk_size` items, then the plan row and everything still
+    referencing it.
     """
-    Delete a learning plan and all associated knowledge items for a specific user.
+    delete_items_sql = """
+        DELETE FROM knowledge_items WHERE item_id IN (
+            SELECT item_id FROM knowledge_items WHERE uid = ? AND pid = ? LIMIT ?
+        )
     """
     delete_plan_sql = "DELETE FROM plans WHERE pid = ? AND uid = ?"
-    delete_knowledge_sql = "DELETE FROM knowledge_items WHERE pid = ? AND uid = ?"
-    with get_db_connection() as conn:
+    wait_for_pending_writes(uid=uid, pid=pid)
+    with get_db_connection(user_database(uid)) as conn:
+        # Take the write lock up front; a failure rolls the whole delete back
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT 1 FROM plans WHERE pid = ? AND uid = ?", (pid, uid)).fetchone() is None:
+            return
+        while conn.execute(delete_items_sql, (uid, pid, chunk_size)).rowcount == chunk_size:
+            pass
         conn.execute(delete_plan_sql, (pid, uid))
-        conn.execute(delete_knowledge_sql, (pid, uid))
+    if router.sharded:
+        # The catalog is another file, so this is a second transaction. If it fails the
+        # catalog keeps a row for a plan that no longer exists, which reads treat as an
+        # empty plan, and plan ids are never reused.
+        with get_db_connection() as catalog:
+            catalog.execute("DELETE FROM plan_catalog WHERE pid = ? AND uid = ?", (pid, uid))
+        _plan_owners.pop(pid, None)
+    invalidate_plan(uid, pid)
+
+
+# --- Lesson Functions ---
+
+def lesson_instructions_hash(topic, details, special_instructions):
+    """
+    Hash of everything a day's lesson prompt depends on, so a stored lesson can be
+    recognized as stale after the plan or its special instructions change.
+    """
+    inputs = json.dumps([topic, details, special_instructions or ""], ensure_ascii=False)
+    return hashlib.sha256(inputs.encode("utf-8")).hexdigest()
+
+
+def get_plan_lesson(pid, day):
+    """
+    Query the stored learning material of one day of a plan.
+    """
+    sql = "SELECT learning_material, instructions_hash, model, updated_at FROM plan_lessons WHERE pid = ? AND day = ?"
+    with get_db_connection(plan_database(pid)) as conn:
+        lesson = conn.execute(sql, (pid, day)).fetchone()
+        return lesson
+
+
+def save_plan_lesson(pid, day, learning_material_json, instructions_hash, model):
+    """
+    Store (or replace) the generated learning material of one day of a plan.
+    """
+    sql = """
+        INSERT INTO plan_lessons (pid, day, learning_material, instructions_hash, model) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (pid, day) DO UPDATE SET
+            learning_material = excluded.learning_material,
+            instructions_hash = excluded.instructions_hash,
+            model = excluded.model,
+            updated_at = CURRENT_TIMESTAMP
+    """
+    with get_db_connection(plan_database(pid)) as conn:
+        conn.execute(sql, (pid, day, learning_material_json, instructions_hash, model))
+        conn.commit()
+
+
+def delete_plan_lesson(pid, day):
+    """
+    Delete the stored learning material of one day so it is generated again.
+    """
+    sql = "DELETE FROM plan_lessons WHERE pid = ? AND day = ?"
+    with get_db_connection(plan_database(pid)) as conn:
+        conn.execute(sql, (pid, day))
         conn.commit()
 
 
 # --- Knowledge Item Functions ---
 
+# Skips the insert when the user already saved the same term (case-insensitive,
+# whitespace-trimmed) of the same type under the same plan
+INSERT_KNOWLEDGE_ITEM_SQL = """
+    INSERT INTO knowledge_items (uid, pid, item_type, term, definition)
+    SELECT :uid, :pid, :item_type, :term, :definition
+    WHERE NOT EXISTS (
+        SELECT 1 FROM knowledge_items
+        WHERE uid = :uid AND pid IS :pid AND item_type = :item_type AND lower(trim(term)) = lower(trim(:term))
+    )
+"""
+
+
 def add_knowledge_item(uid, pid, item_type, term, definition):
     """
     Add a knowledge item. pid can be None.
+    Returns False if the same term was already saved for this plan.
     """
-    sql = "INSERT INTO knowledge_items (uid, pid, item_type, term, definition) VALUES (?, ?, ?, ?, ?)"
-    with get_db_connection() as conn:
-        conn.execute(sql, (uid, pid, item_type, term, definition))
+    params = {"uid": uid, "pid": pid, "item_type": item_type, "term": term, "definition": definition}
+    with get_db_connection(user_database(uid)) as conn:
+        inserted = conn.execute(INSERT_KNOWLEDGE_ITEM_SQL, params).rowcount == 1
         conn.commit()
+    invalidate_plan(uid, pid)
+    return inserted
 
 
+def _insert_knowledge_items(conn, uid, pid, items):
+    params = (
+        {"uid": uid, "pid": pid, "item_type": item_type, "term": term, "definition": definition}
+        for item_type, term, definition in items
+    )
+    return conn.executemany(INSERT_KNOWLEDGE_ITEM_SQL, params).rowcount
+
+
+def add_knowledge_items_bulk(uid, pid, items):
+    """
+    Add many knowledge items in a single transaction.
+    `items` is an iterable of (item_type, term, definition); duplicates of already
+    saved items (or of earlier items in the batch) are skipped.
+    Returns the number of items actually inserted.
+    """
+    with get_db_connection(user_database(uid)) as conn:
+        inserted = _insert_knowledge_items(conn, uid, pid, items)
+        conn.commit()
+    invalidate_plan(uid, pid)
+    return inserted
+
+
+def queue_knowledge_items(uid, pid, items):
+    """
+    Like add_knowledge_items_bulk, but committed in the background by the write
+    queue. Returns a Future of the number of items actually inserted (duplicates
+    are skipped), which raises if the items could not be saved.
+    """
+    items = list(items)
+    return write_queue.submit(
+        [("user", uid), ("plan", pid)],
+        lambda conn: _insert_knowledge_items(conn, uid, pid, items),
+        target=user_database(uid),
+    )
+
+
+@read_cache.cached(user="uid")
 def get_knowledge_items_by_user(uid):
     """
     Query all knowledge items for a specific user.
     """
     sql = "SELECT * FROM knowledge_items WHERE uid = ? ORDER BY created_at DESC"
-    with get_db_connection() as conn:
+    with get_db_connection(user_database(uid)) as conn:
         items = conn.execute(sql, (uid,)).fetchall()
         return items
 
 
+@read_cache.cached(plan="pid")
 def get_knowledge_items_by_plan(uid, pid):
     """
     Query knowledge items collected under a specific plan for a user.
     """
     sql = "SELECT * FROM knowledge_items WHERE uid = ? AND pid = ?"
-    with get_db_connection() as conn:
+    with get_db_connection(user_database(uid)) as conn:
         items = conn.execute(sql, (uid, pid)).fetchall()
         return items
 
 
-def delete_knowledge_item(item_id):
+@read_cache.cached(plan="pid")
+def get_knowledge_items_page(uid, pid, after_item_id=None, before_item_id=None, limit=50,
+                             columns=KNOWLEDGE_ITEM_COLUMNS):
     """
-    Delete a knowledge item.
+    Query one page of a plan's knowledge items in item_id order (keyset pagination).
+    Pass the last item_id of the previous page as `after_item_id` to move forward,
+    or the first item_id of the current page as `before_item_id` to move back; pages
+    are always returned in ascending item_id order. Only `columns` are read.
     """
-    sql = "DELETE FROM knowledge_items WHERE item_id = ?"
-    with get_db_connection() as conn:
-        conn.execute(sql, (item_id,))
-        conn.commit()
\ No newline at end of file
+    unknown = [column for column in columns if column not in KNOWLEDGE_ITEM_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown knowledge item columns: {unknown}")
+    select_list = ", ".join(columns)
+    if before_item_id is not None:
+        # Walk the (uid, pid, item_id) index backwards, then restore ascending order
+        sql = f"""
+            SELECT {select_list} FROM (
+                SELECT {select_list}, item_id AS _key FROM knowledge_items
+                WHERE uid = ? AND pid = ? AND item_id < ? ORDER BY item_id DESC LIMIT ?
+            ) ORDER BY _key
+        """
+        params = (uid, pid, before_item_id, limit)
+    else:
+        sql = f"""
+            SELECT {select_list} FROM knowledge_items
+            WHERE uid = ? AND pid = ? AND item_id > ? ORDER BY item_id LIMIT ?
+        """
+        params = (uid, pid, after_item_id if after_item_id is not None else -1, limit)
+    with get_db_connection(user_database(uid)) as conn:
+        items = conn.execute(sql, params).fetchall()
+        return items
+
+
+def iter_knowledge_items_by_plan(uid, pid, columns=KNOWLEDGE_ITEM_COLUMNS, page_size=500):
+    """
+    Yield all of a plan's knowledge items in item_id order, one keyset page at a time.
+    """
+    if "item_id" not in columns:
+        columns = ("item_id",) + tuple(columns)
+    after_item_id = None
+    while True:
+        items = get_knowledge_items_page(uid, pid, after_item_id=after_item_id, limit=page_size, columns=columns)
+        yield from items
+        if len(items) < page_size:
+            return
+        after_item_id = items[-1]['item_id']
+
+
+@read_cache.cached(plan="pid")
+def count_knowledge_items_by_plan(uid, pid, before_item_id=None):
+    """
+    Count a plan's knowledge items, or only those before `before_item_id`
+    (i.e. the 0-based position of that item).
+    """
+    sql = "SELECT COUNT(*) FROM knowledge_items WHERE uid = ? AND pid = ? AND (? IS NULL OR item_id < ?)"
+    with get_db_connection(user_database(uid)) as conn:
+        return conn.execute(sql, (uid, pid, before_item_id, before_item_id)).fetchone()[0]
+
+
+def fts_query(text):
+    """
+    Turn free text from a search box into an FTS5 query: every word must match,
+    the last one as a prefix so results update while typing.
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " AND ".join(terms)
+
+
+@read_cache.cached(user="uid")
+def search_knowledge_items(uid, query, pid=None, limit=20):
+    """
+    Full-text search over the terms and definitions of a user's knowledge items,
+    optionally within one plan. Results are ranked by relevance (BM25), with
+    matches in the term weighted above matches in the definition.
+    """
+    match = fts_query(query)
+    if match is None:
+        return []
+    sql = """
+        SELECT k.item_id, k.uid, k.pid, k.item_type, k.term, k.definition, k.created_at
+        FROM knowledge_items_fts
+        JOIN knowledge_items AS k ON k.item_id = knowledge_items_fts.rowid
+        WHERE knowledge_items_fts MATCH ? AND k.uid = ? AND (? IS NULL OR k.pid = ?)
+        ORDER BY bm25(knowledge_items_fts, 10.0, 1.0)
+        LIMIT ?
+    """
+    with get_db_connection(user_database(uid)) as conn:
+        items = conn.execute(sql, (match, uid, pid, pid, limit)).fetchall()
+        return items
+
+
+def delete_knowledge_item(uid, item_id):
+    """
+    Delete a knowledge item of a user.
+    """
+    sql = "DELETE FROM knowledge_items WHERE item_id = ? AND uid = ? RETURNING pid"
+    with get_db_connection(user_database(uid)) as conn:
+        deleted = conn.execute(sql, (item_id, uid)).fetchall()
+        conn.commit()
+    for (pid,) in deleted:
+        invalidate_plan(uid, pid)
+
+
+# --- Review Schedule Functions ---
+
+# Not cached: whether a card is due depends on the current time
+DUE_CARDS_SQL = f"""
+    SELECT k.item_id, k.item_type, k.term, k.definition, r.ease, r.interval_days, r.reps, r.due_at
+    FROM review_schedule AS r
+    JOIN knowledge_items AS k ON k.item_id = r.item_id
+    WHERE r.uid = ? AND r.pid = ? AND r.due_at <= datetime('now', '+{LEARN_AHEAD_MINUTES} minutes')
+    ORDER BY r.due_at
+    LIMIT ?
+"""
+
+
+def get_due_cards(uid, pid, limit=20):
+    """
+    Query the next `limit` knowledge items of a plan that are due for review,
+    most overdue first. Only the due range of the (uid, pid, due_at) index is read.
+    """
+    wait_for_pending_writes(uid=uid, pid=pid)
+    with get_db_connection(user_database(uid)) as conn:
+        cards = conn.execute(DUE_CARDS_SQL, (uid, pid, limit)).fetchall()
+        return cards
+
+
+def count_due_cards(uid, pid):
+    """
+    Count the knowledge items of a plan that are due for review.
+    """
+    sql = f"""
+        SELECT COUNT(*) FROM review_schedule
+        WHERE uid = ? AND pid = ? AND due_at <= datetime('now', '+{LEARN_AHEAD_MINUTES} minutes')
+    """
+    wait_for_pending_writes(uid=uid, pid=pid)
+    with get_db_connection(user_database(uid)) as conn:
+        return conn.execute(sql, (uid, pid)).fetchone()[0]
+
+
+def grade_card(uid, item_id, grade):
+    """
+    Record a review of a knowledge item ('again', 'hard', 'good' or 'easy') and
+    schedule its next one. Returns the new interval in days, or None if the item
+    doesn't exist.
+    """
+    select_sql = "SELECT ease, interval_days, reps FROM review_schedule WHERE item_id = ? AND uid = ?"
+    update_sql = """
+        UPDATE review_schedule
+        SET ease = ?, interval_days = ?, reps = ?, due_at = datetime('now', ?), last_reviewed_at = CURRENT_TIMESTAMP
+        WHERE item_id = ?
+    """
+    with get_db_connection(user_database(uid)) as conn:
+        schedule = conn.execute(select_sql, (item_id, uid)).fetchone()
+        if schedule is None:
+            return None
+        ease, interval_days, reps, due_in = next_schedule(
+            schedule['ease'], schedule['interval_days'], schedule['reps'], grade
+        )
+        conn.execute(update_sql, (ease, interval_days, reps, f"+{int(due_in)} seconds", item_id))
+        conn.commit()
+        return interval_days
+
+
+# --- Export / Import Functions ---
+
+def export_user_data(uid, pids=None):
+    """
+    Yield a user's plans (all, or those in `pids`) with their days, lessons and
+    knowledge items as JSONL export records, read from the database in chunks
+    (see db_transfer.py; write them with db_transfer.write_jsonl).
+    """
+    wait_for_pending_writes(uid=uid)
+    database_file = user_database(uid)
+    # A pooled connection is checked out per chunk, not for as long as the caller iterates
+    yield from export_records(lambda: get_db_connection(database_file), uid, pids)
+
+
+def import_user_data(uid, records, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Add the plans and knowledge items of export records (e.g. from
+    db_transfer.read_jsonl) to a user as new plans, committing in chunks.
+    Returns (counts by record type, {exported pid: new pid}).
+    """
+    wait_for_pending_writes(uid=uid)
+    with get_db_connection(user_database(uid)) as conn:
+        with conn:
+            ensure_shard_user(conn, uid)
+        try:
+            counts, plans = import_records(
+                conn, uid, records, new_plan_id=lambda: allocate_plan_id(uid), chunk_size=chunk_size
+            )
+        finally:
+            # Earlier chunks may be committed even if a later one failed
+            read_cache.invalidate([("user", uid)])
+    for pid in plans.values():
+        invalidate_plan(uid, pid)
+    return counts, plans
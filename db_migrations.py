@@ -0,0 +1,459 @@
+# File Name: db_migrations.py
+import json
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+# --- Migration steps ---
+# Each step receives an open connection inside a transaction and must be safe to run
+# against a database that already has some of its changes (e.g. one created by an
+# older setup_database), so they use IF NOT EXISTS or check the schema first.
+
+def create_base_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        uid INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS plans (
+        pid INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid INTEGER NOT NULL,
+        plan_name TEXT NOT NULL,
+        daily_content TEXT NOT NULL,
+        special_instructions TEXT, -- Optional instructions for the AI
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (uid) REFERENCES users (uid)
+    );
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS knowledge_items (
+        item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid INTEGER NOT NULL,
+        pid INTEGER, -- Optional, allows NULL
+        item_type TEXT NOT NULL,
+        term TEXT NOT NULL,
+        definition TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (uid) REFERENCES users (uid),
+        FOREIGN KEY (pid) REFERENCES plans (pid)
+    );
+    ''')
+
+
+def add_special_instructions_column(conn):
+    if "special_instructions" not in table_columns(conn, "plans"):
+        conn.execute("ALTER TABLE plans ADD COLUMN special_instructions TEXT;")
+
+
+def add_query_indexes(conn):
+    # get_plans_by_user / get_plan_summaries_by_user: WHERE uid = ? ORDER BY created_at DESC
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_uid_created_at ON plans (uid, created_at DESC);")
+    # get_knowledge_items_by_plan: WHERE uid = ? AND pid = ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_knowledge_items_uid_pid ON knowledge_items (uid, pid);")
+    # get_knowledge_items_by_user: WHERE uid = ? ORDER BY created_at DESC
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_knowledge_items_uid_created_at ON knowledge_items (uid, created_at DESC);")
+
+
+def parse_plan_days(daily_content_json):
+    """
+    Turn a plan's daily_content JSON into plan_days rows
+    (position, day, topic, details, status), or None if it isn't a list of days.
+    """
+    try:
+        days = json.loads(daily_content_json)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(days, list) or not all(isinstance(day, dict) for day in days):
+        return None
+    rows = []
+    for position, day in enumerate(days):
+        number = day.get("day")
+        rows.append((
+            position,
+            number if isinstance(number, int) else position + 1,
+            str(day.get("topic") or ""),
+            str(day.get("details") or ""),
+            "completed" if day.get("status") == "completed" else "pending",
+        ))
+    return rows
+
+
+def create_plan_days(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS plan_days (
+        pid INTEGER NOT NULL,
+        position INTEGER NOT NULL, -- 0-based order of the day within the plan
+        day INTEGER NOT NULL,
+        topic TEXT NOT NULL,
+        details TEXT NOT NULL DEFAULT '',
+        status TEXT NOT NULL DEFAULT 'pending',
+        completed_at TIMESTAMP,
+        PRIMARY KEY (pid, position),
+        FOREIGN KEY (pid) REFERENCES plans (pid)
+    ) WITHOUT ROWID;
+    ''')
+    # Progress is COUNT(*) ... WHERE pid = ? AND status = 'completed'
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_plan_days_pid_status ON plan_days (pid, status);")
+
+    # Move existing plans over; blobs that don't parse are left in plans.daily_content
+    for pid, daily_content in conn.execute("SELECT pid, daily_content FROM plans").fetchall():
+        rows = parse_plan_days(daily_content)
+        if rows is None:
+            continue
+        conn.execute("DELETE FROM plan_days WHERE pid = ?", (pid,))
+        conn.executemany(
+            "INSERT INTO plan_days (pid, position, day, topic, details, status) VALUES (?, ?, ?, ?, ?, ?)",
+            [(pid,) + row for row in rows],
+        )
+        conn.execute("UPDATE plans SET daily_content = '[]' WHERE pid = ?", (pid,))
+
+
+def add_plan_progress_counters(conn):
+    columns = table_columns(conn, "plans")
+    if "total_days" not in columns:
+        conn.execute("ALTER TABLE plans ADD COLUMN total_days INTEGER NOT NULL DEFAULT 0;")
+    if "completed_days" not in columns:
+        conn.execute("ALTER TABLE plans ADD COLUMN completed_days INTEGER NOT NULL DEFAULT 0;")
+    if "last_activity_at" not in columns:
+        conn.execute("ALTER TABLE plans ADD COLUMN last_activity_at TIMESTAMP;")
+
+    conn.execute('''
+    UPDATE plans SET
+        total_days = (SELECT COUNT(*) FROM plan_days WHERE plan_days.pid = plans.pid),
+        completed_days = (SELECT COUNT(*) FROM plan_days WHERE plan_days.pid = plans.pid AND status = 'completed'),
+        last_activity_at = COALESCE(
+            (SELECT MAX(completed_at) FROM plan_days WHERE plan_days.pid = plans.pid), created_at
+        );
+    ''')
+
+    # Keep the counters in step with every write to plan_days, whichever code path makes it
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS plan_days_counters_insert AFTER INSERT ON plan_days
+    BEGIN
+        UPDATE plans SET
+            total_days = total_days + 1,
+            completed_days = completed_days + (NEW.status = 'completed'),
+            last_activity_at = CURRENT_TIMESTAMP
+        WHERE pid = NEW.pid;
+    END;
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS plan_days_counters_delete AFTER DELETE ON plan_days
+    BEGIN
+        UPDATE plans SET
+            total_days = total_days - 1,
+            completed_days = completed_days - (OLD.status = 'completed')
+        WHERE pid = OLD.pid;
+    END;
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS plan_days_counters_status AFTER UPDATE OF status ON plan_days
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE plans SET
+            completed_days = completed_days + (NEW.status = 'completed') - (OLD.status = 'completed'),
+            last_activity_at = CURRENT_TIMESTAMP
+        WHERE pid = NEW.pid;
+    END;
+    ''')
+
+
+def create_plan_lessons(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS plan_lessons (
+        pid INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        learning_material TEXT NOT NULL, -- JSON document as rendered by Learn Today
+        instructions_hash TEXT NOT NULL, -- Hash of the topic, details and special instructions used
+        model TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (pid, day),
+        FOREIGN KEY (pid) REFERENCES plans (pid)
+    ) WITHOUT ROWID;
+    ''')
+
+
+def create_knowledge_items_fts(conn):
+    # External-content index: the text lives once, in knowledge_items
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_items_fts USING fts5(
+        term, definition,
+        content='knowledge_items', content_rowid='item_id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS knowledge_items_fts_insert AFTER INSERT ON knowledge_items
+    BEGIN
+        INSERT INTO knowledge_items_fts (rowid, term, definition) VALUES (NEW.item_id, NEW.term, NEW.definition);
+    END;
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS knowledge_items_fts_delete AFTER DELETE ON knowledge_items
+    BEGIN
+        INSERT INTO knowledge_items_fts (knowledge_items_fts, rowid, term, definition)
+        VALUES ('delete', OLD.item_id, OLD.term, OLD.definition);
+    END;
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS knowledge_items_fts_update AFTER UPDATE OF term, definition ON knowledge_items
+    BEGIN
+        INSERT INTO knowledge_items_fts (knowledge_items_fts, rowid, term, definition)
+        VALUES ('delete', OLD.item_id, OLD.term, OLD.definition);
+        INSERT INTO knowledge_items_fts (rowid, term, definition) VALUES (NEW.item_id, NEW.term, NEW.definition);
+    END;
+    ''')
+    conn.execute("INSERT INTO knowledge_items_fts (knowledge_items_fts) VALUES ('rebuild');")
+
+
+def add_knowledge_item_dedupe_index(conn):
+    # Matches the NOT EXISTS check of add_knowledge_item(s_bulk): same user, plan,
+    # type and term (case-insensitive, surrounding whitespace ignored)
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_knowledge_items_dedupe
+    ON knowledge_items (uid, pid, item_type, lower(trim(term)));
+    ''')
+
+
+def create_plan_catalog(conn):
+    # Used in the main file of a sharded deployment (see db_shards.py): allocates
+    # plan ids that are unique across shards and maps each plan to its owner's shard
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS plan_catalog (
+        pid INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid INTEGER NOT NULL,
+        FOREIGN KEY (uid) REFERENCES users (uid)
+    );
+    ''')
+
+
+def create_review_schedule(conn):
+    # One spaced-repetition schedule row per knowledge item (see spaced_repetition.py);
+    # uid and pid are copied from the item so due cards come from one index range
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS review_schedule (
+        item_id INTEGER PRIMARY KEY,
+        uid INTEGER NOT NULL,
+        pid INTEGER,
+        ease REAL NOT NULL DEFAULT 2.5,
+        interval_days REAL NOT NULL DEFAULT 0,
+        reps INTEGER NOT NULL DEFAULT 0,
+        due_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        last_reviewed_at TIMESTAMP,
+        FOREIGN KEY (item_id) REFERENCES knowledge_items (item_id)
+    );
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_review_schedule_due ON review_schedule (uid, pid, due_at);")
+    # New items are due right away
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS knowledge_items_schedule_insert AFTER INSERT ON knowledge_items
+    BEGIN
+        INSERT OR IGNORE INTO review_schedule (item_id, uid, pid) VALUES (NEW.item_id, NEW.uid, NEW.pid);
+    END;
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS knowledge_items_schedule_delete AFTER DELETE ON knowledge_items
+    BEGIN
+        DELETE FROM review_schedule WHERE item_id = OLD.item_id;
+    END;
+    ''')
+    conn.execute('''
+    INSERT OR IGNORE INTO review_schedule (item_id, uid, pid, due_at)
+    SELECT item_id, uid, pid, COALESCE(created_at, CURRENT_TIMESTAMP) FROM knowledge_items;
+    ''')
+
+
+def add_cascading_foreign_keys(conn):
+    # SQLite can't alter a foreign key, so the child tables are rebuilt with
+    # ON DELETE CASCADE; rows already orphaned by earlier plan deletes are dropped
+    # (and logged, since their plan is gone they were unreachable from the app)
+    dropped = {}
+    dropped["plan_days"] = rebuild_table(conn, "plan_days", '''
+    CREATE TABLE plan_days_new (
+        pid INTEGER NOT NULL,
+        position INTEGER NOT NULL, -- 0-based order of the day within the plan
+        day INTEGER NOT NULL,
+        topic TEXT NOT NULL,
+        details TEXT NOT NULL DEFAULT '',
+        status TEXT NOT NULL DEFAULT 'pending',
+        completed_at TIMESTAMP,
+        PRIMARY KEY (pid, position),
+        FOREIGN KEY (pid) REFERENCES plans (pid) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    ''', where="pid IN (SELECT pid FROM plans)")
+    dropped["plan_lessons"] = rebuild_table(conn, "plan_lessons", '''
+    CREATE TABLE plan_lessons_new (
+        pid INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        learning_material TEXT NOT NULL, -- JSON document as rendered by Learn Today
+        instructions_hash TEXT NOT NULL, -- Hash of the topic, details and special instructions used
+        model TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (pid, day),
+        FOREIGN KEY (pid) REFERENCES plans (pid) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    ''', where="pid IN (SELECT pid FROM plans)")
+    dropped["knowledge_items"] = rebuild_table(conn, "knowledge_items", '''
+    CREATE TABLE knowledge_items_new (
+        item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid INTEGER NOT NULL,
+        pid INTEGER, -- Optional, allows NULL
+        item_type TEXT NOT NULL,
+        term TEXT NOT NULL,
+        definition TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (uid) REFERENCES users (uid),
+        FOREIGN KEY (pid) REFERENCES plans (pid) ON DELETE CASCADE
+    );
+    ''', where="pid IS NULL OR pid IN (SELECT pid FROM plans)")
+    dropped["review_schedule"] = rebuild_table(conn, "review_schedule", '''
+    CREATE TABLE review_schedule_new (
+        item_id INTEGER PRIMARY KEY,
+        uid INTEGER NOT NULL,
+        pid INTEGER,
+        ease REAL NOT NULL DEFAULT 2.5,
+        interval_days REAL NOT NULL DEFAULT 0,
+        reps INTEGER NOT NULL DEFAULT 0,
+        due_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        last_reviewed_at TIMESTAMP,
+        FOREIGN KEY (item_id) REFERENCES knowledge_items (item_id) ON DELETE CASCADE
+    );
+    ''', where="item_id IN (SELECT item_id FROM knowledge_items)")
+    for table, count in dropped.items():
+        if count:
+            logger.warning("Migration 11 dropped %d orphaned %s row(s) whose plan or item no longer exists",
+                           count, table)
+    if dropped["knowledge_items"]:
+        # The dropped items bypassed the FTS delete trigger
+        conn.execute("INSERT INTO knowledge_items_fts (knowledge_items_fts) VALUES ('rebuild');")
+
+
+# Ordered list of (version, description, step). Append new steps with the next
+# version number; never edit or reorder steps that have shipped.
+MIGRATIONS = [
+    (1, "Create users, plans and knowledge_items tables", create_base_tables),
+    (2, "Add plans.special_instructions", add_special_instructions_column),
+    (3, "Add indexes for the plan and knowledge item queries", add_query_indexes),
+    (4, "Move plan days from plans.daily_content into plan_days", create_plan_days),
+    (5, "Add trigger-maintained progress counters to plans", add_plan_progress_counters),
+    (6, "Create the plan_lessons store for generated learning material", create_plan_lessons),
+    (7, "Add FTS5 full-text search over knowledge items", create_knowledge_items_fts),
+    (8, "Index knowledge items by normalized term for duplicate checks", add_knowledge_item_dedupe_index),
+    (9, "Create plan_catalog for plan ids shared across shard files", create_plan_catalog),
+    (10, "Create the spaced-repetition review_schedule", create_review_schedule),
+    (11, "Cascade plan and knowledge item deletes through foreign keys", add_cascading_foreign_keys),
+]
+
+
+# --- Engine ---
+
+def table_columns(conn, table):
+    """Return the column names of a table."""
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def rebuild_table(conn, table, create_sql, where="1"):
+    """
+    Replace `table` with the definition in `create_sql` (which must create
+    `{table}_new` with the same column names), keeping the rows that match `where`
+    and the table's indexes, triggers and AUTOINCREMENT counter.
+    Foreign key enforcement must be off, as it is inside migrate().
+    Returns the number of rows dropped because they did not match `where`.
+    """
+    dependents = [
+        sql for (sql,) in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,),
+        )
+    ]
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    columns = ", ".join(table_columns(conn, table))
+    conn.execute(create_sql)
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    kept = conn.execute(f"INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table} WHERE {where}").rowcount
+    conn.execute(f"DROP TABLE {table}")
+    # Legacy mode renames without re-checking other tables' triggers, which may refer
+    # to `table` while it doesn't exist
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    finally:
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+    for sql in dependents:
+        conn.execute(sql)
+    if sequence is not None:
+        # Don't hand out ids of deleted rows again
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table))
+    return total - kept
+
+
+def current_version(conn):
+    """Return the highest applied migration version (0 for a new database)."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ''')
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn, verbose=False):
+    """
+    Apply every pending migration in order and return the list of versions applied.
+
+    Each step runs in its own IMMEDIATE transaction together with its schema_version
+    row, so a failed step is rolled back and retried on the next run, and two
+    processes starting at once cannot apply the same step twice.
+    """
+    applied = []
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Manage transactions explicitly so DDL is included
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys = OFF")  # Table rebuilds must not cascade
+    try:
+        if current_version(conn) >= MIGRATIONS[-1][0]:
+            return applied
+        for version, description, step in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-check under the write lock in case another process got here first
+                if current_version(conn) >= version:
+                    conn.execute("COMMIT")
+                    continue
+                step(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+            if verbose:
+                print(f"✅ Applied migration {version}: {description}")
+    finally:
+        conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+        conn.isolation_level = isolation_level
+    return applied
+
+
+if __name__ == '__main__':
+    import sys
+    database_file = sys.argv[1] if len(sys.argv) > 1 else 'learning_os.db'
+    connection = sqlite3.connect(database_file)
+    try:
+        versions = migrate(connection, verbose=True)
+        print(f"✅ Database '{database_file}' is at schema version {current_version(connection)}"
+              f" ({len(versions)} migration(s) applied).")
+    finally:
+        connection.close()
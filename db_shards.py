@@ -0,0 +1,163 @@
+# File Name: db_shards.py
+"""
+Placement of users' data in SQLite shard files.
+
+The main database file (db_functions.DATABASE_FILE) is the global catalog: it holds
+the users table and, once sharded, plan_catalog, which allocates plan ids and
+records which user owns each plan. A user's plans, days, lessons and knowledge items
+live in the shard file the router picks for their uid, so sessions of different
+users write to different files and no longer queue on one SQLite writer lock.
+
+Split an existing single-file database into shards with
+
+    python db_shards.py [--mode hash] [--shards 8] [--shard-dir shards] [learning_os.db]
+
+then start the app with the same settings in LEARNING_OS_SHARD_MODE,
+LEARNING_OS_SHARD_COUNT and LEARNING_OS_SHARD_DIR.
+"""
+import argparse
+import os
+import sqlite3
+
+from db_migrations import migrate
+
+SHARD_MODES = ("single", "hash", "user")
+
+
+class ShardRouter:
+    """
+    Maps a uid to the database file that stores the user's data.
+
+    - "single": no shards; everything stays in the main database file (the default).
+    - "hash": `shard_count` files shared by uid % shard_count.
+    - "user": one file per user.
+    """
+
+    def __init__(self, mode="single", shard_count=8, shard_dir="shards"):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode {mode!r}; expected one of {SHARD_MODES}")
+        if mode == "hash" and shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+        self.mode = mode
+        self.shard_count = shard_count
+        self.shard_dir = shard_dir
+
+    @property
+    def sharded(self):
+        return self.mode != "single"
+
+    def shard_file(self, uid):
+        """Return the shard file of a user (only meaningful when `sharded`)."""
+        if self.mode == "hash":
+            return os.path.join(self.shard_dir, f"shard{uid % self.shard_count}.db")
+        return os.path.join(self.shard_dir, f"user{uid}.db")
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            mode=os.environ.get("LEARNING_OS_SHARD_MODE", "single"),
+            shard_count=int(os.environ.get("LEARNING_OS_SHARD_COUNT", "8")),
+            shard_dir=os.environ.get("LEARNING_OS_SHARD_DIR", "shards"),
+        )
+
+
+# --- Splitting a single-file database ---
+
+# Copy statements run on a shard connection with the catalog attached as "src".
+# INSERT OR IGNORE makes a rerun after an interrupted split pick up where it stopped.
+SPLIT_COPY_SQL = (
+    # A stub of the user row so the shard's foreign keys resolve; the catalog keeps the credentials
+    """INSERT OR IGNORE INTO users (uid, username, password_hash, created_at)
+       SELECT uid, username, '', created_at FROM src.users WHERE uid = :uid""",
+    """INSERT OR IGNORE INTO plans (pid, uid, plan_name, daily_content, special_instructions, created_at)
+       SELECT pid, uid, plan_name, daily_content, special_instructions, created_at FROM src.plans WHERE uid = :uid""",
+    """INSERT OR IGNORE INTO plan_days (pid, position, day, topic, details, status, completed_at)
+       SELECT pid, position, day, topic, details, status, completed_at FROM src.plan_days
+       WHERE pid IN (SELECT pid FROM src.plans WHERE uid = :uid)""",
+    """INSERT OR IGNORE INTO plan_lessons (pid, day, learning_material, instructions_hash, model, created_at, updated_at)
+       SELECT pid, day, learning_material, instructions_hash, model, created_at, updated_at FROM src.plan_lessons
+       WHERE pid IN (SELECT pid FROM src.plans WHERE uid = :uid)""",
+    """INSERT OR IGNORE INTO knowledge_items (item_id, uid, pid, item_type, term, definition, created_at)
+       SELECT item_id, uid, pid, item_type, term, definition, created_at FROM src.knowledge_items WHERE uid = :uid""",
+    # Replaces the fresh schedule rows the knowledge_items trigger just created
+    """INSERT OR REPLACE INTO review_schedule (item_id, uid, pid, ease, interval_days, reps, due_at, last_reviewed_at)
+       SELECT item_id, uid, pid, ease, interval_days, reps, due_at, last_reviewed_at FROM src.review_schedule
+       WHERE uid = :uid""",
+    # The plan_days triggers counted the copied days and stamped last_activity_at; restore the originals
+    """UPDATE plans SET
+           total_days = (SELECT total_days FROM src.plans AS s WHERE s.pid = plans.pid),
+           completed_days = (SELECT completed_days FROM src.plans AS s WHERE s.pid = plans.pid),
+           last_activity_at = (SELECT last_activity_at FROM src.plans AS s WHERE s.pid = plans.pid)
+       WHERE uid = :uid AND pid IN (SELECT pid FROM src.plans)""",
+)
+
+SPLIT_DELETE_SQL = (
+    "DELETE FROM knowledge_items WHERE uid = :uid",
+    "DELETE FROM plan_lessons WHERE pid IN (SELECT pid FROM plans WHERE uid = :uid)",
+    "DELETE FROM plan_days WHERE pid IN (SELECT pid FROM plans WHERE uid = :uid)",
+    "DELETE FROM plans WHERE uid = :uid",
+)
+
+
+def split_database(database_file, router, keep_source=False, verbose=False):
+    """
+    Move every user's data from `database_file` into the shard files of `router`.
+
+    Each user is copied in one transaction per shard (via ATTACH, so rows never pass
+    through Python) and their plans are registered in the catalog's plan_catalog.
+    Unless `keep_source` is set, the moved rows are then deleted from the catalog.
+    Returns the number of users moved.
+    """
+    if not router.sharded:
+        raise ValueError("Choose a shard mode other than 'single' to split a database")
+    catalog = sqlite3.connect(database_file)
+    migrate(catalog)
+    shards = {}
+    moved = 0
+    try:
+        uids = [row[0] for row in catalog.execute("SELECT uid FROM users ORDER BY uid")]
+        for uid in uids:
+            shard_file = router.shard_file(uid)
+            shard = shards.get(shard_file)
+            if shard is None:
+                os.makedirs(os.path.dirname(shard_file) or ".", exist_ok=True)
+                shard = shards[shard_file] = sqlite3.connect(shard_file)
+                migrate(shard)
+                shard.execute("ATTACH DATABASE ? AS src", (database_file,))
+            with shard:
+                for sql in SPLIT_COPY_SQL:
+                    shard.execute(sql, {"uid": uid})
+            with catalog:
+                catalog.execute(
+                    "INSERT OR IGNORE INTO plan_catalog (pid, uid) SELECT pid, uid FROM plans WHERE uid = ?", (uid,)
+                )
+                if not keep_source:
+                    for sql in SPLIT_DELETE_SQL:
+                        catalog.execute(sql, {"uid": uid})
+            moved += 1
+            if verbose:
+                print(f"✅ Moved user {uid} to {shard_file}")
+    finally:
+        for shard in shards.values():
+            shard.close()
+        catalog.close()
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split a learning_os database into per-user shard files.")
+    parser.add_argument("database", nargs="?", default="learning_os.db", help="main database file (becomes the catalog)")
+    parser.add_argument("--mode", choices=SHARD_MODES[1:], default="hash")
+    parser.add_argument("--shards", type=int, default=8, help="number of shard files in hash mode")
+    parser.add_argument("--shard-dir", default="shards")
+    parser.add_argument("--keep-source", action="store_true", help="copy only; leave the rows in the main file")
+    args = parser.parse_args()
+
+    router = ShardRouter(args.mode, args.shards, args.shard_dir)
+    moved = split_database(args.database, router, keep_source=args.keep_source, verbose=True)
+    print(f"✅ Moved {moved} user(s). Start the app with LEARNING_OS_SHARD_MODE={args.mode}"
+          f" LEARNING_OS_SHARD_COUNT={args.shards} LEARNING_OS_SHARD_DIR={args.shard_dir}")
+
+
+if __name__ == '__main__':
+    main()
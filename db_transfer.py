@@ -0,0 +1,293 @@
+# File Name: db_transfer.py
+"""
+Streaming JSONL export and import of a user's plans, plan days, lessons and
+knowledge items (with their review schedules).
+
+A file holds one JSON record per line, tagged with "type": a "header" first, then
+every "plan", then the "plan_day" and "lesson" records of those plans, then the
+"knowledge_item" records. Rows are read in bounded chunks and written one line at
+a time, and imports read one line at a time, so memory stays constant whatever
+the size of the data. Ids are not kept: an import creates new plans and items and
+remaps the plan ids its records refer to.
+
+    python db_transfer.py export USERNAME backup.jsonl [--plan PID ...]
+    python db_transfer.py import USERNAME backup.jsonl
+"""
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+
+FORMAT_VERSION = 1
+EXPORT_CHUNK_SIZE = 5000  # rows per export read
+IMPORT_CHUNK_SIZE = 20000  # records per import transaction
+
+PLAN_FIELDS = ("pid", "plan_name", "daily_content", "special_instructions", "created_at", "last_activity_at")
+PLAN_DAY_FIELDS = ("pid", "position", "day", "topic", "details", "status", "completed_at")
+LESSON_FIELDS = ("pid", "day", "learning_material", "instructions_hash", "model", "created_at", "updated_at")
+KNOWLEDGE_ITEM_FIELDS = (
+    "pid", "item_type", "term", "definition", "created_at",
+    "ease", "interval_days", "reps", "due_at", "last_reviewed_at",
+)
+
+# Every plan of the user, or only those whose pid is in a JSON array
+PLAN_FILTER = "(:pids IS NULL OR pid IN (SELECT value FROM json_each(:pids)))"
+
+
+class TransferError(ValueError):
+    """The JSONL input is not a learning_os export."""
+
+
+# --- Export ---
+
+def export_records(connect, uid, pids=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the export records of a user's plans (all of them, or those in `pids`)
+    as dicts. Knowledge items not tied to a plan are included when exporting all.
+
+    Rows are read `chunk_size` at a time in key order, each chunk over its own
+    `with connect() as conn` block, so no connection or read transaction is held
+    while the caller consumes the records. The export is therefore not one
+    snapshot: rows changed during it may or may not be included, and the records
+    of a plan deleted meanwhile are skipped on import.
+    """
+    params = {"uid": uid, "pids": json.dumps(list(pids)) if pids is not None else None, "limit": chunk_size}
+    yield {"type": "header", "format": FORMAT_VERSION}
+    plans = f"SELECT pid FROM plans WHERE uid = :uid AND {PLAN_FILTER}"
+    queries = (
+        # (record type, key columns (unique, in export order), query without ORDER BY)
+        ("plan", ("pid",), f"SELECT {', '.join(PLAN_FIELDS)} FROM plans WHERE uid = :uid AND {PLAN_FILTER}"),
+        ("plan_day", ("pid", "position"), f"SELECT {', '.join(PLAN_DAY_FIELDS)} FROM plan_days WHERE pid IN ({plans})"),
+        ("lesson", ("pid", "day"), f"SELECT {', '.join(LESSON_FIELDS)} FROM plan_lessons WHERE pid IN ({plans})"),
+        ("knowledge_item", ("k.item_id",), f"""
+            SELECT k.pid, k.item_type, k.term, k.definition, k.created_at,
+                   r.ease, r.interval_days, r.reps, r.due_at, r.last_reviewed_at, k.item_id
+            FROM knowledge_items AS k LEFT JOIN review_schedule AS r ON r.item_id = k.item_id
+            WHERE k.uid = :uid AND (k.pid IN ({plans}) OR (:pids IS NULL AND k.pid IS NULL))
+        """),
+    )
+    for record_type, key, sql in queries:
+        key_names = [column.split(".")[-1] for column in key]
+        after = None
+        while True:
+            chunk_sql, chunk_params = sql, params
+            if after is not None:
+                placeholders = ", ".join(f":after_{name}" for name in key_names)
+                chunk_sql += f" AND ({', '.join(key)}) > ({placeholders})"
+                chunk_params = {**params, **{f"after_{name}": value for name, value in zip(key_names, after)}}
+            chunk_sql += f" ORDER BY {', '.join(key)} LIMIT :limit"
+            with connect() as conn:
+                cursor = conn.execute(chunk_sql, chunk_params)
+                names = [column[0] for column in cursor.description]
+                rows = cursor.fetchall()
+            for row in rows:
+                record = {"type": record_type}
+                record.update(zip(names, row))
+                after = tuple(record[name] for name in key_names)
+                if record_type == "knowledge_item":
+                    del record["item_id"]  # ids are not exported
+                yield record
+            if len(rows) < chunk_size:
+                break
+
+
+def write_jsonl(records, fp):
+    """Write records to a text file, one JSON object per line. Returns the count."""
+    count = 0
+    for record in records:
+        fp.write(json.dumps(record, ensure_ascii=False))
+        fp.write("\n")
+        count += 1
+    return count
+
+
+# --- Import ---
+
+def read_jsonl(fp):
+    """Yield the records of a JSONL text file, one line at a time."""
+    for line_number, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise TransferError(f"Line {line_number}: {e}") from e
+
+
+class _Importer:
+    """Buffers child rows and writes them with executemany, one transaction per chunk."""
+
+    def __init__(self, conn, uid, new_plan_id, chunk_size):
+        self.conn = conn
+        self.uid = uid
+        self.new_plan_id = new_plan_id
+        self.chunk_size = chunk_size
+        self.plans = {}  # exported pid -> new pid
+        self.last_activity = {}  # new pid -> exported last_activity_at
+        self.counts = Counter()
+        self.days = []
+        self.lessons = []
+        self.items = []
+        self.in_chunk = 0
+
+    def begin(self):
+        if not self.conn.in_transaction:
+            # Take the write lock up front: item ids are assigned from the current maximum
+            self.conn.execute("BEGIN IMMEDIATE")
+
+    def add(self, record):
+        record_type = record.get("type")
+        self.begin()
+        if record_type == "header":
+            if record.get("format") != FORMAT_VERSION:
+                raise TransferError(f"Unsupported export format {record.get('format')!r}")
+            return
+        if record_type == "plan":
+            self.add_plan(record)
+        elif record_type in ("plan_day", "lesson", "knowledge_item"):
+            pid = record.get("pid")
+            if pid is not None:
+                pid = self.plans.get(pid)
+                if pid is None:
+                    self.counts["skipped"] += 1  # its plan is not in the file
+                    return
+            if record_type == "plan_day":
+                self.days.append((pid,) + tuple(record.get(name) for name in PLAN_DAY_FIELDS[1:]))
+            elif record_type == "lesson":
+                self.lessons.append((pid,) + tuple(record.get(name) for name in LESSON_FIELDS[1:]))
+            else:
+                self.items.append((pid,) + tuple(record.get(name) for name in KNOWLEDGE_ITEM_FIELDS[1:]))
+        else:
+            raise TransferError(f"Unknown record type {record_type!r}")
+        self.counts[record_type] += 1
+        self.in_chunk += 1
+        if self.in_chunk >= self.chunk_size:
+            self.commit()
+
+    def add_plan(self, record):
+        pid = self.new_plan_id() if self.new_plan_id is not None else None
+        pid = self.conn.execute(
+            "INSERT INTO plans (pid, uid, plan_name, daily_content, special_instructions, created_at)"
+            " VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
+            (pid, self.uid, record["plan_name"], record.get("daily_content") or "[]",
+             record.get("special_instructions"), record.get("created_at")),
+        ).lastrowid
+        self.plans[record["pid"]] = pid
+        self.last_activity[pid] = record.get("last_activity_at")
+
+    def flush(self):
+        conn = self.conn
+        if self.days:
+            conn.executemany(
+                "INSERT INTO plan_days (pid, position, day, topic, details, status, completed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self.days,
+            )
+        if self.lessons:
+            conn.executemany(
+                "INSERT INTO plan_lessons"
+                " (pid, day, learning_material, instructions_hash, model, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))",
+                self.lessons,
+            )
+        if self.items:
+            # Explicit ids (we hold the write lock) so the schedules can be matched to the new items
+            next_id = conn.execute("""
+                SELECT MAX(COALESCE((SELECT MAX(item_id) FROM knowledge_items), 0),
+                           COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'knowledge_items'), 0))
+            """).fetchone()[0] + 1
+            conn.executemany(
+                "INSERT INTO knowledge_items (item_id, uid, pid, item_type, term, definition, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
+                ((next_id + i, self.uid) + item[:5] for i, item in enumerate(self.items)),
+            )
+            # The insert trigger created default schedules; restore the exported ones
+            conn.executemany(
+                "UPDATE review_schedule SET ease = ?, interval_days = ?, reps = ?, due_at = ?, last_reviewed_at = ?"
+                " WHERE item_id = ?",
+                (item[5:] + (next_id + i,) for i, item in enumerate(self.items) if item[5] is not None),
+            )
+        self.days, self.lessons, self.items = [], [], []
+
+    def commit(self):
+        self.flush()
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.in_chunk = 0
+
+    def finish(self):
+        self.begin()
+        self.flush()
+        # The plan_days triggers stamped the import time; keep the exported activity
+        self.conn.executemany(
+            "UPDATE plans SET last_activity_at = COALESCE(?, last_activity_at) WHERE pid = ?",
+            [(last_activity, pid) for pid, last_activity in self.last_activity.items()],
+        )
+        self.commit()
+
+
+def import_records(conn, uid, records, new_plan_id=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import export records for user `uid`, committing every `chunk_size` records.
+
+    `new_plan_id()`, if given, supplies the id of each new plan (e.g. from a shard
+    catalog); when it is missing or returns None the plans table assigns it. Returns (counts, plans) where
+    `plans` maps the exported plan ids to the new ones. If a record is invalid, the
+    current chunk is rolled back; earlier chunks stay committed.
+    """
+    importer = _Importer(conn, uid, new_plan_id, chunk_size)
+    try:
+        for record in records:
+            importer.add(record)
+        importer.finish()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    return importer.counts, importer.plans
+
+
+# --- Command line ---
+
+def main():
+    import db_functions
+
+    parser = argparse.ArgumentParser(description="Export or import a user's plans and knowledge items as JSONL.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write a user's data to a JSONL file ('-' for stdout)")
+    export_parser.add_argument("username")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--plan", type=int, action="append", dest="pids", help="plan id to export (repeatable)")
+    import_parser = commands.add_parser("import", help="add the plans of a JSONL file to a user ('-' for stdin)")
+    import_parser.add_argument("username")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    user = db_functions.get_user_by_username(args.username)
+    if user is None:
+        sys.exit(f"❌ Unknown user '{args.username}'")
+
+    started = time.perf_counter()
+    if args.command == "export":
+        fp = sys.stdout if args.path == "-" else open(args.path, "w", encoding="utf-8")
+        try:
+            count = write_jsonl(db_functions.export_user_data(user['uid'], args.pids), fp)
+        finally:
+            if fp is not sys.stdout:
+                fp.close()
+        print(f"✅ Exported {count} records in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    else:
+        fp = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+        try:
+            counts, plans = db_functions.import_user_data(user['uid'], read_jsonl(fp), chunk_size=args.chunk_size)
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+        summary = ", ".join(f"{count} {record_type}" for record_type, count in sorted(counts.items()))
+        print(f"✅ Imported {summary} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# File Name: db_write_queue.py
+import atexit
+import logging
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Background writer for non-critical database writes.
+
+    `submit` hands a write to a bounded queue and returns at once; a single writer
+    thread drains whatever has queued up and commits it as one transaction, so the
+    page never waits for disk syncs or the write lock. Each write names the data it
+    changes (e.g. ("plan", pid)); readers call `wait_for` with the keys they are about
+    to read and block only while one of their own writes is still pending, which
+    gives read-your-writes. A write may name a `target` (e.g. a shard file), which is
+    passed to `connect`, a context manager that yields a connection for it; a batch
+    is committed as one transaction per target.
+    `on_commit`, if given, is called with the keys of each
+    batch once it has been written (e.g. to invalidate cached reads). Pending writes
+    are flushed at interpreter exit.
+
+    `submit` returns a Future that resolves to the return value of the write once
+    it is committed, or to its error if it could not be written, so a page that
+    reports the outcome of a save can wait for it.
+    """
+
+    def __init__(self, connect, max_pending=1000, batch_size=100, on_commit=None):
+        self._connect = connect
+        self._on_commit = on_commit
+        self.batch_size = batch_size
+        self._queue = queue.Queue(max_pending)
+        self._pending = Counter()  # key -> writes submitted but not yet committed
+        self._cond = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        atexit.register(self.close)
+
+    def submit(self, keys, op, target=None):
+        """
+        Queue `op(conn)` to run on the writer thread against `connect(target)`. `op`
+        must not commit; the writer commits the whole batch. Blocks only when the
+        queue is full. Returns a Future of the value returned by `op`.
+        """
+        keys = tuple(keys)
+        future = Future()
+        if self._closed:
+            # After shutdown started, write synchronously rather than lose the write
+            try:
+                with self._connect(target) as conn:
+                    result = op(conn)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            if self._on_commit is not None:
+                self._on_commit(set(keys))
+            return future
+        self._ensure_started()
+        with self._cond:
+            self._pending.update(keys)
+        self._queue.put((keys, op, target, future))
+        return future
+
+    def wait_for(self, keys, timeout=5.0):
+        """
+        Block until every queued write touching one of `keys` has been committed.
+
+        Returns False, after logging a warning that the caller is about to read
+        stale data, if they are still pending after `timeout` seconds.
+        """
+        with self._cond:
+            committed = self._cond.wait_for(lambda: not any(self._pending[key] for key in keys), timeout)
+        if not committed:
+            logger.warning("Writes to %s still pending after %.0fs; reading without them", list(keys), timeout)
+        return committed
+
+    def flush(self):
+        """Block until every write queued so far has been committed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            # Group everything that queued up while the previous batch was being written
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        outcomes = {}  # future -> (error, result)
+        try:
+            by_target = {}
+            for _, op, target, future in batch:
+                by_target.setdefault(target, []).append((op, future))
+            for target, writes in by_target.items():
+                try:
+                    self._write_target(target, writes, outcomes)
+                except Exception as e:
+                    # e.g. the database could not be opened; keep the writer alive
+                    logger.exception("Dropped a write-behind batch of %d", len(writes))
+                    for _, future in writes:
+                        outcomes[future] = (e, None)
+            self.batches += 1
+        finally:
+            if self._on_commit is not None:
+                self._on_commit({key for keys, _, _, _ in batch for key in keys})
+            with self._cond:
+                for keys, _, _, _ in batch:
+                    self._pending.subtract(keys)
+                self._pending += Counter()  # drop keys whose count reached zero
+                self._cond.notify_all()
+            # Resolved last, so a caller woken by its future reads the committed data
+            for _, _, _, future in batch:
+                error, result = outcomes.get(future, (RuntimeError("The write was not attempted"), None))
+                if error is not None:
+                    self.failed += 1
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+                self._queue.task_done()
+
+    def _write_target(self, target, writes, outcomes):
+        with self._connect(target) as conn:
+            try:
+                with conn:
+                    results = [op(conn) for op, _ in writes]
+            except Exception:
+                # Retry one by one so a single bad write doesn't drop the whole batch
+                logger.exception("Write-behind batch of %d failed; retrying writes individually", len(writes))
+                for op, future in writes:
+                    try:
+                        with conn:
+                            result = op(conn)
+                    except Exception as e:
+                        logger.exception("Dropped a write-behind write")
+                        outcomes[future] = (e, None)
+                    else:
+                        outcomes[future] = (None, result)
+                        self.writes += 1
+            else:
+                for (_, future), result in zip(writes, results):
+                    outcomes[future] = (None, result)
+                self.writes += len(writes)
+
+    def close(self):
+        """Commit every pending write and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "writes": self.writes,
+            "failed": self.failed,
+        }
@@ -0,0 +1,309 @@
+# File Name: llm_backends.py
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from client_pool import GenerativeModelPool
+from llm_telemetry import extract_usage
+from rate_limiter import estimate_tokens
+
+
+class LLMBackend:
+    """
+    Interface between AIManager and a model provider.
+
+    `generate` returns an object with a `text` attribute and, optionally, a
+    `usage_metadata` attribute shaped like Gemini's (prompt_token_count,
+    candidates_token_count, total_token_count). Errors are raised as-is so the retry
+    policy can classify them.
+    """
+
+    name = "base"
+
+    def warm(self, api_key, model_name):
+        """Prepare whatever a first request for this key would need."""
+
+    def generate(self, api_key, model_name, prompt, prompt_type=None, generation_config=None):
+        raise NotImplementedError
+
+    def stream(self, api_key, model_name, prompt, prompt_type=None, generation_config=None, usage=None):
+        """
+        Yield the response text in chunks as it is produced. When `usage` is a dict it
+        is filled with the final response's token counts. Backends without native
+        streaming yield the whole response as a single chunk.
+        """
+        response = self.generate(api_key, model_name, prompt, prompt_type, generation_config)
+        if usage is not None:
+            usage.update(extract_usage(response))
+        yield response.text
+
+    def close(self):
+        """Release clients and connections."""
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through per-key pooled GenerativeModel clients."""
+
+    name = "gemini"
+
+    def __init__(self, idle_timeout):
+        self.client_pool = GenerativeModelPool(idle_timeout)
+
+    def warm(self, api_key, model_name):
+        self.client_pool.get(api_key, model_name)
+
+    def generate(self, api_key, model_name, prompt, prompt_type=None, generation_config=None):
+        model = self.client_pool.get(api_key, model_name)
+        try:
+            return model.generate_content(prompt, generation_config=generation_config)
+        except Exception as e:
+            self._discard_if_rejected(e, api_key, model_name)
+            raise
+
+    def stream(self, api_key, model_name, prompt, prompt_type=None, generation_config=None, usage=None):
+        model = self.client_pool.get(api_key, model_name)
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config, stream=True)
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without parts (e.g. the final one carrying only the finish reason)
+                    continue
+                if text:
+                    yield text
+        except Exception as e:
+            self._discard_if_rejected(e, api_key, model_name)
+            raise
+        if usage is not None:
+            usage.update(extract_usage(response))
+
+    def _discard_if_rejected(self, e, api_key, model_name):
+        # A rejected key will not work again; don't keep its client warm in the pool
+        if "API_KEY_INVALID" in str(e):
+            self.client_pool.discard(api_key, model_name)
+
+    def close(self):
+        self.client_pool.close()
+
+
+class MockUpstreamError(Exception):
+    """Transient failure injected by MockBackend; carries an HTTP-like status code."""
+
+    def __init__(self, code, message, retry_after=None):
+        self.code = code
+        self.retry_after = retry_after
+        super().__init__(f"{code} {message}")
+
+
+class MockBackend(LLMBackend):
+    """
+    Deterministic offline stand-in for Gemini, for load tests and benchmarks.
+
+    The response content depends only on the prompt, so repeated prompts give identical
+    answers. It returns schema-valid plan, lesson, quiz and Ask JSON, and plain text
+    for grading and instruction prompts. Latency is drawn from a log-normal
+    distribution around `latency_ms`, and `error_rate` of calls fail with a 503 or a
+    429 carrying a retry-after hint.
+    """
+
+    name = "mock"
+    STREAM_CHUNK_CHARS = 40
+
+    def __init__(self, latency_ms=800, latency_sigma=0.5, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self._chaos = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw_latency_and_error(self):
+        with self._lock:
+            latency = self._chaos.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000.0 if self.latency_ms else 0.0
+            fails = self._chaos.random() < self.error_rate
+            rate_limited = self._chaos.random() < 0.3
+        return latency, fails, rate_limited
+
+    @staticmethod
+    def _raise_injected_error(rate_limited):
+        if rate_limited:
+            raise MockUpstreamError(429, "Resource exhausted (mock). Please retry in 1s.", retry_after=1.0)
+        raise MockUpstreamError(503, "Service unavailable (mock).")
+
+    def generate(self, api_key, model_name, prompt, prompt_type=None, generation_config=None):
+        latency, fails, rate_limited = self._draw_latency_and_error()
+        if latency:
+            time.sleep(latency)
+        if fails:
+            self._raise_injected_error(rate_limited)
+        return self._respond(prompt, prompt_type)
+
+    def stream(self, api_key, model_name, prompt, prompt_type=None, generation_config=None, usage=None):
+        """Yield the response in ~40-character chunks, spreading the latency across them."""
+        latency, fails, rate_limited = self._draw_latency_and_error()
+        response = self._respond(prompt, prompt_type)
+        text = response.text
+        chunks = [text[i:i + self.STREAM_CHUNK_CHARS] for i in range(0, len(text), self.STREAM_CHUNK_CHARS)] or [""]
+        # Time to first chunk is a fifth of the total, the rest is spread evenly
+        time.sleep(latency * 0.2)
+        if fails:
+            self._raise_injected_error(rate_limited)
+        step = latency * 0.8 / len(chunks)
+        for chunk in chunks:
+            yield chunk
+            time.sleep(step)
+        if usage is not None:
+            usage.update(extract_usage(response))
+
+    def _respond(self, prompt, prompt_type):
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        kind = prompt_type or self.classify(prompt)
+        builder = getattr(self, f"_fake_{kind}", self._fake_text)
+        payload = builder(prompt, rng)
+        text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+
+        prompt_tokens = estimate_tokens(prompt)
+        response_tokens = estimate_tokens(text)
+        usage = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=response_tokens,
+            total_token_count=prompt_tokens + response_tokens,
+        )
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    @staticmethod
+    def classify(prompt):
+        """Guess which page prompt this is when the caller gave no prompt_type."""
+        lowered = prompt.lower()
+        if "daily learning plan" in lowered:
+            return "plan"
+        if "adjust their learning plan" in lowered:
+            return "plan_adjust"
+        if '"action": "regenerate"' in lowered:
+            return "lesson_chat"
+        if "learning_material" in lowered:
+            return "lesson"
+        if "create a quiz" in lowered:
+            return "quiz"
+        if "student's answer" in lowered:
+            return "grade"
+        if "is_knowledge_point" in lowered:
+            return "ask"
+        return "text"
+
+    # --- Fake payloads ---
+
+    def _fake_plan(self, prompt, rng):
+        match = re.search(r"in (\d+) days", prompt)
+        days = int(match.group(1)) if match else 7
+        target = re.search(r"learn '([^']*)'", prompt)
+        target = target.group(1) if target else "the subject"
+        return [
+            {
+                "day": day,
+                "topic": f"{target}: part {day}",
+                "details": f"Study unit {day} of {target} ({rng.choice(['theory', 'practice', 'review'])}).",
+                "status": "pending",
+            }
+            for day in range(1, days + 1)
+        ]
+
+    def _fake_plan_adjust(self, prompt, rng):
+        match = re.search(r"(\[\s*\{.*\}\s*\])", prompt, re.DOTALL)
+        if match:
+            try:
+                plan = json.loads(match.group(1))
+                for day in plan:
+                    day["details"] = f"{day.get('details', '')} (adjusted)"
+                return plan
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                pass
+        return self._fake_plan(prompt, rng)
+
+    def _lesson_blocks(self, topic, rng):
+        blocks = [{"type": "paragraph", "content": f"An introduction to **{topic}**."}]
+        for n in range(1, rng.randint(4, 8)):
+            blocks.append({
+                "type": "key_concept",
+                "content": {
+                    "term": f"{topic} concept {n}",
+                    "definition": f"Definition of concept {n} of {topic}.",
+                    "example": f"Example {n}.",
+                },
+            })
+        blocks.append({
+            "type": "theorem",
+            "content": {"name": f"Rule of {topic}", "statement": "A statement.", "example": "An example."},
+        })
+        blocks.append({
+            "type": "table",
+            "content": {"title": f"{topic} summary", "headers": ["Term", "Meaning"],
+                        "rows": [[f"t{n}", f"m{n}"] for n in range(1, 4)]},
+        })
+        blocks.append({
+            "type": "code_example",
+            "content": {"title": "Sample", "language": "python", "code": "print('hello')", "explanation": "Prints hello."},
+        })
+        blocks.append({
+            "type": "latex_equation",
+            "content": {"title": "Identity", "equation": "a^2 + b^2 = c^2", "explanation": "Pythagoras."},
+        })
+        return blocks
+
+    def _fake_lesson(self, prompt, rng):
+        match = re.search(r'The topic is: "([^"]*)"', prompt)
+        topic = match.group(1) if match else "Today's topic"
+        return {"learning_material": self._lesson_blocks(topic, rng)}
+
+    def _fake_lesson_chat(self, prompt, rng):
+        if rng.random() < 0.2:
+            return {"action": "regenerate", "content": {"learning_material": self._lesson_blocks("Revised topic", rng)}}
+        return {"action": "answer", "content": "Here is a short answer to your question (mock)."}
+
+    def _fake_quiz(self, prompt, rng):
+        questions = []
+        for n in range(10):
+            kind = ("short_answer", "multiple_choice", "fill_in_the_blank")[n % 3]
+            if kind == "short_answer":
+                data = {"question": f"Explain item {n + 1}?", "answer": f"Answer {n + 1}."}
+            elif kind == "multiple_choice":
+                options = ["A", "B", "C", "D"]
+                data = {"question": f"Which option fits item {n + 1}?", "options": options, "answer": rng.choice(options)}
+            else:
+                data = {"sentence": f"Item {n + 1} is a ____ example.", "blank_word": "good"}
+            questions.append({"type": kind, "data": data})
+        return {"questions": questions}
+
+    def _fake_ask(self, prompt, rng):
+        match = re.search(r'The user\'s question is: "([^"]*)"', prompt)
+        question = match.group(1) if match else "your question"
+        if rng.random() < 0.5:
+            return {"is_knowledge_point": True,
+                    "data": {"term": question[:40], "definition": f"Mock definition for {question[:40]}.", "item_type": "concept"}}
+        return {"is_knowledge_point": False, "data": {"answer": f"Mock answer to: {question}"}}
+
+    def _fake_grade(self, prompt, rng):
+        return rng.choice([
+            "Correct! Well done, that is exactly right.",
+            "Not quite. The correct answer is explained in your notes.",
+        ])
+
+    def _fake_text(self, prompt, rng):
+        return f"Mock response #{rng.randint(1000, 9999)}."
+
+
+def create_backend(config):
+    """Build the backend selected by config.LLM_BACKEND ("gemini" or "mock")."""
+    if config.LLM_BACKEND == "mock":
+        return MockBackend(
+            latency_ms=config.LLM_MOCK_LATENCY_MS,
+            latency_sigma=config.LLM_MOCK_LATENCY_SIGMA,
+            error_rate=config.LLM_MOCK_ERROR_RATE,
+        )
+    if config.LLM_BACKEND == "gemini":
+        return GeminiBackend(config.GEMINI_CLIENT_IDLE_TIMEOUT)
+    raise ValueError(f"Unknown LLM_BACKEND: {config.LLM_BACKEND}")
@@ -0,0 +1,179 @@
+# File Name: llm_cache.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def normalize_prompt(prompt):
+    """
+    Normalize a prompt before hashing so that indentation changes in the page source
+    (prompts are indented f-strings) do not produce different cache keys.
+    """
+    lines = [line.strip() for line in prompt.strip().splitlines()]
+    return "\n".join(lines)
+
+
+def make_cache_key(model, prompt, params=None):
+    """Content-addressed key: sha256 of (model, normalized prompt, generation params)."""
+    payload = json.dumps(
+        {"model": model, "prompt": normalize_prompt(prompt), "params": params or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Persistent LLM response cache stored in SQLite.
+
+    Entries expire after `ttl_seconds` and the least recently used entries are evicted
+    once the stored responses exceed `max_bytes`. The cache lives in its own database
+    file so cache writes never contend with the application's writer lock, and it is
+    shared by every session and survives restarts.
+    """
+
+    def __init__(self, path, ttl_seconds, max_bytes):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._setup()
+        self._total_bytes = self._connection().execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM llm_cache"
+        ).fetchone()[0]
+
+    def _connection(self):
+        # One connection per thread: executor threads and script threads both use the cache
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _setup(self):
+        conn = self._connection()
+        with conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed_at REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            );
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed ON llm_cache (last_accessed_at);")
+
+    def get(self, cache_key):
+        """Return the cached response text, or None on a miss or an expired entry."""
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT response, created_at, size_bytes FROM llm_cache WHERE cache_key = ?",
+            (cache_key,),
+        ).fetchone()
+        now = time.time()
+        if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+            if row is not None:
+                self._delete(conn, cache_key, row[2])
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with conn:
+            conn.execute(
+                "UPDATE llm_cache SET last_accessed_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                (now, cache_key),
+            )
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def put(self, cache_key, model, response):
+        """Store a response and evict least recently used entries if over budget."""
+        size_bytes = len(response.encode("utf-8"))
+        if self.max_bytes and size_bytes > self.max_bytes:
+            return
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            previous = conn.execute(
+                "SELECT size_bytes FROM llm_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (cache_key, model, response, size_bytes, created_at, last_accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, model, response, size_bytes, now, now),
+            )
+        with self._lock:
+            self._total_bytes += size_bytes - (previous[0] if previous else 0)
+        self._evict(conn)
+
+    def delete(self, cache_key):
+        """Remove one entry, e.g. a response that turned out to be unusable."""
+        conn = self._connection()
+        row = conn.execute("SELECT size_bytes FROM llm_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+        if row is not None:
+            self._delete(conn, cache_key, row[0])
+
+    def _delete(self, conn, cache_key, size_bytes):
+        with conn:
+            deleted = conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (cache_key,)).rowcount
+        if deleted:
+            with self._lock:
+                self._total_bytes -= size_bytes
+
+    def _evict(self, conn):
+        if not self.max_bytes or self._total_bytes <= self.max_bytes:
+            return
+        with conn:
+            rows = conn.execute(
+                "SELECT cache_key, size_bytes FROM llm_cache ORDER BY last_accessed_at"
+            )
+            freed = 0
+            victims = []
+            for cache_key, size_bytes in rows:
+                if self._total_bytes - freed <= self.max_bytes:
+                    break
+                victims.append((cache_key,))
+                freed += size_bytes
+            conn.executemany("DELETE FROM llm_cache WHERE cache_key = ?", victims)
+        with self._lock:
+            self._total_bytes -= freed
+
+    def purge_expired(self):
+        """Delete every expired entry and return how many were removed."""
+        if not self.ttl_seconds:
+            return 0
+        conn = self._connection()
+        cutoff = time.time() - self.ttl_seconds
+        with conn:
+            freed = conn.execute(
+                "SELECT COALESCE(SUM(size_bytes), 0) FROM llm_cache WHERE created_at < ?", (cutoff,)
+            ).fetchone()[0]
+            deleted = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (cutoff,)).rowcount
+        with self._lock:
+            self._total_bytes -= freed
+        return deleted
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        entries = self._connection().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._total_bytes,
+            }
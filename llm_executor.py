@@ -0,0 +1,92 @@
+# File Name: llm_executor.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from rate_limiter import key_fingerprint
+
+
+class LLMExecutor:
+    """
+    Runs LLM calls on a shared thread pool with a concurrency cap per API key.
+
+    Tasks for a key that is already at its cap wait in that key's own queue instead of
+    occupying a pool thread, so one busy key can never starve the others.
+    """
+
+    def __init__(self, max_workers, max_concurrency_per_key):
+        self.max_concurrency_per_key = max(1, int(max_concurrency_per_key))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._pending = {}    # key fingerprint -> deque of queued tasks
+        self._in_flight = {}  # key fingerprint -> number of running tasks
+        self._shutdown = False
+
+    def submit(self, api_key, fn, *args, **kwargs):
+        """
+        Schedule `fn(*args, **kwargs)` under `api_key`'s concurrency budget.
+
+        Returns a concurrent.futures.Future. The future carries a `queue_wait` attribute
+        (seconds spent waiting for a free slot) once the task has started.
+        """
+        future = Future()
+        fingerprint = key_fingerprint(api_key)
+        task = (future, fn, args, kwargs, time.monotonic())
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("LLMExecutor has been shut down")
+            self._pending.setdefault(fingerprint, deque()).append(task)
+            self._dispatch(fingerprint)
+        return future
+
+    def _dispatch(self, fingerprint):
+        # Caller must hold self._lock
+        queue = self._pending.get(fingerprint)
+        while queue and self._in_flight.get(fingerprint, 0) < self.max_concurrency_per_key:
+            task = queue.popleft()
+            if not task[0].set_running_or_notify_cancel():
+                continue  # Cancelled while it was still queued
+            self._in_flight[fingerprint] = self._in_flight.get(fingerprint, 0) + 1
+            self._pool.submit(self._run, fingerprint, task)
+        if not queue:
+            self._pending.pop(fingerprint, None)
+
+    def _run(self, fingerprint, task):
+        future, fn, args, kwargs, submitted_at = task
+        future.queue_wait = time.monotonic() - submitted_at
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._in_flight[fingerprint] -= 1
+                if not self._in_flight[fingerprint]:
+                    del self._in_flight[fingerprint]
+                if not self._shutdown:
+                    self._dispatch(fingerprint)
+
+    def stats(self):
+        """Return the number of queued and running tasks per key fingerprint."""
+        with self._lock:
+            fingerprints = set(self._pending) | set(self._in_flight)
+            return {
+                fingerprint: {
+                    "queued": len(self._pending.get(fingerprint, ())),
+                    "running": self._in_flight.get(fingerprint, 0),
+                }
+                for fingerprint in fingerprints
+            }
+
+    def shutdown(self, wait=True):
+        """Cancel queued tasks and stop the pool, optionally waiting for running ones."""
+        with self._lock:
+            self._shutdown = True
+            for queue in self._pending.values():
+                for task in queue:
+                    task[0].cancel()
+            self._pending.clear()
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,189 @@
+# File Name: llm_telemetry.py
+import atexit
+import glob
+import json
+import logging
+import logging.handlers
+import math
+import os
+import queue
+import sys
+import time
+from collections import defaultdict
+
+from rate_limiter import key_fingerprint
+
+
+class LLMTelemetry:
+    """
+    Appends one JSON record per LLM call to a rotating JSONL file.
+
+    Records are handed to a QueueHandler, so the calling thread never waits on disk;
+    a QueueListener thread writes them through a RotatingFileHandler and is flushed
+    and stopped at interpreter exit.
+    """
+
+    def __init__(self, path, max_bytes, backup_count):
+        self.path = path
+        self._logger = logging.getLogger(f"llm_telemetry.{os.path.abspath(path)}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        self._file_handler = file_handler
+        self._queue = queue.Queue(-1)
+        self._queue_handler = logging.handlers.QueueHandler(self._queue)
+        self._logger.addHandler(self._queue_handler)
+        self._listener = logging.handlers.QueueListener(self._queue, file_handler)
+        self._listener.start()
+        atexit.register(self.close)
+
+    def start(self, api_key, model, page, prompt_type, prompt):
+        """Begin a record for one generate call; returned dict is filled in as the call runs."""
+        return {
+            "ts": time.time(),
+            "page": page,
+            "prompt_type": prompt_type,
+            "model": model,
+            "key": key_fingerprint(api_key),
+            "prompt_chars": len(prompt),
+            "_started_at": time.monotonic(),
+        }
+
+    def finish(self, record, future=None, response=None, error=None, **fields):
+        """Complete a record from its finished future (or explicit response/error) and log it."""
+        if future is not None:
+            error = future.exception()
+            response = None if error else future.result()
+            stats = getattr(future, "call_stats", None) or {}
+            record.update(stats)
+            record["queue_wait_ms"] = round(getattr(future, "queue_wait", 0.0) * 1000, 1)
+        record.update(fields)
+        if record.get("coalesced"):
+            # The tokens and retries were spent by the request this call joined
+            for field in ("prompt_tokens", "response_tokens", "total_tokens", "retries"):
+                record[field] = 0
+        record["total_latency_ms"] = round((time.monotonic() - record.pop("_started_at")) * 1000, 1)
+        record["response_chars"] = len(response) if isinstance(response, str) else 0
+        if error is None:
+            record["outcome"] = "ok"
+        else:
+            record["outcome"] = type(error).__name__
+            record["error"] = str(error)[:300]
+        self._logger.info(json.dumps(record, ensure_ascii=False))
+
+    def close(self):
+        """Flush pending records to disk and stop the writer thread."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+            self._file_handler.close()
+
+
+# Frames of these standard-library packages are event loops and worker threads, never pages
+DISPATCH_PACKAGES = ("asyncio", "concurrent", "threading")
+
+
+def calling_page(skip_files=()):
+    """
+    Name of the Streamlit page (or script) that triggered the current call, found by
+    walking up the stack past the LLM layer's own modules and any event loop or
+    thread-pool frames. Returns "unknown" on a thread that no page started.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        package = frame.f_globals.get("__name__", "").split(".")[0]
+        if filename not in skip_files and not filename.startswith("<") and package not in DISPATCH_PACKAGES:
+            return filename
+        frame = frame.f_back
+    return "unknown"
+
+
+def extract_usage(response):
+    """Token counts from a Gemini response's usage metadata (zeros when absent)."""
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+        "response_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        "total_tokens": getattr(usage, "total_token_count", 0) or 0,
+    }
+
+
+# --- Reader ---
+
+def iter_records(path):
+    """Yield every record from the log and its rotated backups, oldest file first."""
+    # RotatingFileHandler keeps path.1 (newest backup) ... path.N (oldest backup)
+    backups = [p for p in glob.glob(f"{glob.escape(path)}.*") if p.rsplit(".", 1)[-1].isdigit()]
+    backups.sort(key=lambda p: int(p.rsplit(".", 1)[-1]), reverse=True)
+    for file_path in backups + [path]:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(path, group_by=("page", "prompt_type")):
+    """
+    Aggregate latency and cost per group.
+
+    Returns {field: {group_value: {count, p50, p95, p99, cache_hit_rate, error_rate,
+    total_tokens, retries}}} for each field in `group_by`.
+    """
+    groups = {field: defaultdict(list) for field in group_by}
+    for record in iter_records(path):
+        for field in group_by:
+            groups[field][record.get(field) or "unknown"].append(record)
+
+    summary = {}
+    for field, buckets in groups.items():
+        summary[field] = {}
+        for value, records in buckets.items():
+            latencies = sorted(r.get("total_latency_ms", 0.0) for r in records)
+            count = len(records)
+            summary[field][value] = {
+                "count": count,
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "cache_hit_rate": sum(1 for r in records if r.get("cache_hit")) / count,
+                "error_rate": sum(1 for r in records if r.get("outcome") != "ok") / count,
+                "total_tokens": sum(r.get("total_tokens", 0) for r in records),
+                "retries": sum(r.get("retries", 0) for r in records),
+            }
+    return summary
+
+
+def print_summary(path):
+    summary = summarize(path)
+    for field, rows in summary.items():
+        print(f"\n== Latency by {field} (ms) ==")
+        print(f"{'value':<28}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'hit%':>7}{'err%':>7}{'tokens':>10}{'retries':>9}")
+        for value, s in sorted(rows.items(), key=lambda item: -item[1]["count"]):
+            print(
+                f"{str(value)[:27]:<28}{s['count']:>7}{s['p50']:>10.0f}{s['p95']:>10.0f}{s['p99']:>10.0f}"
+                f"{s['cache_hit_rate'] * 100:>6.0f}%{s['error_rate'] * 100:>6.0f}%{s['total_tokens']:>10}{s['retries']:>9}"
+            )
+
+
+if __name__ == '__main__':
+    print_summary(sys.argv[1] if len(sys.argv) > 1 else "requests.jsonl")
@@ -2,8 +2,8 @@
 import streamlit as st
 import api_log
 import os
-from db_functions import get_plans_by_user, delete_plan
-import json
+from config import config
+from db_functions import get_plan_summaries_by_user, count_plans_by_user, delete_plan
 from change_api import render_api_key_sidebar, get_sidebar_css
 
 # --- API Key Validation Check --- 
@@ -33,7 +33,13 @@ def check_api_key_validation():
         st.session_state['api_key_validated'] = True
         return
 
-    # 4) Otherwise, render the login UI inline
+    # 4) The offline mock backend (LLM_BACKEND=mock) runs without a real key
+    if config.LLM_BACKEND == "mock":
+        st.session_state['gemini_api_key'] = "mock-api-key"
+        st.session_state['api_key_validated'] = True
+        return
+
+    # 5) Otherwise, render the login UI inline
     api_log.show_login_page()
     st.stop()
 
@@ -208,24 +214,34 @@ if st.session_state.get("plan_to_view"):
     st.session_state.plan_to_view = False
     st.switch_page("pages/2_Plan_Details.py")
 
-my_plans = get_plans_by_user(uid)
-
-if not my_plans:
-    # --- IMPROVED THIS SECTION ---
-    st.info("You don't have any learning plans yet. Click the button above to create one!")
-    # --- END OF IMPROVEMENT ---
-elif my_plans: # Add an explicit check to ensure my_plans is not empty
+total_plans = count_plans_by_user(uid)
+plan = None
+if total_plans:
     # --- Pagination Logic for single plan view ---
     if 'plan_page_index' not in st.session_state:
         st.session_state.plan_page_index = 0
 
-    total_plans = len(my_plans)
     # Ensure index is valid if plans are deleted
-    if st.session_state.plan_page_index >= total_plans:
-        st.session_state.plan_page_index = max(0, total_plans - 1)
-
+    st.session_state.plan_page_index = min(max(0, st.session_state.plan_page_index), total_plans - 1)
+
+    # Only the plan on the current card is read, without its daily content
+    plans = get_plan_summaries_by_user(uid, limit=1, offset=st.session_state.plan_page_index)
+    if not plans:
+        # A plan was deleted (e.g. in another tab) after it was counted: recount and clamp again
+        total_plans = count_plans_by_user(uid)
+        st.session_state.plan_page_index = max(0, min(st.session_state.plan_page_index, total_plans - 1))
+        plans = get_plan_summaries_by_user(uid, limit=1, offset=st.session_state.plan_page_index)
+    plan = plans[0] if plans else None
+
+if plan is None and total_plans:
+    # Plans were counted but none could be read: they are being deleted right now
+    st.warning("Could not display your plans. Please refresh the page.")
+elif plan is None:
+    # --- IMPROVED THIS SECTION ---
+    st.info("You don't have any learning plans yet. Click the button above to create one!")
+    # --- END OF IMPROVEMENT ---
+else:
     current_index = st.session_state.plan_page_index
-    plan = my_plans[current_index]
 
     # --- Display Single Plan Card with Side Navigation ---
     left_nav_col, card_col, right_nav_col = st.columns([1, 8, 1])
@@ -239,14 +255,12 @@ elif my_plans: # Add an explicit check to ensure my_plans is not empty
         with st.container(border=True, height=300):
                 # Use markdown to apply custom class and title attribute for hover effect
                 st.markdown(f'<h2 class="card-title" title="{plan["plan_name"]}">{plan["plan_name"]}</h2>', unsafe_allow_html=True)
-                try:
-                    content = json.loads(plan['daily_content'])
-                    total_days = len(content)
-                    completed_days = sum(1 for day in content if day.get('status') == 'completed')
-                    progress = completed_days / total_days if total_days > 0 else 0
-                    st.progress(progress, text=f"{completed_days} / {total_days} Days Completed")
-                except (json.JSONDecodeError, TypeError):
-                    st.warning("Could not display progress.")
+                completed_days, total_days = plan['completed_days'], plan['total_days']
+                if total_days > 0:
+                    st.progress(completed_days / total_days, text=f"{completed_days} / {total_days} Days Completed")
+                else:
+                    # A valid plan that has no days yet
+                    st.progress(0.0, text="No days yet")
 
                 st.caption(f"Created: {plan['created_at'].split(' ')[0]}")
 
@@ -2,6 +2,7 @@ import streamlit as st
 from db_functions import add_plan
 import json
 from config import get_ai_manager
+from structured_output import PLAN_SCHEMA
 from auth_helper import require_api_key
 
 st.markdown("""
@@ -146,11 +147,10 @@ def generate_learning_plan_json(target, time_in_days):
       }}
     ]
     """
-    response = ai_manager.generate_content(prompt)
-    if not response:
+    plan = ai_manager.generate_json(prompt, PLAN_SCHEMA, prompt_type="plan")
+    if not plan:
         raise Exception("AI returned no content")
-    cleaned_response = response.replace("```json", "").replace("```", "").strip()
-    return cleaned_response
+    return json.dumps(plan)
 
 
 # Main content
@@ -173,10 +173,8 @@ if st.button("Submit"):
         with st.spinner("🤖 Our AI is crafting your personalized learning plan..."):
             try:
                 # Generate the plan using the AI model
+                # (the plan is already validated against the plan schema)
                 daily_content_json = generate_learning_plan_json(learning_target, learning_time)
-                
-                # Validate that the response is valid JSON
-                json.loads(daily_content_json)
 
                 # Add the plan to the database
                 add_plan(uid, learning_target, daily_content_json, special_instructions)
@@ -1,5 +1,5 @@
 import streamlit as st
-from db_functions import get_plans_by_user
+from db_functions import get_plan_by_id, PLAN_SUMMARY_COLUMNS
 from utils import ensure_plan_selected
 
 
@@ -140,8 +140,7 @@ pid = ensure_plan_selected()
 uid = st.session_state.get('user_id', 1) # Default to 1 if not found
 
 # Fetch all plans and find the current one by pid
-all_plans = get_plans_by_user(uid)
-current_plan = next((plan for plan in all_plans if plan['pid'] == pid), None)
+current_plan = get_plan_by_id(uid, pid, PLAN_SUMMARY_COLUMNS)
 
 if not current_plan:
     st.error("Plan not found. It might have been deleted.")
@@ -1,7 +1,8 @@
 import streamlit as st
-from db_functions import get_plans_by_user, update_plan_content
+from db_functions import get_plan_by_id, update_plan_content
 from utils import ensure_plan_selected
 from config import get_ai_manager
+from structured_output import PLAN_SCHEMA
 import json
 from auth_helper import require_api_key
 
@@ -228,8 +229,7 @@ if not ai_manager.initialize():
 
 # --- Function to fetch the current plan ---W
 def get_current_plan():
-    all_plans = get_plans_by_user(uid)
-    return next((plan for plan in all_plans if plan['pid'] == pid), None)
+    return get_plan_by_id(uid, pid, ("pid", "daily_content"))
 
 # --- Initialize session state for chat ---
 if "messages" not in st.session_state:
@@ -299,19 +299,16 @@ with col2:
                 The JSON structure for each day must contain 'day', 'topic', 'details', and 'status' keys.
                 """
                 
-                response_text = ai_manager.generate_content(full_prompt)
+                new_plan = ai_manager.generate_json(full_prompt, PLAN_SCHEMA, prompt_type="plan_adjust")
                 # new
-                if not response_text:
+                if not new_plan:
                     error_message = "Sorry, I couldn't get a response from the AI. Please try again."
                     st.error(error_message)
                     st.session_state.messages.append({"role": "assistant", "content": error_message})
                 else:
-                    cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
-
                     try:
-                        # Validate and update the database
-                        json.loads(cleaned_response) # Check if it's valid JSON
-                        update_plan_content(pid, cleaned_response)
+                        # The plan is already validated against the plan schema
+                        update_plan_content(pid, json.dumps(new_plan))
                         st.success("Plan updated successfully! The new plan is shown on the left.")
                         st.rerun() # Rerun the script to show the updated plan
                     except (json.JSONDecodeError, Exception) as e:
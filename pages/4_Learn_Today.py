@@ -1,8 +1,12 @@
 import streamlit as st
-from db_functions import get_plans_by_user, add_knowledge_item, update_plan_content
-from utils import ensure_plan_selected
+from db_functions import (
+    get_plan_by_id, get_plan_days, queue_knowledge_items, queue_plan_day_status,
+    get_plan_lesson, save_plan_lesson, delete_plan_lesson, lesson_instructions_hash,
+)
+from utils import ensure_plan_selected, report_saves, track_save
 import json
 from config import get_ai_manager
+from structured_output import LEARNING_MATERIAL_SCHEMA, LESSON_CHAT_SCHEMA
 from auth_helper import require_api_key
 
 st.markdown("""
@@ -102,6 +106,8 @@ require_api_key()
 # --- Check for selected plan ---
 pid = ensure_plan_selected()
 uid = st.session_state.get('user_id', 1)
+# Report saves queued in earlier runs that have been committed (or failed) since
+report_saves()
 
 # --- AI Configuration ---
 ai_manager = get_ai_manager()
@@ -111,16 +117,12 @@ if not ai_manager.initialize():
 
 # --- Fetch plan and find today's task ---
 def get_current_plan_and_task():
-    all_plans = get_plans_by_user(uid)
-    plan = next((p for p in all_plans if p['pid'] == pid), None)
+    plan = get_plan_by_id(uid, pid, ("pid", "plan_name", "special_instructions"))
     if not plan:
         return None, None
     
-    try:
-        daily_content = json.loads(plan['daily_content'])
-        return plan, daily_content
-    except (json.JSONDecodeError, TypeError):
-        return plan, None
+    daily_content = [dict(day) for day in get_plan_days(pid)]
+    return plan, daily_content
 
 plan_data, daily_content = get_current_plan_and_task()
 
@@ -158,6 +160,21 @@ if st.session_state.viewed_day_index >= len(daily_content):
 current_day_index = st.session_state.viewed_day_index
 current_day_task = daily_content[current_day_index]
 
+# --- Read the day's lesson through the durable lesson store ---
+# A lesson generated in any earlier session is reused as long as the inputs of its
+# prompt (topic, details and special instructions) and the model are unchanged.
+lesson_hash = lesson_instructions_hash(
+    current_day_task['topic'], current_day_task['details'], plan_data['special_instructions']
+)
+if current_day_task['day'] not in st.session_state.learning_materials_cache[pid]:
+    stored_lesson = get_plan_lesson(pid, current_day_task['day'])
+    if (stored_lesson and stored_lesson['instructions_hash'] == lesson_hash
+            and stored_lesson['model'] == ai_manager.model_label):
+        try:
+            st.session_state.learning_materials_cache[pid][current_day_task['day']] = json.loads(stored_lesson['learning_material'])
+        except json.JSONDecodeError:
+            pass
+
 title_col, back_button_col = st.columns([0.8, 0.2])
 with title_col:
     st.title(f"📖 Learn: {plan_data['plan_name']}")
@@ -182,10 +199,14 @@ with nav_cols[0]:
         st.rerun()
 with nav_cols[1]:
     if st.button("✅ Mark as Complete", use_container_width=True, type="primary", disabled=(current_day_task.get('status') == 'completed' or is_generating)):
+        # Save only this day's status back to the database (committed by the write queue)
+        # and report a failure on a later run instead of waiting for the commit
+        track_save(
+            queue_plan_day_status(uid, pid, current_day_task['position'], 'completed'),
+            lambda e, day=current_day_task['day']: st.error(f"❌ Could not mark day {day} as complete: {e}"),
+        )
         # Update the status in the local copy
         daily_content[current_day_index]['status'] = 'completed'
-        # Save the updated plan back to the database
-        update_plan_content(pid, json.dumps(daily_content))
         st.toast(f"Day {current_day_task['day']} marked as complete!")
         # Move to the next pending day
         next_pending_index = next((i for i, day in enumerate(daily_content) if day.get('status') != 'completed'), current_day_index)
@@ -197,12 +218,172 @@ with nav_cols[2]:
         st.session_state.viewed_day_index += 1
         st.rerun()
 
+# --- Rendering of learning material blocks ---
+def knowledge_item_from_block(block):
+    """
+    Return (item_type, term, definition) for a concept-like block (key concepts,
+    theorems, vocabulary and grammar cards), or None for any other block.
+    """
+    block_type = block.get("type")
+    content = block.get("content")
+    if not isinstance(content, dict):
+        return None
+    if block_type == "key_concept":
+        return 'concept', content.get("term"), content.get("definition", "")
+    if block_type == "theorem":
+        return 'theorem', content.get("name"), f"{content.get('statement')}\n\n**Example:** {content.get('example')}"
+    if block_type == "vocabulary_card":
+        full_definition = f"**Part of speech:** {content.get('part_of_speech', 'N/A')}\n\n**Meaning:** {content.get('meaning', 'N/A')}\n\n**Example:** {content.get('example', 'N/A')}"
+        return 'vocabulary', content.get("word"), full_definition
+    if block_type == "grammar_card":
+        full_definition = f"**Rule of use:** {content.get('rule_of_use', 'N/A')}\n\n**Meaning:** {content.get('meaning', 'N/A')}\n\n**Example:** {content.get('example', 'N/A')}"
+        return 'grammar', content.get("grammar_point"), full_definition
+    return None
+
+
+def save_knowledge_items(items):
+    """
+    Save (item_type, term, definition) tuples to the knowledge base through the write
+    queue without waiting for the commit. Failures, and items skipped because they
+    were already saved, are reported on a later run.
+    """
+    def report_skipped(saved):
+        skipped = len(items) - saved
+        if skipped and len(items) == 1:
+            st.toast(f"'{items[0][1]}' was already in your knowledge base.")
+        elif skipped:
+            st.toast(f"{skipped} of {len(items)} items were already in your knowledge base.")
+
+    track_save(
+        queue_knowledge_items(uid, pid, items),
+        lambda e: st.error(f"❌ Could not save to your knowledge base: {e}"),
+        report_skipped,
+    )
+    if len(items) == 1:
+        st.toast(f"✅ Saved '{items[0][1]}'!")
+    else:
+        st.toast(f"✅ Saved {len(items)} items to your knowledge base.")
+
+
+def save_knowledge_block(block):
+    save_knowledge_items([knowledge_item_from_block(block)])
+
+
+def render_block(i, block, interactive=True):
+    """Render one learning material block. Save buttons are only shown when interactive."""
+    block_type = block.get("type")
+    content = block.get("content")
+
+    if block_type == "paragraph":
+        st.markdown(content)
+    
+    elif block_type == "key_concept" and isinstance(content, dict):
+        with st.container(border=True):
+            st.subheader(content.get("term", "Key Concept"))
+            st.markdown(content.get("definition", ""))
+            if content.get("example"):
+                st.markdown(f"**Example:** {content.get('example')}")
+            if interactive and st.button("Save to Knowledge Base", key=f"save_concept_{i}"):
+                save_knowledge_block(block)
+
+    elif block_type == "theorem" and isinstance(content, dict):
+        with st.container(border=True):
+            st.subheader(content.get("name", "Theorem/Rule"))
+            st.markdown(content.get("statement", ""))
+            if content.get("example"):
+                st.markdown(f"**Example:** {content.get('example')}")
+            if interactive and st.button("Save to Knowledge Base", key=f"save_theorem_{i}"):
+                save_knowledge_block(block)
+
+    elif block_type == "vocabulary_card" and isinstance(content, dict):
+        with st.container(border=True):
+            st.subheader(content.get("word", "Vocabulary"))
+            st.markdown(f"**Part of speech:** {content.get('part_of_speech', 'N/A')}")
+            st.markdown(f"**Meaning:** {content.get('meaning', 'N/A')}")
+            if content.get("example"):
+                st.markdown(f"**Example:** {content.get('example')}")
+            if interactive and st.button("Save to Knowledge Base", key=f"save_vocab_{i}"):
+                save_knowledge_block(block)
+
+    elif block_type == "grammar_card" and isinstance(content, dict):
+        with st.container(border=True):
+            st.subheader(content.get("grammar_point", "Grammar Rule"))
+            st.markdown(f"**Rule of use:** {content.get('rule_of_use', 'N/A')}")
+            st.markdown(f"**Meaning:** {content.get('meaning', 'N/A')}")
+            if content.get("example"):
+                st.markdown(f"**Example:** {content.get('example')}")
+            if interactive and st.button("Save to Knowledge Base", key=f"save_grammar_{i}"):
+                save_knowledge_block(block)
+
+    elif block_type == "latex_equation" and isinstance(content, dict):
+        with st.container(border=True):
+            equation_title = content.get("title", "Equation")
+            st.subheader(equation_title)
+            st.latex(content.get("equation", ""))
+            if content.get("explanation"):
+                # Use latex for explanation if it might contain math symbols
+                st.markdown(content.get("explanation", ""))
+            if interactive and st.button("Save to Knowledge Base", key=f"save_equation_{i}"):
+                # Format the equation and explanation for saving
+                full_definition = f"```latex\n{content.get('equation', '')}\n```\n\n**Explanation:**\n{content.get('explanation', '')}"
+                save_knowledge_items([('equation', equation_title, full_definition)])
+    
+
+    elif block_type == "table" and isinstance(content, dict):
+        import pandas as pd
+        with st.container(border=True):
+            table_title = content.get("title", "Data Table")
+            st.subheader(table_title)
+            headers = content.get("headers", [])
+            # Defensively handle duplicate headers from the AI
+            unique_headers = []
+            for h in headers:
+                if h not in unique_headers:
+                    unique_headers.append(h)
+            
+            # Ensure all rows have the same number of columns as the headers
+            num_columns = len(unique_headers)
+            sanitized_rows = [row[:num_columns] for row in content.get("rows", [])]
+            df = pd.DataFrame(sanitized_rows, columns=unique_headers)
+            st.table(df)
+            if interactive and st.button("Save to Knowledge Base", key=f"save_table_{i}"):
+                # Manually create a markdown table to avoid the 'tabulate' dependency.
+                headers_str = "| " + " | ".join(df.columns) + " |"
+                separator_str = "| " + " | ".join(["---"] * len(df.columns)) + " |"
+                rows_str = "\n".join(["| " + " | ".join(map(str, row)) + " |" for row in df.itertuples(index=False)])
+                markdown_table = f"{headers_str}\n{separator_str}\n{rows_str}"
+                save_knowledge_items([('table', table_title, markdown_table)])
+
+    elif block_type == "code_example" and isinstance(content, dict):
+        with st.container(border=True):
+            code_title = content.get("title", "Code Example")
+            st.subheader(code_title)
+            st.code(content.get("code", ""), language=content.get("language", "plaintext"))
+            if content.get("explanation"):
+                st.markdown(content.get("explanation", ""))
+            if interactive and st.button("Save to Knowledge Base", key=f"save_code_{i}"):
+                # Format the code and explanation for saving
+                full_definition = f"```\n{content.get('code', '')}\n```\n\n**Explanation:**\n{content.get('explanation', 'No explanation provided.')}"
+                save_knowledge_items([('code', code_title, full_definition)])
+
+    st.write("") # Adds a little vertical space
+
+
 # --- Layout: Learning material on the left, Chat on the right ---
 col1, col2 = st.columns([0.5, 0.5], gap="large")
 
 # --- Left Column: Generate and display learning material ---
 with col1:
-    st.header(f"Day {current_day_task['day']}: {current_day_task['topic']}")
+    header_col, regenerate_col = st.columns([0.75, 0.25])
+    with header_col:
+        st.header(f"Day {current_day_task['day']}: {current_day_task['topic']}")
+    with regenerate_col:
+        if st.button("🔄 Regenerate", use_container_width=True, disabled=is_generating, help="Generate a new lesson for this day"):
+            delete_plan_lesson(pid, current_day_task['day'])
+            st.session_state.learning_materials_cache[pid].pop(current_day_task['day'], None)
+            # Skip the AI response cache too, otherwise the same lesson would come back
+            st.session_state.regenerate_lesson = (pid, current_day_task['day'])
+            st.rerun()
     with st.container(height=700): # This makes the container scrollable
         # Use the cache if content is already generated for this day
         if current_day_task['day'] in st.session_state.learning_materials_cache[pid]:
@@ -259,129 +440,44 @@ with col1:
                   ]
                 }}
                 """
-                response = ai_manager.generate_content(prompt)
-                if not response:
-                    st.error("AI returned no content for learning material.")
+                # Stream the lesson in JSON mode and render each block as soon as it is complete
+                regenerate = st.session_state.pop('regenerate_lesson', None) == (pid, current_day_task['day'])
+                lesson_stream = ai_manager.stream_json(
+                    prompt, LEARNING_MATERIAL_SCHEMA, array_key="learning_material",
+                    use_cache=not regenerate, prompt_type="lesson",
+                )
+                for i, block in enumerate(lesson_stream):
+                    render_block(i, block, interactive=False)
+                learning_material = lesson_stream.document
+                if not learning_material:
+                    # The stream failed: fall back to a regular call, which retries, regenerates
+                    # once and shows the error if there still is one
+                    learning_material = ai_manager.generate_json(
+                        prompt, LEARNING_MATERIAL_SCHEMA, use_cache=not regenerate, prompt_type="lesson"
+                    )
+                if not learning_material:
                     learning_material = {"learning_material": []}
                 else:
-                    cleaned_response = response.replace("```json", "").replace("```", "").strip()
-                    # A more robust way to handle backslashes for JSON parsing.
-                    # This escapes backslashes that are not already part of a valid escape sequence.
-                    import re
-                    learning_material = json.loads(re.sub(r'(?<!\\)\\(?!["\\/bfnrtu])', r'\\\\', cleaned_response))
+                    # Persist the lesson so other sessions and devices don't generate it again
+                    save_plan_lesson(
+                        pid, current_day_task['day'], json.dumps(learning_material, ensure_ascii=False),
+                        lesson_hash, ai_manager.model_label,
+                    )
                 # Save to cache
                 st.session_state.learning_materials_cache[pid][current_day_task['day']] = learning_material
                 # Force a rerun to re-evaluate the 'is_generating' flag and enable the buttons.
                 st.rerun()
 
         for i, block in enumerate(learning_material.get("learning_material", [])):
-            block_type = block.get("type")
-            content = block.get("content")
-
-            if block_type == "paragraph":
-                st.markdown(content)
-            
-            elif block_type == "key_concept" and isinstance(content, dict):
-                with st.container(border=True):
-                    st.subheader(content.get("term", "Key Concept"))
-                    st.markdown(content.get("definition", ""))
-                    if content.get("example"):
-                        st.markdown(f"**Example:** {content.get('example')}")
-                    if st.button("Save to Knowledge Base", key=f"save_concept_{i}"):
-                        full_definition = f"{content.get('definition')}\n\n**Example:** {content.get('example')}"
-                        add_knowledge_item(uid, pid, 'concept', content.get("term"), content.get("definition", ""))
-                        st.toast(f"✅ Saved '{content.get('term')}'!")
-
-            elif block_type == "theorem" and isinstance(content, dict):
-                with st.container(border=True):
-                    st.subheader(content.get("name", "Theorem/Rule"))
-                    st.markdown(content.get("statement", ""))
-                    if content.get("example"):
-                        st.markdown(f"**Example:** {content.get('example')}")
-                    if st.button("Save to Knowledge Base", key=f"save_theorem_{i}"):
-                        full_definition = f"{content.get('statement')}\n\n**Example:** {content.get('example')}"
-                        add_knowledge_item(uid, pid, 'theorem', content.get("name"), full_definition)
-                        st.toast(f"✅ Saved '{content.get('name')}'!")
-
-            elif block_type == "vocabulary_card" and isinstance(content, dict):
-                with st.container(border=True):
-                    st.subheader(content.get("word", "Vocabulary"))
-                    st.markdown(f"**Part of speech:** {content.get('part_of_speech', 'N/A')}")
-                    st.markdown(f"**Meaning:** {content.get('meaning', 'N/A')}")
-                    if content.get("example"):
-                        st.markdown(f"**Example:** {content.get('example')}")
-                    if st.button("Save to Knowledge Base", key=f"save_vocab_{i}"):
-                        full_definition = f"**Part of speech:** {content.get('part_of_speech', 'N/A')}\n\n**Meaning:** {content.get('meaning', 'N/A')}\n\n**Example:** {content.get('example', 'N/A')}"
-                        add_knowledge_item(uid, pid, 'vocabulary', content.get("word"), full_definition)
-                        st.toast(f"✅ Saved '{content.get('word')}'!")
-
-            elif block_type == "grammar_card" and isinstance(content, dict):
-                with st.container(border=True):
-                    st.subheader(content.get("grammar_point", "Grammar Rule"))
-                    st.markdown(f"**Rule of use:** {content.get('rule_of_use', 'N/A')}")
-                    st.markdown(f"**Meaning:** {content.get('meaning', 'N/A')}")
-                    if content.get("example"):
-                        st.markdown(f"**Example:** {content.get('example')}")
-                    if st.button("Save to Knowledge Base", key=f"save_grammar_{i}"):
-                        full_definition = f"**Rule of use:** {content.get('rule_of_use', 'N/A')}\n\n**Meaning:** {content.get('meaning', 'N/A')}\n\n**Example:** {content.get('example', 'N/A')}"
-                        add_knowledge_item(uid, pid, 'grammar', content.get("grammar_point"), full_definition)
-                        st.toast(f"✅ Saved '{content.get('grammar_point')}'!")
-
-            elif block_type == "latex_equation" and isinstance(content, dict):
-                with st.container(border=True):
-                    equation_title = content.get("title", "Equation")
-                    st.subheader(equation_title)
-                    st.latex(content.get("equation", ""))
-                    if content.get("explanation"):
-                        # Use latex for explanation if it might contain math symbols
-                        st.markdown(content.get("explanation", ""))
-                    if st.button("Save to Knowledge Base", key=f"save_equation_{i}"):
-                        # Format the equation and explanation for saving
-                        full_definition = f"```latex\n{content.get('equation', '')}\n```\n\n**Explanation:**\n{content.get('explanation', '')}"
-                        add_knowledge_item(uid, pid, 'equation', equation_title, full_definition)
-                        st.toast(f"✅ Saved '{equation_title}'!")
-            
+            render_block(i, block)
 
-            elif block_type == "table" and isinstance(content, dict):
-                import pandas as pd
-                with st.container(border=True):
-                    table_title = content.get("title", "Data Table")
-                    st.subheader(table_title)
-                    headers = content.get("headers", [])
-                    # Defensively handle duplicate headers from the AI
-                    unique_headers = []
-                    for h in headers:
-                        if h not in unique_headers:
-                            unique_headers.append(h)
-                    
-                    # Ensure all rows have the same number of columns as the headers
-                    num_columns = len(unique_headers)
-                    sanitized_rows = [row[:num_columns] for row in content.get("rows", [])]
-                    df = pd.DataFrame(sanitized_rows, columns=unique_headers)
-                    st.table(df)
-                    if st.button("Save to Knowledge Base", key=f"save_table_{i}"):
-                        # Manually create a markdown table to avoid the 'tabulate' dependency.
-                        headers_str = "| " + " | ".join(df.columns) + " |"
-                        separator_str = "| " + " | ".join(["---"] * len(df.columns)) + " |"
-                        rows_str = "\n".join(["| " + " | ".join(map(str, row)) + " |" for row in df.itertuples(index=False)])
-                        markdown_table = f"{headers_str}\n{separator_str}\n{rows_str}"
-                        add_knowledge_item(uid, pid, 'table', table_title, markdown_table)
-                        st.toast(f"✅ Saved '{table_title}'!")
-
-            elif block_type == "code_example" and isinstance(content, dict):
-                with st.container(border=True):
-                    code_title = content.get("title", "Code Example")
-                    st.subheader(code_title)
-                    st.code(content.get("code", ""), language=content.get("language", "plaintext"))
-                    if content.get("explanation"):
-                        st.markdown(content.get("explanation", ""))
-                    if st.button("Save to Knowledge Base", key=f"save_code_{i}"):
-                        # Format the code and explanation for saving
-                        full_definition = f"```\n{content.get('code', '')}\n```\n\n**Explanation:**\n{content.get('explanation', 'No explanation provided.')}"
-                        add_knowledge_item(uid, pid, 'code', code_title, full_definition)
-                        st.toast(f"✅ Saved '{code_title}'!")
-
-            st.write("") # Adds a little vertical space
+    # --- Save every concept of the lesson in one transaction ---
+    concept_items = [
+        item for item in map(knowledge_item_from_block, learning_material.get("learning_material", []))
+        if item and item[1]
+    ]
+    if concept_items and st.button(f"💾 Save all key concepts ({len(concept_items)})", use_container_width=True):
+        save_knowledge_items(concept_items)
 
 # --- Right Column: Chat Interface ---
 with col2:
@@ -460,28 +556,27 @@ with col2:
                 {instruction_prompt_part}
                 """
                 
-                response_text = ai_manager.generate_content(full_prompt)
-                if not response_text:
+                # A reply that isn't usable JSON is shown as a plain conversational answer
+                ai_response = ai_manager.generate_json(
+                    full_prompt, LESSON_CHAT_SCHEMA, prompt_type="lesson_chat",
+                    text_fallback=lambda text: {"action": "answer", "content": text},
+                )
+                if not ai_response:
                     st.error("AI returned no response.")
                     st.session_state.learn_messages.append({"role": "assistant", "content": "AI returned no response."})
                 else:
-                    try:
-                        cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
-                        # A more robust way to handle backslashes for JSON parsing.
-                        # This escapes backslashes that are not already part of a valid escape sequence.
-                        import re
-                        ai_response = json.loads(re.sub(r'(?<!\\)\\(?!["\\/bfnrtu])', r'\\\\', cleaned_response))
-                        action = ai_response.get("action")
-                        content = ai_response.get("content")
-
-                        if action == "regenerate" and "learning_material" in content:
-                            st.session_state.learning_materials_cache[pid][current_day_task['day']] = content
-                            st.session_state.learn_messages.append({"role": "assistant", "content": "I've updated the learning material on the left based on your request!"})
-                            st.rerun()
-                        else: # Default to "answer"
-                            answer = content if isinstance(content, str) else content.get("answer", "I'm not sure how to respond to that.")
-                            st.markdown(answer)
-                            st.session_state.learn_messages.append({"role": "assistant", "content": answer})
-                    except (json.JSONDecodeError, TypeError):
-                        st.markdown(response_text) # Fallback for non-JSON response
-                        st.session_state.learn_messages.append({"role": "assistant", "content": response_text})
\ No newline at end of file
+                    action = ai_response.get("action")
+                    content = ai_response.get("content")
+
+                    if action == "regenerate" and isinstance(content, dict) and "learning_material" in content:
+                        st.session_state.learning_materials_cache[pid][current_day_task['day']] = content
+                        save_plan_lesson(
+                            pid, current_day_task['day'], json.dumps(content, ensure_ascii=False),
+                            lesson_hash, ai_manager.model_label,
+                        )
+                        st.session_state.learn_messages.append({"role": "assistant", "content": "I've updated the learning material on the left based on your request!"})
+                        st.rerun()
+                    else: # Default to "answer"
+                        answer = content if isinstance(content, str) else content.get("answer", "I'm not sure how to respond to that.")
+                        st.markdown(answer)
+                        st.session_state.learn_messages.append({"role": "assistant", "content": answer})
\ No newline at end of file
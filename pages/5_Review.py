@@ -1,5 +1,8 @@
 import streamlit as st
-from db_functions import get_knowledge_items_by_plan, get_plans_by_user, delete_knowledge_item
+from db_functions import (
+    get_knowledge_items_page, count_knowledge_items_by_plan, get_plan_by_id, delete_knowledge_item,
+    search_knowledge_items, get_due_cards, count_due_cards, grade_card,
+)
 from utils import ensure_plan_selected
 import re
 
@@ -136,11 +139,12 @@ pid = ensure_plan_selected()
 uid = st.session_state.get('user_id', 1)
 
 # --- Fetch Data ---
-review_items = get_knowledge_items_by_plan(uid, pid)
+# Only the card on screen is read; the deck is walked in item_id order (keyset pagination)
+REVIEW_COLUMNS = ("item_id", "item_type", "term", "definition")
+total_cards = count_knowledge_items_by_plan(uid, pid)
 
 # Fetch the plan name for the title
-all_plans = get_plans_by_user(uid)
-current_plan = next((plan for plan in all_plans if plan['pid'] == pid), None)
+current_plan = get_plan_by_id(uid, pid, ("pid", "plan_name"))
 plan_name = current_plan['plan_name'] if current_plan else "your plan"
 
 title_col, back_button_col = st.columns([0.8, 0.2])
@@ -153,75 +157,144 @@ with back_button_col:
     st.markdown('</div>', unsafe_allow_html=True)
 
 # --- Handle No Items ---
-if not review_items:
+if not total_cards:
     st.info("You haven't saved any knowledge items for this plan yet.")
     st.write("Go to the 'Learn Today' section to start saving concepts!")
     st.page_link("pages/2_Plan_Details.py", label="Back to Plan Dashboard", icon="⬅️")
     st.stop()
 
 # --- Initialize Session State for Flashcards ---
-if 'review_index' not in st.session_state:
-    st.session_state.review_index = 0
 if 'card_flipped' not in st.session_state:
     st.session_state.card_flipped = False
 
 # Reset if user navigates away and comes back to a different plan's review
-if st.session_state.review_index >= len(review_items):
-    st.session_state.review_index = 0
-
-# --- Flashcard Display ---
-total_cards = len(review_items)
-current_index = st.session_state.review_index
-current_item = review_items[current_index]
-
-st.progress((current_index + 1) / total_cards, text=f"Card {current_index + 1} of {total_cards}")
-
-with st.container(height=350, border=True):
-    # Display the front of the card (the term)
-    st.subheader(current_item['term'])
-    st.divider()
-    # Display the back of the card (the definition) if flipped
-    if st.session_state.card_flipped:
-        # Check the type of item to render it correctly
-        if current_item['item_type'] == 'equation':
-            # For equations, parse the definition to separate the LaTeX and explanation
-            definition_text = current_item['definition']
-            # Use regex to find the latex block and the explanation
-            match = re.search(r"```latex\n(.*?)\n```\n\n\*\*Explanation:\*\*\n(.*)", definition_text, re.DOTALL)
-            if match:
-                equation = match.group(1)
-                explanation = match.group(2)
-                st.latex(equation)
-                st.markdown(explanation)
+if st.session_state.get('review_pid') != pid:
+    st.session_state.review_pid = pid
+    st.session_state.review_item_id = None
+    st.session_state.reviewed_count = 0
+
+
+def render_card(item):
+    with st.container(height=350, border=True):
+        # Display the front of the card (the term)
+        st.subheader(item['term'])
+        st.divider()
+        # Display the back of the card (the definition) if flipped
+        if st.session_state.card_flipped:
+            # Check the type of item to render it correctly
+            if item['item_type'] == 'equation':
+                # For equations, parse the definition to separate the LaTeX and explanation
+                definition_text = item['definition']
+                # Use regex to find the latex block and the explanation
+                match = re.search(r"```latex\n(.*?)\n```\n\n\*\*Explanation:\*\*\n(.*)", definition_text, re.DOTALL)
+                if match:
+                    equation = match.group(1)
+                    explanation = match.group(2)
+                    st.latex(equation)
+                    st.markdown(explanation)
+                else:
+                    st.markdown(definition_text) # Fallback
             else:
-                st.markdown(definition_text) # Fallback
+                st.markdown(item['definition'])
+
+
+review_mode = st.radio("Mode", ["📅 Due for review", "📚 Browse all"], horizontal=True, label_visibility="collapsed")
+
+if review_mode == "📅 Due for review":
+    # --- Spaced Repetition: only the cards due now are read, most overdue first ---
+    # Read the card before counting, so a card graded or deleted in between cannot leave nothing to show
+    due_cards = get_due_cards(uid, pid, limit=1)
+    reviewed_count = st.session_state.get('reviewed_count', 0)
+    if not due_cards:
+        st.success(f"🎉 No cards are due right now ({reviewed_count} reviewed this session). Come back later!")
+    else:
+        current_item = due_cards[0]
+        due_count = max(count_due_cards(uid, pid), 1)
+        st.progress(
+            reviewed_count / (reviewed_count + due_count),
+            text=f"{due_count} card(s) due · {reviewed_count} reviewed this session",
+        )
+        render_card(current_item)
+
+        if not st.session_state.card_flipped:
+            if st.button("🔄 Show Answer", use_container_width=True, type="primary"):
+                st.session_state.card_flipped = True
+                st.rerun()
         else:
-            st.markdown(current_item['definition'])
-
-# --- Control Buttons ---
-col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
-
-with col1:
-    if st.button("⬅️ Previous", use_container_width=True, disabled=current_index <= 0):
-        st.session_state.review_index -= 1
-        st.session_state.card_flipped = False # Reset flip state
-        st.rerun()
-
-with col2:
-    if st.button("🔄 Flip Card", use_container_width=True, type="primary"):
-        st.session_state.card_flipped = not st.session_state.card_flipped
-        st.rerun()
-
-with col3:
-    if st.button("Next ➡️", use_container_width=True, disabled=current_index >= total_cards - 1):
-        st.session_state.review_index += 1
-        st.session_state.card_flipped = False # Reset flip state
-        st.rerun()
-
-with col4:
-    if st.button("🗑️ Delete", use_container_width=True):
-        delete_knowledge_item(current_item['item_id'])
-        st.toast(f"Deleted '{current_item['term']}'")
-        # After deleting, we don't increment the index, as the list will shorten
-        # and the next item will shift into the current index.
-        st.rerun()
\ No newline at end of file
+            # How well the card was remembered decides when it is shown again
+            grade_cols = st.columns(4)
+            for grade_col, (grade, label) in zip(grade_cols, [
+                ("again", "❌ Again"), ("hard", "😓 Hard"), ("good", "🙂 Good"), ("easy", "😎 Easy"),
+            ]):
+                with grade_col:
+                    if st.button(label, use_container_width=True):
+                        grade_card(uid, current_item['item_id'], grade)
+                        st.session_state.reviewed_count = reviewed_count + 1
+                        st.session_state.card_flipped = False
+                        st.rerun()
+else:
+    # --- Flashcard Display ---
+    # Load the current card and the one after it (to know whether there is a next card)
+    review_item_id = st.session_state.review_item_id
+    cards = get_knowledge_items_page(
+        uid, pid, after_item_id=review_item_id - 1 if review_item_id is not None else None,
+        limit=2, columns=REVIEW_COLUMNS,
+    )
+    if not cards:
+        # The last card was deleted: step back to the one before it
+        cards = get_knowledge_items_page(uid, pid, before_item_id=review_item_id, limit=1, columns=REVIEW_COLUMNS)
+    if not cards:
+        # Every card was deleted since the count above
+        st.session_state.review_item_id = None
+        st.info("You haven't saved any knowledge items for this plan yet.")
+        st.stop()
+    current_item = cards[0]
+    current_index = count_knowledge_items_by_plan(uid, pid, before_item_id=current_item['item_id'])
+
+    total_cards = max(total_cards, current_index + 1)
+    st.progress((current_index + 1) / total_cards, text=f"Card {current_index + 1} of {total_cards}")
+
+    render_card(current_item)
+
+    # --- Control Buttons ---
+    col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
+
+    with col1:
+        if st.button("⬅️ Previous", use_container_width=True, disabled=current_index <= 0):
+            previous_card = get_knowledge_items_page(uid, pid, before_item_id=current_item['item_id'], limit=1, columns=("item_id",))
+            if previous_card:
+                st.session_state.review_item_id = previous_card[0]['item_id']
+            st.session_state.card_flipped = False # Reset flip state
+            st.rerun()
+
+    with col2:
+        if st.button("🔄 Flip Card", use_container_width=True, type="primary"):
+            st.session_state.card_flipped = not st.session_state.card_flipped
+            st.rerun()
+
+    with col3:
+        if st.button("Next ➡️", use_container_width=True, disabled=len(cards) < 2):
+            st.session_state.review_item_id = cards[1]['item_id']
+            st.session_state.card_flipped = False # Reset flip state
+            st.rerun()
+
+    with col4:
+        if st.button("🗑️ Delete", use_container_width=True):
+            delete_knowledge_item(uid, current_item['item_id'])
+            st.toast(f"Deleted '{current_item['term']}'")
+            # After deleting, we keep the same position: the next card (the first one
+            # after the deleted item_id) takes its place.
+            st.session_state.review_item_id = current_item['item_id']
+            st.rerun()
+
+# --- Search ---
+st.divider()
+search_query = st.text_input("🔎 Search your knowledge base", placeholder="Search terms and definitions...")
+if search_query:
+    only_this_plan = st.checkbox("Only this plan", value=True)
+    results = search_knowledge_items(uid, search_query, pid=pid if only_this_plan else None, limit=20)
+    if not results:
+        st.info("No matching knowledge items.")
+    for item in results:
+        with st.expander(f"{item['term']} ({item['item_type']})"):
+            st.markdown(item['definition'])
@@ -1,8 +1,9 @@
 import streamlit as st
-from db_functions import get_knowledge_items_by_plan, get_plans_by_user
+from db_functions import count_knowledge_items_by_plan, iter_knowledge_items_by_plan, get_plan_by_id, PLAN_SUMMARY_COLUMNS
 from utils import ensure_plan_selected
 from auth_helper import require_api_key
 from config import get_ai_manager
+from structured_output import QUIZ_SCHEMA, StructuredOutputError, parse_structured
 import json
 
 st.markdown("""
@@ -136,9 +137,9 @@ if not ai_manager.initialize():
     st.stop()
 
 # --- Fetch Data ---
-knowledge_items = get_knowledge_items_by_plan(uid, pid)
-all_plans = get_plans_by_user(uid)
-current_plan = next((plan for plan in all_plans if plan['pid'] == pid), None)
+# The items themselves are only read when a quiz is generated
+knowledge_item_count = count_knowledge_items_by_plan(uid, pid)
+current_plan = get_plan_by_id(uid, pid, PLAN_SUMMARY_COLUMNS)
 plan_name = current_plan['plan_name'] if current_plan else "Exercise"
 
 title_col, back_button_col = st.columns([0.8, 0.2])
@@ -152,7 +153,7 @@ with back_button_col:
 
 
 # --- Handle No Items ---
-if not knowledge_items:
+if not knowledge_item_count:
     st.info("You haven't saved any knowledge items for this plan yet.")
     st.write("Go to the 'Learn Today' section to save concepts before you can practice!")
     st.stop()
@@ -178,7 +179,7 @@ def format_knowledge_for_ai(items):
         formatted_items.append(f"- {term}: {definition}")
     return "\n".join(formatted_items)
 
-def generate_exercises(items):
+def generate_exercises(items, use_cache=True):
     context = format_knowledge_for_ai(items)
     
     special_instructions = current_plan['special_instructions'] if current_plan and 'special_instructions' in current_plan.keys() else None
@@ -212,11 +213,31 @@ def generate_exercises(items):
     ---
     Generate the JSON quiz now.
     """
-    response = ai_manager.generate_content(prompt, show_spinner=True, spinner_text="🤖 Generating your exercise...")
-    if not response:
+    quiz = ai_manager.generate_json(prompt, QUIZ_SCHEMA, show_spinner=True, spinner_text="🤖 Generating your exercise...", use_cache=use_cache, prompt_type="quiz")
+    if not quiz:
         raise Exception("AI returned no content")
-    cleaned_response = response.replace("```json", "").replace("```", "").strip()
-    return json.loads(cleaned_response)
+    return quiz
+
+def build_check_prompt(question, user_answer):
+    """Builds the grading prompt for one answered question."""
+    return f"""
+    You are a helpful and encouraging tutor. A student has submitted an answer for a question.
+    Your task is to evaluate it and provide feedback.
+
+    Question Details:
+    {json.dumps(question, indent=2)}
+
+    Student's Answer:
+    {json.dumps(user_answer, indent=2)}
+
+    Please evaluate the student's answer.
+    - If it is correct, congratulate them and briefly explain why it's correct.
+    - If it is incorrect, gently point out the mistake and provide a clear explanation of the correct answer.
+    - Keep your response concise and encouraging.
+    """
+
+# Widget key prefix used for each question type's answer input
+ANSWER_KEY_PREFIXES = {"short_answer": "sa", "multiple_choice": "mc", "fill_in_the_blank": "fb"}
 
 # --- Initialize session state for exercises and chat ---
 # This block ensures that if the user switches plans, a new set of questions is generated.
@@ -239,13 +260,18 @@ col1, col2 = st.columns([0.6, 0.4], gap="large")
 # --- Left Column: Problems ---
 with col1:
     st.header("Your Questions")
-    if st.button("Generate New Questions"):
+    regenerate = st.button("Generate New Questions")
+    if regenerate:
         st.session_state.exercise_questions = None # Clear old questions
         st.session_state.exercise_feedback = {} # Clear old feedback
 
     if not st.session_state.exercise_questions:
         with st.spinner("🤖 Generating your exercise..."):
-            st.session_state.exercise_questions = generate_exercises(knowledge_items)
+            # An explicit request for new questions must skip the response cache
+            st.session_state.exercise_questions = generate_exercises(
+                iter_knowledge_items_by_plan(uid, pid, columns=("item_type", "term", "definition")),
+                use_cache=not regenerate,
+            )
 
     questions = st.session_state.exercise_questions.get("questions", [])
 
@@ -273,23 +299,8 @@ with col1:
                 if st.button("Check Answer", key=f"check_{i}"):
                     if user_answer:
                         with st.spinner("🤖 Checking your answer..."):
-                            # Prepare prompt for AI
-                            check_prompt = f"""
-                            You are a helpful and encouraging tutor. A student has submitted an answer for a question.
-                            Your task is to evaluate it and provide feedback.
-
-                            Question Details:
-                            {json.dumps(q, indent=2)}
-
-                            Student's Answer:
-                            {json.dumps(user_answer, indent=2)}
-
-                            Please evaluate the student's answer.
-                            - If it is correct, congratulate them and briefly explain why it's correct.
-                            - If it is incorrect, gently point out the mistake and provide a clear explanation of the correct answer.
-                            - Keep your response concise and encouraging.
-                            """
-                            response = ai_manager.generate_content(check_prompt, show_spinner=True, spinner_text="🤖 Checking your answer...")
+                            check_prompt = build_check_prompt(q, user_answer)
+                            response = ai_manager.generate_content(check_prompt, show_spinner=True, spinner_text="🤖 Checking your answer...", prompt_type="grade")
                             st.session_state.exercise_feedback[i] = response or "No feedback returned."
                     else:
                         st.session_state.exercise_feedback[i] = "Please provide an answer before checking."
@@ -307,6 +318,27 @@ with col1:
 
                 st.divider()
 
+            # Grade every answered question at once; the calls run concurrently.
+            if st.button("Check All Answers", type="primary"):
+                answered = []
+                for i, q in enumerate(questions):
+                    prefix = ANSWER_KEY_PREFIXES.get(q.get("type"))
+                    user_answer = st.session_state.get(f"{prefix}_{i}") if prefix else None
+                    if user_answer:
+                        answered.append((i, build_check_prompt(q, user_answer)))
+                if not answered:
+                    st.warning("Please answer at least one question before checking.")
+                else:
+                    responses = ai_manager.generate_many(
+                        [check_prompt for _, check_prompt in answered],
+                        show_spinner=True,
+                        spinner_text="🤖 Checking your answers...",
+                        prompt_type="grade",
+                    )
+                    for (i, _), response in zip(answered, responses):
+                        st.session_state.exercise_feedback[i] = response or "No feedback returned."
+                    st.rerun()
+
 # --- Right Column: Chat Interface ---
 with col2:
     st.header("AI Assistant")
@@ -340,7 +372,7 @@ with col2:
                 {current_questions_json}
                 """
 
-                response = ai_manager.generate_content(full_prompt, show_spinner=True, spinner_text="🤖 Thinking...")
+                response = ai_manager.generate_content(full_prompt, show_spinner=True, spinner_text="🤖 Thinking...", prompt_type="quiz_chat")
                 if not response:
                     st.session_state.exercise_messages.append({"role": "assistant", "content": "AI returned no response."})
                     st.markdown("AI returned no response.")
@@ -351,13 +383,11 @@ with col2:
                 # Check if the AI returned a new JSON to replace the questions
                 if answer:
                     try:
-                        cleaned_response = answer.strip().replace("```json", "").replace("```", "")
-                        new_questions = json.loads(cleaned_response)
-                        if "questions" in new_questions:
-                            st.session_state.exercise_questions = new_questions
-                            st.session_state.exercise_messages.append({"role": "assistant", "content": "I've updated the questions for you! They are now shown on the left."})
-                            st.rerun()
-                    except (json.JSONDecodeError, TypeError):
+                        new_questions, _ = parse_structured(answer, QUIZ_SCHEMA)
+                        st.session_state.exercise_questions = new_questions
+                        st.session_state.exercise_messages.append({"role": "assistant", "content": "I've updated the questions for you! They are now shown on the left."})
+                        st.rerun()
+                    except StructuredOutputError:
                         # The response was not a valid JSON, so treat it as a conversational answer
                         st.session_state.exercise_messages.append({"role": "assistant", "content": answer})
                         st.markdown(answer)
\ No newline at end of file
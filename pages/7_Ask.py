@@ -1,9 +1,9 @@
 import streamlit as st
-from db_functions import get_knowledge_items_by_plan, get_plans_by_user, add_knowledge_item
-from utils import ensure_plan_selected
+from db_functions import iter_knowledge_items_by_plan, get_plan_by_id, queue_knowledge_items, PLAN_SUMMARY_COLUMNS
+from utils import ensure_plan_selected, report_saves, track_save
 from config import get_ai_manager
+from structured_output import ASK_SCHEMA
 import re
-import json
 from auth_helper import require_api_key
 
 st.markdown("""
@@ -129,6 +129,8 @@ require_api_key()
 # --- Check for selected plan ---
 pid = ensure_plan_selected()
 uid = st.session_state.get('user_id', 1)
+# Report saves queued in earlier runs that have been committed (or failed) since
+report_saves()
 
 # --- AI Configuration ---
 ai_manager = get_ai_manager()
@@ -137,9 +139,7 @@ if not ai_manager.initialize():
     st.stop()
 
 # --- Fetch Data for Context ---
-knowledge_items = get_knowledge_items_by_plan(uid, pid)
-all_plans = get_plans_by_user(uid)
-current_plan = next((plan for plan in all_plans if plan['pid'] == pid), None)
+current_plan = get_plan_by_id(uid, pid, PLAN_SUMMARY_COLUMNS)
 plan_name = current_plan['plan_name'] if current_plan else "your plan"
 
 title_col, back_button_col = st.columns([0.8, 0.2])
@@ -209,7 +209,16 @@ with col1:
             if st.button("Add to Knowledge Base", use_container_width=True):
                 # The definition is already formatted correctly when placed on the blackboard
                 # The 'item_type' is also preserved
-                add_knowledge_item(uid, pid, item_type, item['term'], definition_text)
+                # Committed by the write queue; the outcome is reported on a later run
+                def report_duplicate(saved, term=item['term']):
+                    if not saved:
+                        st.toast(f"'{term}' was already in your knowledge base.")
+
+                track_save(
+                    queue_knowledge_items(uid, pid, [(item_type, item['term'], definition_text)]),
+                    lambda e, term=item['term']: st.error(f"❌ Could not save '{term}' to your knowledge base: {e}"),
+                    report_duplicate,
+                )
                 st.toast(f"✅ Saved '{item['term']}'!")
                 st.session_state.blackboard_item = None # Clear after saving
         else:
@@ -248,7 +257,9 @@ with col2:
                         formatted_items.append(f"- {term}: {definition}")
                     return "\n".join(formatted_items)
                 # Build context from saved knowledge
-                knowledge_context = format_knowledge_for_ai(knowledge_items)
+                knowledge_context = format_knowledge_for_ai(
+                    iter_knowledge_items_by_plan(uid, pid, columns=("item_type", "term", "definition"))
+                )
                 
                 special_instructions = current_plan['special_instructions'] if current_plan and 'special_instructions' in current_plan.keys() else None
                 instruction_prompt_part = ""
@@ -296,19 +307,17 @@ with col2:
                 ---
                 """
 
-                # Use centralized AI manager from config
+                # Use centralized AI manager from config, in JSON mode with schema validation.
                 # Disable the ai_manager's internal spinner because we already show
                 # a Streamlit spinner above. This prevents the "Thinking" indicator
                 # from appearing twice.
-                response = ai_manager.generate_content(full_prompt, show_spinner=False)
-                # ai_manager returns the text directly
-                answer_text = response
-
-                try:
-                    # Attempt to parse the AI's response as JSON
-                    cleaned_response = answer_text.strip().replace("```json", "").replace("```", "")
-                    ai_response_data = json.loads(cleaned_response)
+                # A reply that isn't usable JSON is shown as a plain conversational answer.
+                ai_response_data = ai_manager.generate_json(
+                    full_prompt, ASK_SCHEMA, show_spinner=False, prompt_type="ask",
+                    text_fallback=lambda text: {"is_knowledge_point": False, "data": {"answer": text}},
+                )
 
+                if ai_response_data:
                     is_knowledge = ai_response_data.get("is_knowledge_point", False)
                     data = ai_response_data.get("data", {})
 
@@ -330,9 +339,8 @@ with col2:
                             st.session_state.blackboard_item = None # Clear blackboard
                             st.rerun()
 
-                except (json.JSONDecodeError, TypeError):
-                    # If JSON parsing fails, treat it as a simple conversational response
-                    st.markdown(answer_text)
-                    st.session_state.ask_messages.append({"role": "assistant", "content": answer_text})
-                    st.session_state.blackboard_item = None # Clear blackboard
+                else:
+                    # The AI manager has already shown the error
+                    chat_message = "Sorry, I couldn't get a usable answer. Please try asking again."
+                    st.session_state.ask_messages.append({"role": "assistant", "content": chat_message})
                     st.session_state.blackboard_item = None # Clear blackboard
@@ -1,7 +1,7 @@
 import streamlit as st
 from auth_helper import require_api_key
-from db_functions import get_plans_by_user, update_plan_instructions
-from utils import ensure_plan_selected
+from db_functions import get_plan_by_id, queue_plan_instructions
+from utils import ensure_plan_selected, report_saves, track_save
 from config import get_ai_manager
 
 st.markdown("""
@@ -92,6 +92,8 @@ require_api_key()
 # --- Setup ---
 pid = ensure_plan_selected()
 uid = st.session_state.get('user_id', 1)
+# Report saves queued in earlier runs that have been committed (or failed) since
+report_saves()
 ai_manager = get_ai_manager()
 if not ai_manager.initialize():
     st.error("AI could not be initialized.")
@@ -99,8 +101,7 @@ if not ai_manager.initialize():
 
 # --- Data Fetching ---
 def get_current_plan():
-    all_plans = get_plans_by_user(uid)
-    return next((plan for plan in all_plans if plan['pid'] == pid), None)
+    return get_plan_by_id(uid, pid, ("pid", "special_instructions"))
 
 current_plan = get_current_plan()
 if not current_plan:
@@ -143,7 +144,11 @@ with col1:
     save_col, revert_col = st.columns(2)
     with save_col:
         if st.button("💾 Save Changes", use_container_width=True, type="primary"):
-            update_plan_instructions(uid, pid, st.session_state.draft_instructions)
+            # Committed by the write queue; a failure is reported on a later run
+            track_save(
+                queue_plan_instructions(uid, pid, st.session_state.draft_instructions),
+                lambda e: st.error(f"❌ Could not save the instructions: {e}"),
+            )
             st.toast("✅ Instructions saved successfully!")
     with revert_col:
         if st.button("↩️ Revert Changes", use_container_width=True):
@@ -179,7 +184,7 @@ with col2:
                 Your response should ONLY be the text of the new instructions, with no other conversational text, formatting, or explanations.
                 """
                 
-                new_instructions = ai_manager.generate_content(full_prompt)
+                new_instructions = ai_manager.generate_content(full_prompt, prompt_type="instructions")
                 if new_instructions:
                     st.session_state.draft_instructions = new_instructions
                     st.session_state.instruction_messages.append({"role": "assistant", "content": "I've updated the instructions on the left. You can edit them further or click 'Save Changes'."})
@@ -0,0 +1,175 @@
+# File Name: rate_limiter.py
+import hashlib
+import threading
+import time
+
+
+def key_fingerprint(api_key):
+    """
+    Return a short, stable identifier for an API key so raw keys never need to be
+    used as dictionary keys, log fields or metric labels.
+    """
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate used before a request is sent (roughly 4 characters per token).
+    The real count from the response usage metadata is reconciled afterwards.
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously up to `capacity` tokens.
+
+    Reservations are allowed to push the bucket into debt. The caller is then told how
+    long to wait before its reservation is covered, which gives first-come-first-served
+    ordering between callers sharing the same bucket.
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` tokens would be available, without taking them."""
+        self._refill(now)
+        amount = min(float(amount), self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def reserve(self, amount, now):
+        """Take `amount` tokens (possibly into debt) and return the seconds to wait."""
+        wait = self.wait_time(amount, now)
+        self.tokens -= min(float(amount), self.capacity)
+        return wait
+
+    def refund(self, amount):
+        """Give back tokens from a reservation that was not used."""
+        self.tokens = min(self.capacity, self.tokens + float(amount))
+
+
+class RateLimiter:
+    """
+    Per-(API key, model) request and token budgets.
+
+    Every key/model pair gets its own requests-per-minute bucket and tokens-per-minute
+    bucket, so sessions on different API keys never throttle each other. None of the
+    methods sleep: they report how long the caller should wait and leave the waiting to
+    the caller's own thread.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _get_buckets(self, api_key, model):
+        bucket_key = (key_fingerprint(api_key), model)
+        buckets = self._buckets.get(bucket_key)
+        if buckets is None:
+            request_bucket = None
+            token_bucket = None
+            if self.requests_per_minute:
+                request_bucket = TokenBucket(self.requests_per_minute, self.requests_per_minute / 60.0)
+            if self.tokens_per_minute:
+                token_bucket = TokenBucket(self.tokens_per_minute, self.tokens_per_minute / 60.0)
+            buckets = (request_bucket, token_bucket)
+            self._buckets[bucket_key] = buckets
+        return buckets
+
+    def acquire(self, api_key, model, estimated_tokens=0):
+        """
+        Reserve one request and `estimated_tokens` tokens for this key/model.
+
+        Returns the number of seconds the caller must wait before sending the request.
+        The reservation is kept even when the wait is non-zero; call `refund` if the
+        caller decides not to send the request after all.
+        """
+        with self._lock:
+            now = time.monotonic()
+            request_bucket, token_bucket = self._get_buckets(api_key, model)
+            wait = 0.0
+            if request_bucket is not None:
+                wait = max(wait, request_bucket.reserve(1, now))
+            if token_bucket is not None and estimated_tokens:
+                wait = max(wait, token_bucket.reserve(estimated_tokens, now))
+            return wait
+
+    def try_acquire(self, api_key, model, estimated_tokens=0):
+        """
+        Take one request slot only if it is available right now.
+
+        Returns (True, 0.0) when the request may be sent immediately, otherwise
+        (False, seconds_until_available) and nothing is reserved.
+        """
+        with self._lock:
+            now = time.monotonic()
+            request_bucket, token_bucket = self._get_buckets(api_key, model)
+            wait = 0.0
+            if request_bucket is not None:
+                wait = max(wait, request_bucket.wait_time(1, now))
+            if token_bucket is not None and estimated_tokens:
+                wait = max(wait, token_bucket.wait_time(estimated_tokens, now))
+            if wait > 0:
+                return False, wait
+            if request_bucket is not None:
+                request_bucket.reserve(1, now)
+            if token_bucket is not None and estimated_tokens:
+                token_bucket.reserve(estimated_tokens, now)
+            return True, 0.0
+
+    def refund(self, api_key, model, estimated_tokens=0):
+        """Return a reservation made by `acquire` that was never used."""
+        with self._lock:
+            request_bucket, token_bucket = self._get_buckets(api_key, model)
+            if request_bucket is not None:
+                request_bucket.refund(1)
+            if token_bucket is not None and estimated_tokens:
+                token_bucket.refund(estimated_tokens)
+
+    def record_usage(self, api_key, model, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the real token count of a request is known."""
+        if not actual_tokens:
+            return
+        with self._lock:
+            _, token_bucket = self._get_buckets(api_key, model)
+            if token_bucket is None:
+                return
+            difference = float(actual_tokens) - float(estimated_tokens or 0)
+            if difference > 0:
+                token_bucket.tokens -= difference
+            elif difference < 0:
+                token_bucket.refund(-difference)
+
+    def snapshot(self):
+        """Return the remaining request/token budget of every bucket, for diagnostics."""
+        with self._lock:
+            now = time.monotonic()
+            status = {}
+            for (fingerprint, model), (request_bucket, token_bucket) in self._buckets.items():
+                if request_bucket is not None:
+                    request_bucket._refill(now)
+                if token_bucket is not None:
+                    token_bucket._refill(now)
+                status[(fingerprint, model)] = {
+                    "requests_available": request_bucket.tokens if request_bucket else None,
+                    "tokens_available": token_bucket.tokens if token_bucket else None,
+                }
+            return status
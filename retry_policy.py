@@ -0,0 +1,204 @@
+# File Name: retry_policy.py
+import random
+import re
+import threading
+import time
+
+from rate_limiter import key_fingerprint
+
+# HTTP status codes worth retrying: rate limited, server errors and gateway timeouts
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+TRANSIENT_STATUS_PATTERN = re.compile(r"\b(408|429|500|502|503|504)\b")
+TRANSIENT_MARKERS = (
+    "resource_exhausted", "resource exhausted", "too many requests",
+    "unavailable", "internal error", "deadline", "timed out", "timeout",
+)
+RETRY_AFTER_PATTERNS = (
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+    re.compile(r"retry in\s*([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry[- ]after:?\s*([\d.]+)", re.IGNORECASE),
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while a key's circuit breaker is open."""
+
+    def __init__(self, retry_in):
+        self.retry_in = retry_in
+        super().__init__(
+            f"⚠️ The AI service is temporarily unavailable. Please try again in {int(retry_in) + 1} seconds."
+        )
+
+
+def is_transient_error(e):
+    """True for errors that are likely to succeed on retry (429s, 5xx, deadlines)."""
+    code = getattr(e, "code", None)
+    if isinstance(code, int) and code in TRANSIENT_STATUS_CODES:
+        return True
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    message = f"{type(e).__name__} {e}".lower()
+    if TRANSIENT_STATUS_PATTERN.search(message):
+        return True
+    return any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+def retry_after_hint(e):
+    """Return the server's suggested retry delay in seconds, if the error carries one."""
+    retry_after = getattr(e, "retry_after", None)
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+    message = str(e)
+    for pattern in RETRY_AFTER_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class CircuitBreaker:
+    """
+    Per-key circuit breaker.
+
+    After `failure_threshold` consecutive transient failures the key's circuit opens
+    and calls fail fast for `reset_timeout` seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def _circuit(self, key):
+        fingerprint = key_fingerprint(key)
+        circuit = self._circuits.get(fingerprint)
+        if circuit is None:
+            circuit = {"state": self.CLOSED, "failures": 0, "opened_at": 0.0, "trial_running": False, "times_opened": 0}
+            self._circuits[fingerprint] = circuit
+        return circuit
+
+    def before_call(self, key):
+        """Raise CircuitOpenError if calls for `key` should currently fail fast."""
+        with self._lock:
+            circuit = self._circuit(key)
+            if circuit["state"] == self.CLOSED:
+                return
+            retry_in = circuit["opened_at"] + self.reset_timeout - time.monotonic()
+            if circuit["state"] == self.OPEN and retry_in <= 0:
+                circuit["state"] = self.HALF_OPEN
+            if circuit["state"] == self.HALF_OPEN and not circuit["trial_running"]:
+                circuit["trial_running"] = True
+                return
+            raise CircuitOpenError(max(retry_in, 0.0))
+
+    def record_success(self, key):
+        """The upstream call succeeded: close the circuit."""
+        with self._lock:
+            circuit = self._circuit(key)
+            circuit.update(state=self.CLOSED, failures=0, trial_running=False)
+
+    def release(self, key):
+        """
+        The call ended without telling us whether the upstream is healthy (a
+        non-retryable or locally raised error): free the half-open trial, if this call
+        held it, and leave the state and failure count as they are.
+        """
+        with self._lock:
+            self._circuit(key)["trial_running"] = False
+
+    def record_failure(self, key):
+        """Count a transient failure and open the circuit if the threshold is reached."""
+        with self._lock:
+            circuit = self._circuit(key)
+            circuit["failures"] += 1
+            circuit["trial_running"] = False
+            if circuit["state"] == self.HALF_OPEN or circuit["failures"] >= self.failure_threshold:
+                if circuit["state"] != self.OPEN:
+                    circuit["times_opened"] += 1
+                circuit["state"] = self.OPEN
+                circuit["opened_at"] = time.monotonic()
+
+    def state(self, key):
+        with self._lock:
+            return self._circuit(key)["state"]
+
+    def snapshot(self):
+        """Return the state of every circuit, keyed by API key fingerprint."""
+        with self._lock:
+            return {
+                fingerprint: {
+                    "state": circuit["state"],
+                    "consecutive_failures": circuit["failures"],
+                    "times_opened": circuit["times_opened"],
+                }
+                for fingerprint, circuit in self._circuits.items()
+            }
+
+
+class RetryPolicy:
+    """
+    Retries transient upstream errors with exponential backoff and full jitter,
+    honoring any retry-after hint, behind a per-key CircuitBreaker.
+    """
+
+    def __init__(self, max_attempts, base_delay, max_delay, breaker):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.gave_up = 0
+
+    def backoff(self, attempt, hint=None):
+        """Delay before retry number `attempt` (1-based)."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        if hint is not None:
+            delay = max(delay, hint)
+        return delay
+
+    def call(self, key, fn, on_retry=None):
+        """
+        Call `fn()` for `key`, retrying transient failures.
+
+        `on_retry(attempt, delay, error)` is invoked before each backoff sleep.
+        Non-transient errors and CircuitOpenError are raised immediately; only a
+        successful `fn()` closes the circuit.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call(key)
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_transient_error(e):
+                    self.breaker.release(key)
+                    raise
+                self.breaker.record_failure(key)
+                delay = self.backoff(attempt, retry_after_hint(e))
+                if attempt >= self.max_attempts or delay > self.max_delay * 3:
+                    with self._lock:
+                        self.gave_up += 1
+                    raise
+                with self._lock:
+                    self.retries += 1
+                if on_retry is not None:
+                    on_retry(attempt, delay, e)
+                time.sleep(delay)
+            else:
+                self.breaker.record_success(key)
+                return result
+
+    def stats(self):
+        """Retry counters plus the breaker state of every key."""
+        with self._lock:
+            counters = {"retries": self.retries, "gave_up": self.gave_up}
+        counters["circuits"] = self.breaker.snapshot()
+        return counters
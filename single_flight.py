@@ -0,0 +1,44 @@
+# File Name: single_flight.py
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical requests.
+
+    The first caller for a key starts the work; every caller that arrives while it is
+    still running receives the same Future instead of starting a duplicate. The key is
+    forgotten as soon as the work finishes, so later calls start fresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def do(self, key, start):
+        """
+        Return the in-flight Future for `key`, or call `start()` to create one.
+
+        Returns a (future, shared) tuple where `shared` is True when the caller joined
+        a request that was already running.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, True
+            future = start()
+            self._in_flight[key] = future
+        future.add_done_callback(lambda done, key=key: self._forget(key, done))
+        return future, False
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def in_flight(self):
+        """Number of distinct requests currently running."""
+        with self._lock:
+            return len(self._in_flight)
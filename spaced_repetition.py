@@ -0,0 +1,48 @@
+# File Name: spaced_repetition.py
+"""
+Review scheduling for flashcards (a simplified SM-2, as used by Anki).
+
+Every knowledge item has a schedule row (ease, interval, reps, due_at). Grading a
+card computes the next interval from its current row alone, so rescheduling touches
+one row no matter how large the deck is.
+"""
+
+GRADES = ("again", "hard", "good", "easy")
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# A forgotten card comes back within the same session
+RELEARN_SECONDS = 10 * 60
+# First two successful reviews (days), as in SM-2
+FIRST_INTERVALS = (1.0, 6.0)
+HARD_FACTOR = 1.2
+EASY_BONUS = 1.3
+# Cards due within this window count as due now, so a card graded "again" is shown
+# again before the session ends instead of leaving it empty
+LEARN_AHEAD_MINUTES = 20
+
+
+def next_schedule(ease, interval_days, reps, grade):
+    """
+    Return (ease, interval_days, reps, due_in_seconds) after grading a card.
+    `grade` is one of GRADES.
+    """
+    if grade not in GRADES:
+        raise ValueError(f"Unknown grade {grade!r}; expected one of {GRADES}")
+    if grade == "again":
+        ease = max(MIN_EASE, ease - 0.2)
+        return ease, 0.0, 0, RELEARN_SECONDS
+
+    if reps < len(FIRST_INTERVALS):
+        interval_days = FIRST_INTERVALS[reps]
+    elif grade == "hard":
+        interval_days = interval_days * HARD_FACTOR
+    else:
+        interval_days = interval_days * ease
+
+    if grade == "hard":
+        ease = max(MIN_EASE, ease - 0.15)
+    elif grade == "easy":
+        ease += 0.15
+        interval_days *= EASY_BONUS
+    return ease, interval_days, reps + 1, interval_days * 86400
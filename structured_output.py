@@ -0,0 +1,396 @@
+# File Name: structured_output.py
+import json
+import re
+
+# Ask Gemini for raw JSON (no markdown fences, no prose around it)
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# --- Schemas (a small JSON-schema subset: type, properties, required, items, enum,
+# anyOf, default, minItems) ---
+
+PLAN_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "items": {
+        "type": "object",
+        "required": ["day", "topic", "details", "status"],
+        "properties": {
+            "day": {"type": "integer"},
+            "topic": {"type": "string"},
+            "details": {"type": "string", "default": ""},
+            "status": {"type": "string", "enum": ["pending", "completed"], "default": "pending"},
+        },
+    },
+}
+
+LEARNING_BLOCK_SCHEMA = {
+    "type": "object",
+    "required": ["type", "content"],
+    "properties": {
+        "type": {
+            "type": "string",
+            "enum": [
+                "paragraph", "key_concept", "theorem", "latex_equation", "table",
+                "code_example", "vocabulary_card", "grammar_card",
+            ],
+        },
+        "content": {"anyOf": [{"type": "string"}, {"type": "object"}]},
+    },
+}
+
+LEARNING_MATERIAL_SCHEMA = {
+    "type": "object",
+    "required": ["learning_material"],
+    "properties": {
+        "learning_material": {"type": "array", "items": LEARNING_BLOCK_SCHEMA},
+    },
+}
+
+LESSON_CHAT_SCHEMA = {
+    "type": "object",
+    "required": ["action", "content"],
+    "properties": {
+        "action": {"type": "string", "enum": ["answer", "regenerate"], "default": "answer"},
+        "content": {"anyOf": [LEARNING_MATERIAL_SCHEMA, {"type": "string"}, {"type": "object"}]},
+    },
+}
+
+QUIZ_QUESTION_SCHEMA = {
+    "type": "object",
+    "required": ["type", "data"],
+    "properties": {
+        "type": {"type": "string", "enum": ["short_answer", "multiple_choice", "fill_in_the_blank"]},
+        "data": {"type": "object"},
+    },
+}
+
+QUIZ_SCHEMA = {
+    "type": "object",
+    "required": ["questions"],
+    "properties": {
+        "questions": {"type": "array", "minItems": 1, "items": QUIZ_QUESTION_SCHEMA},
+    },
+}
+
+ASK_SCHEMA = {
+    "type": "object",
+    "required": ["is_knowledge_point", "data"],
+    "properties": {
+        "is_knowledge_point": {"type": "boolean", "default": False},
+        "data": {"type": "object"},
+    },
+}
+
+
+class StructuredOutputError(ValueError):
+    """The model output could not be parsed or made to fit the schema."""
+
+
+# --- Local repair ---
+
+INVALID_BACKSLASH = re.compile(r'(?<!\\)\\(?!["\\/bfnrtu])')
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def strip_code_fences(text):
+    """Remove ```json ... ``` wrappers that models add despite instructions."""
+    return text.replace("```json", "").replace("```", "").strip()
+
+
+def scan_json(text, start):
+    """
+    Scan the JSON value that starts at `start` (a '{' or '[').
+
+    Returns (end, stack, safe_points): `end` is the index just past the value or None
+    if the text was truncated; `stack` holds the still-open brackets at the end of
+    the text; `safe_points` lists (index, open_brackets) pairs right after each nested
+    container closed, which are places where a truncated document can be cut and
+    re-closed without losing completed items.
+    """
+    stack = []
+    safe_points = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return i + 1, stack, safe_points
+            safe_points.append((i + 1, tuple(stack)))
+    return None, stack, safe_points
+
+
+def close_truncated(text, start, safe_points):
+    """Cut a truncated document after its last complete nested value and close it."""
+    if not safe_points:
+        raise StructuredOutputError("Truncated JSON with no complete items")
+    cut, open_brackets = safe_points[-1]
+    closing = "".join("}" if bracket == "{" else "]" for bracket in reversed(open_brackets))
+    return text[start:cut] + closing
+
+
+def parse_json_text(text):
+    """
+    Parse model output as JSON, repairing it locally when needed.
+
+    Handles markdown fences, prose around the JSON, unescaped backslashes (LaTeX),
+    trailing commas, raw control characters inside strings and truncated output.
+    Returns (value, repaired) and raises StructuredOutputError if nothing usable is
+    left.
+    """
+    if text is None:
+        raise StructuredOutputError("Empty response")
+    cleaned = strip_code_fences(text)
+    try:
+        return json.loads(cleaned), cleaned != text.strip()
+    except json.JSONDecodeError:
+        pass
+
+    starts = [i for i in (cleaned.find("{"), cleaned.find("[")) if i != -1]
+    if not starts:
+        raise StructuredOutputError("No JSON object or array in response")
+    start = min(starts)
+    end, _, safe_points = scan_json(cleaned, start)
+    candidate = cleaned[start:end] if end is not None else close_truncated(cleaned, start, safe_points)
+
+    for attempt in (candidate, INVALID_BACKSLASH.sub(r"\\\\", candidate)):
+        attempt = TRAILING_COMMA.sub(r"\1", attempt)
+        try:
+            return json.loads(attempt, strict=False), True
+        except json.JSONDecodeError:
+            continue
+    raise StructuredOutputError("Response is not valid JSON")
+
+
+# --- Validation ---
+
+def conform(value, schema, path="$"):
+    """
+    Check `value` against `schema`, coercing scalars where the intent is obvious
+    (e.g. "3" for an integer) and filling documented defaults.
+
+    Invalid items inside arrays are dropped rather than failing the whole document.
+    Returns (value, dropped_items); raises StructuredOutputError when the value
+    cannot be made to fit.
+    """
+    if "anyOf" in schema:
+        for option in schema["anyOf"]:
+            try:
+                return conform(value, option, path)
+            except StructuredOutputError:
+                continue
+        raise StructuredOutputError(f"{path}: matches none of the allowed shapes")
+
+    expected = schema.get("type")
+    dropped = 0
+    if expected == "object":
+        if not isinstance(value, dict):
+            raise StructuredOutputError(f"{path}: expected an object")
+        value = dict(value)
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name not in value or value[name] is None:
+                if "default" in properties.get(name, {}):
+                    value[name] = properties[name]["default"]
+                else:
+                    raise StructuredOutputError(f"{path}.{name}: missing")
+        for name, subschema in properties.items():
+            if name in value:
+                value[name], sub_dropped = conform(value[name], subschema, f"{path}.{name}")
+                dropped += sub_dropped
+    elif expected == "array":
+        if not isinstance(value, list):
+            raise StructuredOutputError(f"{path}: expected an array")
+        items = []
+        for i, item in enumerate(value):
+            try:
+                item, sub_dropped = conform(item, schema.get("items", {}), f"{path}[{i}]")
+            except StructuredOutputError:
+                dropped += 1
+                continue
+            dropped += sub_dropped
+            items.append(item)
+        if len(items) < schema.get("minItems", 0) or (value and not items):
+            raise StructuredOutputError(f"{path}: no valid items")
+        value = items
+    elif expected == "string":
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, str):
+            raise StructuredOutputError(f"{path}: expected a string")
+    elif expected == "integer":
+        if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+            value = int(value)
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise StructuredOutputError(f"{path}: expected an integer")
+    elif expected == "boolean":
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            value = value.lower() == "true"
+        if not isinstance(value, bool):
+            raise StructuredOutputError(f"{path}: expected a boolean")
+
+    if "enum" in schema:
+        if isinstance(value, str) and value.lower() in schema["enum"]:
+            value = value.lower()
+        if value not in schema["enum"]:
+            if "default" in schema:
+                value = schema["default"]
+            else:
+                raise StructuredOutputError(f"{path}: {value!r} is not one of {schema['enum']}")
+    return value, dropped
+
+
+def parse_structured(text, schema):
+    """
+    Parse and validate model output. Returns (value, outcome) where outcome is
+    "ok", "repaired" (the JSON text needed fixing) or "salvaged" (invalid items were
+    dropped). Raises StructuredOutputError if the output is unusable.
+    """
+    value, repaired = parse_json_text(text)
+    value, dropped = conform(value, schema)
+    if dropped:
+        return value, "salvaged"
+    return value, "repaired" if repaired else "ok"
+
+
+# --- Streaming ---
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser that yields each completed element of one JSON array while the
+    document is still arriving.
+
+    With `array_key` set, the array is the value of that key in the top-level object
+    (e.g. "learning_material"); otherwise the document itself must be an array.
+    Elements are validated against `item_schema`; invalid ones are skipped.
+    """
+
+    def __init__(self, array_key=None, item_schema=None):
+        self.array_key = array_key
+        self.item_schema = item_schema or {}
+        self.dropped = 0
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._items_depth = None  # depth of the target array's elements once it is found
+        self._item_start = None
+        self._done = False
+        if array_key is not None:
+            self._key_pattern = re.compile(r'"%s"\s*:\s*$' % re.escape(array_key))
+
+    def _is_target_array(self, index):
+        if self.array_key is None:
+            return self._depth == 0
+        if self._depth != 1:
+            return False
+        return bool(self._key_pattern.search(self._buffer[max(0, index - len(self.array_key) - 40):index]))
+
+    def feed(self, chunk):
+        """Add a chunk of text and return the list of elements completed by it."""
+        self._buffer += chunk
+        completed = []
+        text = self._buffer
+        for i in range(self._pos, len(text)):
+            if self._done:
+                break
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._items_depth is None and ch == "[" and self._is_target_array(i):
+                    self._items_depth = self._depth + 1
+                elif self._items_depth is not None and self._depth == self._items_depth:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._items_depth is not None:
+                    if self._depth == self._items_depth and self._item_start is not None:
+                        item = self._parse_item(text[self._item_start:i + 1])
+                        self._item_start = None
+                        if item is not None:
+                            completed.append(item)
+                    elif self._depth < self._items_depth:
+                        self._done = True
+        self._pos = len(text)
+        return completed
+
+    def _parse_item(self, item_text):
+        try:
+            item, _ = parse_json_text(item_text)
+            item, _ = conform(item, self.item_schema)
+            return item
+        except StructuredOutputError:
+            self.dropped += 1
+            return None
+
+
+class StructuredStream:
+    """
+    Iterate over a stream of text chunks, yielding validated array elements as soon as
+    each one is complete. After iteration, `document` holds the full validated
+    document (or one rebuilt from the elements that did arrive), `text` the raw
+    response and `items` every element that was yielded. If the producer sets
+    `error`, `document` stays None.
+    """
+
+    def __init__(self, chunks, schema, array_key=None):
+        self._chunks = chunks
+        self.schema = schema
+        self.array_key = array_key
+        if array_key is None:
+            item_schema = schema.get("items", {})
+        else:
+            item_schema = schema.get("properties", {}).get(array_key, {}).get("items", {})
+        self._parser = JSONArrayStreamParser(array_key, item_schema)
+        self.text = ""
+        self.items = []
+        self.document = None
+        self.error = None
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            self.text += chunk
+            for item in self._parser.feed(chunk):
+                self.items.append(item)
+                yield item
+        self.document = self._final_document()
+
+    def _final_document(self):
+        if self.error is not None:
+            return None
+        if self.text:
+            try:
+                document, _ = parse_structured(self.text, self.schema)
+                return document
+            except StructuredOutputError:
+                pass
+        if not self.items:
+            return None
+        return list(self.items) if self.array_key is None else {self.array_key: list(self.items)}
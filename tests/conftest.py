@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import sys
+import types
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+class SessionState(dict):
+    """A dict with attribute access, like st.session_state."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    __setattr__ = dict.__setitem__
+
+
+try:
+    import streamlit  # noqa: F401
+except ImportError:
+    # The parts of Streamlit that modules touch at import time or outside of a page run
+    streamlit = types.ModuleType("streamlit")
+    streamlit.cache_resource = lambda fn: fn
+    streamlit.session_state = SessionState()
+    streamlit.error = lambda message: None
+    sys.modules["streamlit"] = streamlit
+
+# The database shipped with the repo, still at the pre-migration schema
+BASELINE_DATABASE = os.path.join(REPO_ROOT, "learning_os.db")
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """A scratch copy of the shipped database; the original is never opened for writing."""
+    path = tmp_path / "baseline.db"
+    shutil.copyfile(BASELINE_DATABASE, path)
+    return str(path)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """db_functions pointed at an empty database file in a temporary directory."""
+    import db_functions
+    from db_shards import ShardRouter
+
+    monkeypatch.setattr(db_functions, "DATABASE_FILE", str(tmp_path / "learning_os.db"))
+    monkeypatch.setattr(db_functions, "router", ShardRouter())
+    monkeypatch.setattr(db_functions, "_plan_owners", {})
+    db_functions.read_cache.clear()
+    yield db_functions
+    db_functions.write_queue.flush()
+    db_functions.read_cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    """uid of a fresh user in the `db` database."""
+    db.add_user("learner", "x")
+    return db.get_user_by_username("learner")["uid"]
+
+
+@pytest.fixture
+def make_plan(db):
+    """make_plan(uid, days=3) adds a plan with that many pending days and returns its pid."""
+    def make(uid, days=3, name="Plan"):
+        daily_content = json.dumps([
+            {"day": day, "topic": f"Topic {day}", "details": "", "status": "pending"} for day in range(1, days + 1)
+        ])
+        return db.add_plan(uid, name, daily_content)
+    return make
@@ -0,0 +1,42 @@
+import time
+
+from client_pool import GenerativeModelPool
+
+
+def make_pool(idle_timeout=0):
+    built, closed = [], []
+
+    def factory(api_key, model_name):
+        built.append((api_key, model_name))
+        return object()
+
+    return GenerativeModelPool(idle_timeout, factory=factory, closer=closed.append), built, closed
+
+
+def test_clients_are_built_once_per_key_and_model():
+    pool, built, _ = make_pool()
+    model = pool.get("key-a", "flash")
+    assert pool.get("key-a", "flash") is model
+    assert pool.get("key-b", "flash") is not model
+    assert pool.get("key-a", "pro") is not model
+    assert len(built) == pool.size() == 3
+
+
+def test_discard_closes_the_rejected_client():
+    pool, built, closed = make_pool()
+    model = pool.get("key-a", "flash")
+    pool.discard("key-a", "flash")
+    assert closed == [model]
+    assert pool.get("key-a", "flash") is not model
+    pool.discard("unknown", "flash")
+    assert len(closed) == 1
+
+
+def test_idle_clients_are_swept():
+    pool, _, closed = make_pool(idle_timeout=0.05)
+    idle = pool.get("key-a", "flash")
+    time.sleep(0.1)
+    active = pool.get("key-b", "flash")
+    assert closed == [idle]
+    pool.close()
+    assert closed == [idle, active] and pool.size() == 0
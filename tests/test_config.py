@@ -0,0 +1,181 @@
+import asyncio
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import config as config_module
+from config import AIManager, AIRequestError, config
+from llm_telemetry import LLMTelemetry, iter_records
+from rate_limiter import RateLimiter
+from retry_policy import CircuitBreaker, RetryPolicy
+from structured_output import ASK_SCHEMA, JSON_GENERATION_CONFIG, LEARNING_MATERIAL_SCHEMA
+
+
+class FakeBackend:
+    """
+    Answers every prompt with the asking key once `release` is set (it starts set),
+    or with the next of `responses` while there are any.
+    """
+
+    name = "test"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+        self.calls = []
+        self.responses = []
+
+    def warm(self, api_key, model_name):
+        pass
+
+    def generate(self, api_key, model_name, prompt, prompt_type=None, generation_config=None):
+        self.calls.append((api_key, generation_config))
+        self.release.wait(5)
+        text = self.responses.pop(0) if self.responses else f"answer for {api_key}"
+        if isinstance(text, Exception):
+            raise text
+        return SimpleNamespace(text=text, usage_metadata=None)
+
+    def stream(self, api_key, model_name, prompt, prompt_type=None, generation_config=None, usage=None):
+        yield self.generate(api_key, model_name, prompt, prompt_type, generation_config).text
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def shown_errors(monkeypatch):
+    """Messages passed to st.error."""
+    errors = []
+    monkeypatch.setattr(config_module.st, "error", errors.append)
+    return errors
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path, shown_errors):
+    monkeypatch.setattr(config, "LLM_BACKEND", "mock")
+    monkeypatch.setattr(config, "LLM_MOCK_LATENCY_MS", 0)
+    monkeypatch.setattr(config, "LLM_CACHE_FILE", str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(config, "LLM_TELEMETRY_ENABLED", False)
+    manager = AIManager()
+    manager.backend = FakeBackend()
+    yield manager
+    manager.backend.release.set()
+    manager.executor.shutdown()
+
+
+def test_async_calls_pass_their_generation_config(manager):
+    assert manager.submit("prompt", api_key="key").result(timeout=5) == "answer for key"
+    text = asyncio.run(manager.generate_content_async("prompt", api_key="key", generation_config=JSON_GENERATION_CONFIG))
+    assert text == "answer for key"
+    # JSON mode is part of the cache key, so the plain-text answer was not reused
+    assert manager.backend.calls == [("key", None), ("key", JSON_GENERATION_CONFIG)]
+    asyncio.run(manager.generate_content_async("prompt", api_key="key", generation_config=JSON_GENERATION_CONFIG))
+    assert len(manager.backend.calls) == 2
+
+
+def test_identical_prompts_are_coalesced_per_api_key(manager):
+    manager.backend.release.clear()
+    first = manager.submit("same prompt", api_key="key-a", use_cache=False)
+    joined = manager.submit("same prompt", api_key="key-a", use_cache=False)
+    other_key = manager.submit("same prompt", api_key="key-b", use_cache=False)
+    manager.backend.release.set()
+    assert first.result(timeout=5) == joined.result(timeout=5) == "answer for key-a"
+    # Another key's call is sent on its own, so its errors and quota stay its own
+    assert other_key.result(timeout=5) == "answer for key-b"
+    assert sorted(key for key, _ in manager.backend.calls) == ["key-a", "key-b"]
+
+
+def test_concurrent_calls_are_recorded_under_the_calling_page(manager, tmp_path):
+    path = str(tmp_path / "requests.jsonl")
+    manager.telemetry = LLMTelemetry(path, max_bytes=0, backup_count=0)
+    asyncio.run(manager.generate_content_async("async prompt", api_key="key"))
+    manager.generate_many(["first", "second"])
+    manager.telemetry.close()
+    assert [record["page"] for record in iter_records(path)] == ["test_config.py"] * 3
+
+
+def test_unusable_json_is_regenerated_and_not_replayed_from_the_cache(manager, shown_errors):
+    manager.backend.responses = ["not json", "still not json"]
+    assert manager.generate_json("prompt", ASK_SCHEMA) is None
+    assert shown_errors and manager.structured_stats["failed"] == 1
+    # The broken response was dropped, so the next attempt asks the model again
+    manager.backend.responses = ['{"is_knowledge_point": false, "data": {"answer": "hi"}}']
+    assert manager.generate_json("prompt", ASK_SCHEMA) == {"is_knowledge_point": False, "data": {"answer": "hi"}}
+    assert len(manager.backend.calls) == 3
+
+
+def test_repaired_json_is_cached_in_its_repaired_form(manager):
+    manager.backend.responses = ['```json\n{"is_knowledge_point": false, "data": {},}\n```']
+    first = manager.generate_json("prompt", ASK_SCHEMA)
+    assert manager.generate_json("prompt", ASK_SCHEMA) == first
+    assert len(manager.backend.calls) == 1
+    assert (manager.structured_stats["repaired"], manager.structured_stats["ok"]) == (1, 1)
+
+
+def test_plain_text_reply_goes_to_the_text_fallback(manager):
+    manager.backend.responses = ["Just a plain answer."]
+    value = manager.generate_json("prompt", ASK_SCHEMA, text_fallback=lambda text: {"answer": text})
+    assert value == {"answer": "Just a plain answer."}
+    assert manager.structured_stats["text_fallback"] == 1
+    assert len(manager.backend.calls) == 1
+
+
+def test_failed_stream_is_reported_once_by_the_fallback(manager, shown_errors):
+    manager.backend.responses = [ValueError("bad request"), ValueError("bad request")]
+    stream = manager.stream_json("prompt", ASK_SCHEMA)
+    assert list(stream) == [] and stream.document is None
+    assert isinstance(stream.error, ValueError) and shown_errors == []
+    assert manager.generate_json("prompt", ASK_SCHEMA, use_cache=False) is None
+    assert len(shown_errors) == 1
+
+
+def test_structured_stats_are_counted_under_concurrency(manager):
+    manager.backend.responses = ['{"is_knowledge_point": false, "data": {}}']
+    manager.generate_json("prompt", ASK_SCHEMA)
+    threads = [threading.Thread(target=manager.generate_json, args=("prompt", ASK_SCHEMA)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert manager.structured_stats["ok"] == 9
+
+
+def test_rate_limited_stream_does_not_take_the_half_open_trial(manager, monkeypatch):
+    monkeypatch.setattr(config, "GEMINI_MAX_RATE_LIMIT_WAIT", 0)
+    manager.rate_limiter = RateLimiter(1)
+    manager.retry_policy = RetryPolicy(1, 0, 0, CircuitBreaker(1, 0.01))
+    breaker = manager.retry_policy.breaker
+    breaker.before_call("key")
+    breaker.record_failure("key")
+    time.sleep(0.05)
+    manager.rate_limiter.acquire("key", config.GEMINI_MODEL)  # the next request must wait a minute
+
+    chunks = queue.Queue()
+    with pytest.raises(AIRequestError, match="Too many AI requests"):
+        manager._stream_once("key", "prompt", None, {}, None, None, chunks)
+    assert chunks.get_nowait() is config_module.STREAM_END
+    # The trial is still free for the next call
+    breaker.before_call("key")
+    breaker.record_success("key")
+    assert breaker.state("key") == CircuitBreaker.CLOSED
+
+
+def test_completed_streams_are_cached(manager):
+    document = '{"learning_material": [{"type": "paragraph", "content": "x"}]}'
+    manager.backend.responses = [document]
+    stream = manager.stream_json("lesson prompt", LEARNING_MATERIAL_SCHEMA, array_key="learning_material")
+    assert list(stream) == [{"type": "paragraph", "content": "x"}]
+    assert stream.document == {"learning_material": [{"type": "paragraph", "content": "x"}]}
+    # Streamed and regular calls share the cache entry
+    assert manager.generate_json("lesson prompt", LEARNING_MATERIAL_SCHEMA) == stream.document
+    assert len(manager.backend.calls) == 1
+
+
+def test_model_label_tells_backends_apart(manager):
+    assert manager.model_label == f"test:{config.GEMINI_MODEL}"
+    manager.backend.name = "gemini"
+    assert manager.model_label == config.GEMINI_MODEL
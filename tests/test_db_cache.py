@@ -0,0 +1,95 @@
+import threading
+
+from db_cache import ReadCache
+
+
+def make_getter(cache, store, calls):
+    @cache.cached(plan="pid", user="uid")
+    def get_items(uid, pid, limit=10):
+        calls.append((uid, pid, limit))
+        return list(store.get(pid, []))[:limit]
+
+    return get_items
+
+
+def test_hits_until_a_scope_is_invalidated():
+    cache = ReadCache()
+    store, calls = {1: ["a"]}, []
+    get_items = make_getter(cache, store, calls)
+
+    assert get_items(10, 1) == ["a"]
+    assert get_items(10, 1) == ["a"]
+    assert get_items(uid=10, pid=1, limit=10) == ["a"]  # same bound arguments
+    assert len(calls) == 1
+    assert cache.stats() == {"entries": 1, "hits": 2, "misses": 1}
+
+    store[1].append("b")
+    cache.invalidate([("plan", 1)])
+    assert get_items(10, 1) == ["a", "b"]
+    # Invalidating another plan or user leaves the entry valid
+    cache.invalidate([("plan", 2), ("user", 11)])
+    get_items(10, 1)
+    assert len(calls) == 2
+
+
+def test_results_are_copied_so_callers_cannot_corrupt_the_cache():
+    cache = ReadCache()
+    get_items = make_getter(cache, {1: ["a"]}, [])
+    get_items(10, 1).append("mutated")
+    assert get_items(10, 1) == ["a"]
+
+
+def test_clear_drops_everything():
+    cache = ReadCache()
+    calls = []
+    get_items = make_getter(cache, {1: ["a"]}, calls)
+    get_items(10, 1)
+    cache.clear()
+    get_items(10, 1)
+    assert len(calls) == 2
+
+
+def test_lru_eviction():
+    cache = ReadCache(max_entries=2)
+    calls = []
+    get_items = make_getter(cache, {}, calls)
+    get_items(10, 1)
+    get_items(10, 2)
+    get_items(10, 1)  # most recently used
+    get_items(10, 3)  # evicts pid 2
+    get_items(10, 1)
+    get_items(10, 2)
+    assert [pid for _, pid, _ in calls] == [1, 2, 3, 2]
+
+
+def test_write_during_a_read_leaves_the_new_entry_stale():
+    cache = ReadCache()
+    store, calls = {1: ["old"]}, []
+    reading, written = threading.Event(), threading.Event()
+
+    @cache.cached(plan="pid")
+    def get_items(pid):
+        calls.append(pid)
+        value = list(store[pid])
+        if len(calls) == 1:
+            reading.set()
+            written.wait(5)
+        return value
+
+    reader = threading.Thread(target=get_items, args=(1,))
+    reader.start()
+    reading.wait(5)
+    store[1] = ["new"]
+    cache.invalidate([("plan", 1)])
+    written.set()
+    reader.join()
+    # The read that overlapped the write returned old rows but must not be served again
+    assert get_items(1) == ["new"]
+
+
+def test_before_read_is_called_with_the_scopes():
+    seen = []
+    cache = ReadCache(before_read=seen.append)
+    get_items = make_getter(cache, {}, [])
+    get_items(10, 1)
+    assert seen == [[("plan", 1), ("user", 10)]]
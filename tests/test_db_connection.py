@@ -0,0 +1,125 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db_connection import ConnectionManager
+
+
+@pytest.fixture
+def manager():
+    manager = ConnectionManager(max_connections=2, timeout=0.2)
+    yield manager
+    manager.close_all()
+
+
+def test_connections_are_reused_across_threads(manager, tmp_path):
+    path = str(tmp_path / "pool.db")
+    seen = []
+
+    def run():
+        with manager.connection(path) as conn:
+            seen.append(id(conn))
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+    # Like Streamlit reruns: every run is a new, short-lived thread
+    for _ in range(5):
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+    assert len(set(seen)) == 1
+    assert manager.stats()["opened"] == 1
+
+
+def test_nested_use_on_one_thread_shares_the_connection(manager, tmp_path):
+    path = str(tmp_path / "pool.db")
+    with manager.connection(path) as outer:
+        with manager.connection(path) as inner:
+            assert inner is outer
+    assert manager.stats() == {"open": 1, "idle": 1, "in_use": 0, "opened": 1, "closed": 0, "waits": 0}
+
+
+def test_only_the_outermost_block_ends_the_transaction(manager, tmp_path):
+    path = str(tmp_path / "pool.db")
+    with manager.connection(path) as conn:
+        conn.execute("CREATE TABLE t (x)")
+    with pytest.raises(RuntimeError):
+        with manager.connection(path) as outer:
+            outer.execute("INSERT INTO t VALUES (1)")
+            with manager.connection(path) as inner:
+                inner.execute("INSERT INTO t VALUES (2)")
+            assert outer.in_transaction
+            raise RuntimeError
+    # The inner block did not commit, so the whole transaction was rolled back
+    with manager.connection(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_threads_do_not_share_checked_out_connections(manager, tmp_path):
+    path = str(tmp_path / "pool.db")
+    holding, release = threading.Event(), threading.Event()
+    seen = []
+
+    def hold():
+        with manager.connection(path) as conn:
+            seen.append(conn)
+            holding.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait(5)
+    with manager.connection(path) as conn:
+        assert conn is not seen[0]
+    release.set()
+    thread.join()
+
+
+def test_block_commits_or_rolls_back(manager, tmp_path):
+    path = str(tmp_path / "pool.db")
+    with manager.connection(path) as conn:
+        conn.execute("CREATE TABLE t (x)")
+    with manager.connection(path) as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pytest.raises(RuntimeError):
+        with manager.connection(path) as conn:
+            conn.execute("INSERT INTO t VALUES (2)")
+            raise RuntimeError
+    with manager.connection(path) as conn:
+        assert [row[0] for row in conn.execute("SELECT x FROM t")] == [1]
+
+
+def test_pool_is_bounded(manager, tmp_path):
+    path = str(tmp_path / "pool.db")
+    holding, release = threading.Barrier(3), threading.Event()
+
+    def hold():
+        with manager.connection(path):
+            holding.wait(5)
+            release.wait(5)
+
+    threads = [threading.Thread(target=hold) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    holding.wait(5)
+    with pytest.raises(sqlite3.OperationalError, match="No free connection"):
+        with manager.connection(path):
+            pass
+    release.set()
+    for thread in threads:
+        thread.join()
+    with manager.connection(path):
+        pass
+    assert manager.stats()["open"] == 2
+
+
+def test_close_all_closes_idle_and_returned_connections(manager, tmp_path):
+    path = str(tmp_path / "pool.db")
+    with manager.connection(path):
+        pass
+    with manager.connection(str(tmp_path / "other.db")) as conn:
+        manager.close_all()
+    assert manager.stats()["open"] == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
@@ -0,0 +1,150 @@
+import json
+import sqlite3
+
+import pytest
+
+
+def table_count(db, table, pid):
+    with db.get_db_connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE pid = ?", (pid,)).fetchone()[0]
+
+
+def test_plan_lookup_by_id_is_scoped_to_its_owner(db, user, make_plan):
+    pid = make_plan(user, name="Spanish")
+    plan = db.get_plan_by_id(user, pid, columns=("pid", "plan_name"))
+    assert dict(plan) == {"pid": pid, "plan_name": "Spanish"}
+    assert db.get_plan_by_id(user + 1, pid) is None
+    assert db.get_plan_by_id(user, pid + 1) is None
+    with pytest.raises(ValueError):
+        db.get_plan_by_id(user, pid, columns=("password_hash",))
+
+
+def test_plan_days_drive_progress(db, user, make_plan):
+    pid = make_plan(user, days=4)
+    assert db.get_plan_progress(pid) == (0, 4)
+    db.set_plan_day_status(pid, 1, "completed")
+    assert db.get_plan_progress(pid) == (1, 4)
+    assert [day["status"] for day in db.get_plan_days(pid)] == ["pending", "completed", "pending", "pending"]
+    assert [day["day"] for day in db.get_plan_days(pid)] == [1, 2, 3, 4]
+
+
+def test_progress_counters_follow_day_changes(db, user, make_plan):
+    empty = make_plan(user, days=0)
+    pid = make_plan(user, days=2)
+    summaries = {plan["pid"]: plan for plan in db.get_plan_summaries_by_user(user)}
+    # A plan without days is valid and shows no progress rather than an error
+    assert (summaries[empty]["completed_days"], summaries[empty]["total_days"]) == (0, 0)
+    db.set_plan_day_status(pid, 0, "completed")
+    db.update_plan_content(pid, json.dumps([
+        {"day": day, "topic": "t", "details": "", "status": "completed" if day == 1 else "pending"} for day in (1, 2, 3)
+    ]))
+    plan = db.get_plan_by_id(user, pid, columns=("completed_days", "total_days", "last_activity_at"))
+    assert (plan["completed_days"], plan["total_days"]) == (1, 3)
+    assert plan["last_activity_at"] is not None
+
+
+def test_lessons_are_stored_per_day_with_their_model(db, user, make_plan):
+    pid = make_plan(user)
+    db.save_plan_lesson(pid, 1, '{"learning_material": []}', "hash", "mock:model")
+    db.save_plan_lesson(pid, 1, '{"learning_material": [1]}', "hash", "model")
+    lesson = db.get_plan_lesson(pid, 1)
+    assert (lesson["learning_material"], lesson["model"]) == ('{"learning_material": [1]}', "model")
+    assert db.get_plan_lesson(pid, 2) is None
+    db.delete_plan_lesson(pid, 1)
+    assert db.get_plan_lesson(pid, 1) is None
+    assert db.lesson_instructions_hash("t", "d", None) == db.lesson_instructions_hash("t", "d", "")
+    assert db.lesson_instructions_hash("t", "d", None) != db.lesson_instructions_hash("t", "d", "slower")
+
+
+def test_full_text_search_ranks_term_matches_first(db, user, make_plan):
+    pid, other = make_plan(user), make_plan(user)
+    db.add_knowledge_item(user, pid, "concept", "Photosynthesis", "How plants make sugar from light")
+    db.add_knowledge_item(user, pid, "concept", "Chlorophyll", "The pigment used in photosynthesis")
+    db.add_knowledge_item(user, other, "concept", "Photon", "A particle of light")
+    assert [item["term"] for item in db.search_knowledge_items(user, "photosynthesis")] == ["Photosynthesis", "Chlorophyll"]
+    # The last word matches as a prefix, so results update while typing
+    assert {item["term"] for item in db.search_knowledge_items(user, "phot")} == {"Photosynthesis", "Chlorophyll", "Photon"}
+    assert [item["term"] for item in db.search_knowledge_items(user, "light", pid=other)] == ["Photon"]
+    assert db.search_knowledge_items(user, '  "  ') == []
+    assert db.search_knowledge_items(user + 1, "light") == []
+    # Deleted items leave the index too
+    photon = db.search_knowledge_items(user, "photon")[0]["item_id"]
+    db.delete_knowledge_item(user, photon)
+    assert db.search_knowledge_items(user, "photon") == []
+
+
+def test_bulk_insert_skips_duplicates(db, user, make_plan):
+    pid = make_plan(user)
+    items = [("concept", "Atom", "d"), ("concept", "Ion", "d"), ("concept", " atom ", "again")]
+    assert db.add_knowledge_items_bulk(user, pid, items) == 2
+    assert db.add_knowledge_items_bulk(user, pid, [("concept", "ion", "d"), ("vocabulary", "ion", "d")]) == 1
+    assert sorted(item["term"] for item in db.get_knowledge_items_by_plan(user, pid)) == ["Atom", "Ion", "ion"]
+
+
+def test_keyset_pages_with_projected_columns(db, user, make_plan):
+    pid = make_plan(user)
+    db.add_knowledge_items_bulk(user, pid, [("concept", f"term {i}", f"definition {i}") for i in range(5)])
+    first = db.get_knowledge_items_page(user, pid, limit=2, columns=("item_id", "term"))
+    second = db.get_knowledge_items_page(user, pid, after_item_id=first[-1]["item_id"], limit=2)
+    back = db.get_knowledge_items_page(user, pid, before_item_id=second[0]["item_id"], limit=2)
+    assert first[0].keys() == ["item_id", "term"]
+    assert [item["term"] for item in first + second] == ["term 0", "term 1", "term 2", "term 3"]
+    assert [item["item_id"] for item in back] == [item["item_id"] for item in first]
+    assert [item["term"] for item in db.iter_knowledge_items_by_plan(user, pid, columns=("term",), page_size=2)] == [
+        f"term {i}" for i in range(5)
+    ]
+    assert db.count_knowledge_items_by_plan(user, pid, before_item_id=second[0]["item_id"]) == 2
+    with pytest.raises(ValueError):
+        db.get_knowledge_items_page(user, pid, columns=("password_hash",))
+
+
+def test_queued_knowledge_items_report_what_was_inserted(db, user, make_plan):
+    pid = make_plan(user)
+    items = [("concept", "a", "d"), ("concept", "b", "d"), ("concept", "a", "d")]
+    assert db.queue_knowledge_items(user, pid, items).result(timeout=5) == 2
+    assert db.queue_knowledge_items(user, pid, [("concept", "b", "d")]).result(timeout=5) == 0
+    assert db.count_knowledge_items_by_plan(user, pid) == 2
+
+
+
+def test_reads_see_earlier_writes_through_the_cache(db, user, make_plan):
+    pid = make_plan(user)
+    assert db.get_knowledge_items_by_plan(user, pid) == []
+    db.queue_knowledge_items(user, pid, [("concept", "queued", "d")])
+    # Cached and pending: the read waits for the queue and skips the stale entry
+    assert [item["term"] for item in db.get_knowledge_items_by_plan(user, pid)] == ["queued"]
+    db.add_knowledge_item(user, pid, "concept", "direct", "d")
+    assert db.count_knowledge_items_by_plan(user, pid) == 2
+
+
+def test_delete_plan_cascades_in_chunks(db, user, make_plan):
+    pid, kept = make_plan(user), make_plan(user)
+    db.save_plan_lesson(pid, 1, "{}", "hash", "model")
+    db.add_knowledge_items_bulk(user, pid, [("concept", f"t{i}", "d") for i in range(7)])
+    db.add_knowledge_item(user, kept, "concept", "kept", "d")
+
+    db.delete_plan(user, pid, chunk_size=3)
+    assert db.get_plan_by_id(user, pid) is None
+    for table in ("plan_days", "plan_lessons", "knowledge_items", "review_schedule"):
+        assert table_count(db, table, pid) == 0, table
+    assert db.search_knowledge_items(user, "t1") == []
+    assert [item["term"] for item in db.get_knowledge_items_by_user(user)] == ["kept"]
+    # Deleting it again, or another user's plan, is a no-op
+    db.delete_plan(user, pid)
+    db.delete_plan(user + 1, kept)
+    assert db.get_plan_by_id(user, kept) is not None
+
+
+def test_delete_plan_is_atomic(db, user, make_plan):
+    pid = make_plan(user)
+    db.add_knowledge_items_bulk(user, pid, [("concept", f"t{i}", "d") for i in range(5)])
+    with db.get_db_connection() as conn:
+        conn.execute("""
+            CREATE TRIGGER refuse_plan_delete BEFORE DELETE ON plans
+            BEGIN SELECT RAISE(ABORT, 'refused'); END
+        """)
+    with pytest.raises(sqlite3.IntegrityError):
+        db.delete_plan(user, pid, chunk_size=2)
+    # The item chunks deleted before the failure were rolled back with it
+    assert db.count_knowledge_items_by_plan(user, pid) == 5
+    assert table_count(db, "review_schedule", pid) == 5
@@ -0,0 +1,143 @@
+import logging
+import sqlite3
+
+import pytest
+
+from db_migrations import MIGRATIONS, current_version, migrate, parse_plan_days, rebuild_table
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def open_db(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+
+
+def test_versions_are_sequential():
+    assert [version for version, _, _ in MIGRATIONS] == list(range(1, LATEST + 1))
+
+
+def test_new_database_gets_every_migration(tmp_path):
+    conn = open_db(str(tmp_path / "new.db"))
+    assert migrate(conn) == list(range(1, LATEST + 1))
+    assert current_version(conn) == LATEST
+    assert {"users", "plans", "plan_days", "plan_lessons", "knowledge_items", "knowledge_items_fts",
+            "plan_catalog", "review_schedule"} <= tables(conn)
+    # Running again is a no-op
+    assert migrate(conn) == []
+
+
+def test_upgrade_from_the_baseline_database_keeps_the_data(baseline_db):
+    conn = open_db(baseline_db)
+    assert current_version(conn) == 0
+    plans = [dict(row) for row in conn.execute("SELECT pid, daily_content FROM plans")]
+    items = conn.execute("SELECT COUNT(*) FROM knowledge_items").fetchone()[0]
+    sequence = dict(conn.execute("SELECT name, seq FROM sqlite_sequence").fetchall())
+
+    assert migrate(conn) == list(range(1, LATEST + 1))
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 0  # restored
+
+    # Every plan's days moved out of the daily_content blob into plan_days
+    for plan in plans:
+        days = parse_plan_days(plan["daily_content"])
+        if days is None:
+            continue
+        stored = conn.execute(
+            "SELECT position, day, topic, details, status FROM plan_days WHERE pid = ? ORDER BY position",
+            (plan["pid"],),
+        ).fetchall()
+        assert [tuple(row) for row in stored] == days
+        progress = conn.execute("SELECT completed_days, total_days FROM plans WHERE pid = ?", (plan["pid"],)).fetchone()
+        assert tuple(progress) == (sum(day[4] == "completed" for day in days), len(days))
+        assert conn.execute("SELECT daily_content FROM plans WHERE pid = ?", (plan["pid"],)).fetchone()[0] == "[]"
+
+    # Knowledge items survive (none were orphaned), each with a schedule and an FTS row
+    assert conn.execute("SELECT COUNT(*) FROM knowledge_items").fetchone()[0] == items
+    assert conn.execute("SELECT COUNT(*) FROM review_schedule").fetchone()[0] == items
+    conn.execute("INSERT INTO knowledge_items_fts (knowledge_items_fts) VALUES ('integrity-check')")  # raises if out of sync
+    for name, seq in sequence.items():
+        assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (name,)).fetchone()[0] >= seq
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_queries_use_their_indexes(tmp_path):
+    conn = open_db(str(tmp_path / "new.db"))
+    migrate(conn)
+    queries = {
+        "SELECT * FROM plans WHERE uid = 1 ORDER BY created_at DESC": "idx_plans_uid_created_at",
+        "SELECT * FROM knowledge_items WHERE uid = 1 AND pid = 2": "idx_knowledge_items_uid_pid",
+    }
+    for sql, index in queries.items():
+        plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+        assert index in plan, sql
+
+
+def test_migration_11_logs_the_orphans_it_drops(baseline_db, caplog, monkeypatch):
+    conn = open_db(baseline_db)
+    monkeypatch.setattr("db_migrations.MIGRATIONS", MIGRATIONS[:10])
+    migrate(conn)
+    # Rows left behind by plan deletes made before foreign keys were enforced
+    uid = conn.execute("SELECT uid FROM users LIMIT 1").fetchone()[0]
+    with conn:
+        conn.execute("INSERT INTO knowledge_items (uid, pid, item_type, term, definition)"
+                     " VALUES (?, 99999, 'concept', 'orphan', 'gone')", (uid,))
+        conn.execute("INSERT INTO plan_days (pid, position, day, topic) VALUES (99999, 0, 1, 'gone')")
+    monkeypatch.setattr("db_migrations.MIGRATIONS", MIGRATIONS)
+
+    with caplog.at_level(logging.WARNING, logger="db_migrations"):
+        assert migrate(conn) == [11]
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("1 orphaned plan_days" in message for message in messages)
+    assert any("1 orphaned knowledge_items" in message for message in messages)
+    assert any("1 orphaned review_schedule" in message for message in messages)
+    assert conn.execute("SELECT COUNT(*) FROM knowledge_items WHERE pid = 99999").fetchone()[0] == 0
+    # The FTS index was rebuilt without the dropped item
+    assert conn.execute("SELECT COUNT(*) FROM knowledge_items_fts WHERE knowledge_items_fts MATCH 'orphan'").fetchone()[0] == 0
+
+
+def test_cascading_deletes_after_migration(tmp_path):
+    conn = open_db(str(tmp_path / "new.db"))
+    migrate(conn)
+    conn.execute("PRAGMA foreign_keys = ON")
+    with conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('u', 'x')")
+        conn.execute("INSERT INTO plans (uid, plan_name, daily_content) VALUES (1, 'p', '[]')")
+        conn.execute("INSERT INTO plan_days (pid, position, day, topic) VALUES (1, 0, 1, 't')")
+        conn.execute("INSERT INTO knowledge_items (uid, pid, item_type, term, definition) VALUES (1, 1, 'concept', 't', 'd')")
+    with conn:
+        conn.execute("DELETE FROM plans WHERE pid = 1")
+    for table in ("plan_days", "knowledge_items", "review_schedule"):
+        assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
+    with pytest.raises(sqlite3.IntegrityError):
+        with conn:
+            conn.execute("INSERT INTO plan_days (pid, position, day, topic) VALUES (42, 0, 1, 't')")
+
+
+def test_rebuild_table_keeps_indexes_triggers_and_the_sequence(tmp_path):
+    conn = open_db(str(tmp_path / "rebuild.db"))
+    with conn:
+        conn.execute("CREATE TABLE things (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, keep INTEGER)")
+        conn.execute("CREATE INDEX idx_things_name ON things (name)")
+        conn.execute("CREATE TABLE log (name TEXT)")
+        conn.execute("CREATE TRIGGER things_insert AFTER INSERT ON things BEGIN INSERT INTO log VALUES (new.name); END")
+        conn.executemany("INSERT INTO things (name, keep) VALUES (?, ?)", [("a", 1), ("b", 0), ("c", 1), ("d", 1)])
+        conn.execute("DELETE FROM things WHERE name = 'd'")
+
+        dropped = rebuild_table(conn, "things", """
+            CREATE TABLE things_new (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, keep INTEGER)
+        """, where="keep = 1")
+
+    assert dropped == 1
+    assert [row[0] for row in conn.execute("SELECT name FROM things ORDER BY id")] == ["a", "c"]
+    assert "NOT NULL" in conn.execute("SELECT sql FROM sqlite_master WHERE name = 'things'").fetchone()[0]
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_things_name'").fetchone()
+    with conn:
+        new_id = conn.execute("INSERT INTO things (name, keep) VALUES ('e', 1)").lastrowid
+    # The deleted row's id (4) is not handed out again, and the trigger still fires
+    assert new_id == 5
+    assert conn.execute("SELECT COUNT(*) FROM log WHERE name = 'e'").fetchone()[0] == 1
@@ -0,0 +1,109 @@
+import os
+import sqlite3
+
+import pytest
+
+from db_migrations import migrate
+from db_shards import ShardRouter, split_database
+
+
+def test_router_modes(tmp_path):
+    assert not ShardRouter().sharded
+    router = ShardRouter("hash", shard_count=4, shard_dir="s")
+    assert router.sharded
+    assert router.shard_file(6) == router.shard_file(10) == os.path.join("s", "shard2.db")
+    assert ShardRouter("user", shard_dir="s").shard_file(6) == os.path.join("s", "user6.db")
+    with pytest.raises(ValueError):
+        ShardRouter("random")
+    with pytest.raises(ValueError):
+        ShardRouter("hash", shard_count=0)
+
+
+def test_router_from_environment(monkeypatch):
+    monkeypatch.setenv("LEARNING_OS_SHARD_MODE", "hash")
+    monkeypatch.setenv("LEARNING_OS_SHARD_COUNT", "3")
+    monkeypatch.setenv("LEARNING_OS_SHARD_DIR", "data")
+    router = ShardRouter.from_environment()
+    assert (router.mode, router.shard_count, router.shard_dir) == ("hash", 3, "data")
+
+
+@pytest.fixture
+def populated(tmp_path):
+    """A single-file database with three users, each with a plan, days and items."""
+    path = str(tmp_path / "catalog.db")
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    with conn:
+        for uid in (1, 2, 3):
+            conn.execute("INSERT INTO users (uid, username, password_hash) VALUES (?, ?, 'hash')", (uid, f"user{uid}"))
+            conn.execute("INSERT INTO plans (pid, uid, plan_name, daily_content) VALUES (?, ?, 'plan', '[]')",
+                         (uid * 10, uid))
+            conn.executemany("INSERT INTO plan_days (pid, position, day, topic, status) VALUES (?, ?, ?, 't', ?)",
+                             [(uid * 10, 0, 1, "completed"), (uid * 10, 1, 2, "pending")])
+            conn.executemany(
+                "INSERT INTO knowledge_items (uid, pid, item_type, term, definition) VALUES (?, ?, 'concept', ?, 'd')",
+                [(uid, uid * 10, f"term {uid}-{i}") for i in range(3)],
+            )
+        conn.execute("UPDATE review_schedule SET reps = 4 WHERE uid = 2")
+    conn.close()
+    return path
+
+
+def shard_rows(path, sql, params=()):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def test_split_moves_each_user_to_their_shard(populated, tmp_path):
+    router = ShardRouter("hash", shard_count=2, shard_dir=str(tmp_path / "shards"))
+    assert split_database(populated, router) == 3
+
+    for uid in (1, 2, 3):
+        shard = router.shard_file(uid)
+        assert shard_rows(shard, "SELECT pid, completed_days, total_days FROM plans WHERE uid = ?", (uid,)) == [(uid * 10, 1, 2)]
+        assert shard_rows(shard, "SELECT COUNT(*) FROM knowledge_items WHERE uid = ?", (uid,)) == [(3,)]
+        # Credentials stay in the catalog; the shard only has a stub
+        assert shard_rows(shard, "SELECT password_hash FROM users WHERE uid = ?", (uid,)) == [("",)]
+    # Users 1 and 3 share shard1; user 2 is alone in shard0
+    assert shard_rows(router.shard_file(2), "SELECT DISTINCT uid FROM plans") == [(2,)]
+    # Review schedules were copied, not reset
+    assert shard_rows(router.shard_file(2), "SELECT DISTINCT reps FROM review_schedule") == [(4,)]
+
+    assert shard_rows(populated, "SELECT pid, uid FROM plan_catalog ORDER BY pid") == [(10, 1), (20, 2), (30, 3)]
+    assert shard_rows(populated, "SELECT COUNT(*) FROM plans") == [(0,)]
+    assert shard_rows(populated, "SELECT COUNT(*) FROM knowledge_items") == [(0,)]
+    assert shard_rows(populated, "SELECT COUNT(*) FROM users") == [(3,)]
+
+
+def test_split_is_idempotent_and_can_keep_the_source(populated, tmp_path):
+    router = ShardRouter("user", shard_dir=str(tmp_path / "shards"))
+    split_database(populated, router, keep_source=True)
+    split_database(populated, router, keep_source=True)
+    assert shard_rows(router.shard_file(1), "SELECT COUNT(*) FROM knowledge_items") == [(3,)]
+    assert shard_rows(populated, "SELECT COUNT(*) FROM plans") == [(3,)]
+
+
+def test_split_requires_a_sharded_router(populated):
+    with pytest.raises(ValueError):
+        split_database(populated, ShardRouter())
+
+
+def test_sharded_runtime_routes_plans_and_items(db, tmp_path, monkeypatch, make_plan):
+    monkeypatch.setattr(db, "router", ShardRouter("hash", shard_count=2, shard_dir=str(tmp_path / "shards")))
+    db.add_user("a", "x")
+    db.add_user("b", "x")
+    uid_a, uid_b = db.get_user_by_username("a")["uid"], db.get_user_by_username("b")["uid"]
+    pid_a, pid_b = make_plan(uid_a), make_plan(uid_b)
+    # Plan ids come from the catalog, so they are unique across shards
+    assert pid_a != pid_b
+    assert db.plan_database(pid_b) == db.router.shard_file(uid_b)
+    db.queue_knowledge_items(uid_b, pid_b, [("concept", "t", "d")]).result(timeout=5)
+    assert [item["term"] for item in db.get_knowledge_items_by_plan(uid_b, pid_b)] == ["t"]
+    assert shard_rows(db.router.shard_file(uid_b), "SELECT COUNT(*) FROM knowledge_items") == [(1,)]
+
+    db.delete_plan(uid_b, pid_b)
+    assert shard_rows(db.DATABASE_FILE, "SELECT pid FROM plan_catalog") == [(pid_a,)]
+    assert db.get_plan_by_id(uid_b, pid_b) is None
@@ -0,0 +1,106 @@
+import contextlib
+import io
+import json
+
+import pytest
+
+from db_transfer import FORMAT_VERSION, TransferError, export_records, read_jsonl, write_jsonl
+
+
+def export(db, uid, pids=None):
+    buffer = io.StringIO()
+    write_jsonl(db.export_user_data(uid, pids), buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def test_round_trip_remaps_plan_ids(db, user, make_plan):
+    pid = make_plan(user, days=3, name="Spanish")
+    db.set_plan_day_status(pid, 0, "completed")
+    db.save_plan_lesson(pid, 1, '{"learning_material": []}', "hash", "model")
+    db.add_knowledge_items_bulk(user, pid, [("concept", "hola", "hello"), ("vocabulary", "adiós", "bye")])
+    db.add_knowledge_item(user, None, "concept", "loose", "not in a plan")
+    item_id = db.get_knowledge_items_by_plan(user, pid)[-1]["item_id"]
+    db.grade_card(user, item_id, "easy")
+
+    db.add_user("other", "x")
+    other = db.get_user_by_username("other")["uid"]
+    make_plan(other)  # takes the next plan id, so the import can't keep the old one
+
+    counts, plans = db.import_user_data(other, read_jsonl(export(db, user)))
+    assert counts == {"plan": 1, "plan_day": 3, "lesson": 1, "knowledge_item": 3}
+    new_pid = plans[pid]
+    assert new_pid != pid
+
+    plan = db.get_plan_by_id(other, new_pid)
+    assert plan["plan_name"] == "Spanish"
+    assert db.get_plan_progress(new_pid) == (1, 3)
+    assert db.get_plan_lesson(new_pid, 1)["instructions_hash"] == "hash"
+    items = {item["term"]: item for item in db.get_knowledge_items_by_user(other)}
+    assert set(items) == {"hola", "adiós", "loose"}
+    assert items["hola"]["pid"] == new_pid and items["loose"]["pid"] is None
+    # Review schedules travel with their items
+    with db.get_db_connection() as conn:
+        reps = conn.execute("SELECT reps FROM review_schedule WHERE item_id = ?", (items["adiós"]["item_id"],)).fetchone()[0]
+    assert reps == 1
+    # The source is untouched
+    assert len(db.get_knowledge_items_by_user(user)) == 3
+
+
+def test_export_of_selected_plans(db, user, make_plan):
+    first, second = make_plan(user, name="first"), make_plan(user, name="second")
+    db.add_knowledge_item(user, second, "concept", "t", "d")
+    db.add_knowledge_item(user, None, "concept", "loose", "d")
+    records = [json.loads(line) for line in export(db, user, [second])]
+    assert records[0] == {"type": "header", "format": FORMAT_VERSION}
+    assert {record["pid"] for record in records[1:]} == {second}
+    assert [record["term"] for record in records if record["type"] == "knowledge_item"] == ["t"]
+
+
+def test_export_reads_in_chunks_without_holding_a_connection(db, user, make_plan):
+    pid = make_plan(user, days=5)
+    db.add_knowledge_items_bulk(user, pid, [("concept", f"term {i}", "d") for i in range(5)])
+    checkouts = []
+
+    @contextlib.contextmanager
+    def connect():
+        checkouts.append("open")
+        with db.get_db_connection(db.user_database(user)) as conn:
+            yield conn
+        checkouts[-1] = "closed"
+
+    records = []
+    for record in export_records(connect, user, chunk_size=2):
+        assert "open" not in checkouts
+        records.append(record)
+    # Each type ends with a short chunk: plans 1, days 2+2+1, lessons 0, items 2+2+1
+    assert len(checkouts) == 8
+    assert [record["position"] for record in records if record["type"] == "plan_day"] == [0, 1, 2, 3, 4]
+    items = [record for record in records if record["type"] == "knowledge_item"]
+    assert [item["term"] for item in items] == [f"term {i}" for i in range(5)]
+    assert "item_id" not in items[0]
+
+
+def test_import_in_chunks_and_skip_records_of_missing_plans(db, user):
+    records = [{"type": "header", "format": FORMAT_VERSION}, {"type": "plan", "pid": 5, "plan_name": "p"}]
+    records += [{"type": "knowledge_item", "pid": 5, "item_type": "concept", "term": f"t{i}", "definition": "d"}
+                for i in range(25)]
+    records.append({"type": "knowledge_item", "pid": 6, "item_type": "concept", "term": "x", "definition": "d"})
+    counts, plans = db.import_user_data(user, iter(records), chunk_size=4)
+    assert counts["knowledge_item"] == 25 and counts["skipped"] == 1
+    assert db.count_knowledge_items_by_plan(user, plans[5]) == 25
+    ids = [item["item_id"] for item in db.get_knowledge_items_by_plan(user, plans[5])]
+    assert len(set(ids)) == 25
+
+
+def test_invalid_input_rolls_back_the_current_chunk(db, user):
+    records = [{"type": "header", "format": FORMAT_VERSION}, {"type": "plan", "pid": 1, "plan_name": "p"},
+               {"type": "mystery"}]
+    with pytest.raises(TransferError):
+        db.import_user_data(user, iter(records))
+    assert db.count_plans_by_user(user) == 0
+
+    with pytest.raises(TransferError):
+        db.import_user_data(user, iter([{"type": "header", "format": FORMAT_VERSION + 1}]))
+    with pytest.raises(TransferError, match="Line 2"):
+        list(read_jsonl(io.StringIO('{"type": "header"}\nnot json\n')))
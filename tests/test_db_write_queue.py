@@ -0,0 +1,114 @@
+import contextlib
+import sqlite3
+import threading
+
+import pytest
+
+from db_write_queue import WriteBehindQueue
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "queue.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT NOT NULL UNIQUE)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def make_queue(database, **kwargs):
+    @contextlib.contextmanager
+    def connect(target):
+        conn = sqlite3.connect(target or database)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    return WriteBehindQueue(connect, **kwargs)
+
+
+def insert(body):
+    return lambda conn: conn.execute("INSERT INTO notes (body) VALUES (?)", (body,)).lastrowid
+
+
+def count(database):
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_submit_returns_a_future_of_the_write_result(database):
+    queue = make_queue(database)
+    future = queue.submit([("note", 1)], insert("first"))
+    assert future.result(timeout=5) == 1
+    assert count(database) == 1
+    queue.close()
+
+
+def test_failed_writes_resolve_their_future_with_the_error(database):
+    queue = make_queue(database)
+    good = queue.submit([("note", 1)], insert("same"))
+    duplicate = queue.submit([("note", 2)], insert("same"))
+    assert good.result(timeout=5) == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        duplicate.result(timeout=5)
+    assert queue.stats()["failed"] == 1
+    queue.close()
+
+
+def test_one_bad_write_does_not_drop_the_rest_of_its_batch(database):
+    queue = make_queue(database)
+    gate = threading.Event()
+    # Hold the writer so the next writes are committed as one batch
+    queue.submit([("gate",)], lambda conn: gate.wait(5))
+    futures = [queue.submit([("note", i)], insert(body)) for i, body in enumerate(["a", "b", "a", "c"])]
+    gate.set()
+    queue.flush()
+    assert [future.exception() is None for future in futures] == [True, True, False, True]
+    assert count(database) == 3
+    queue.close()
+
+
+def test_unreachable_target_fails_every_write_for_it(database, tmp_path):
+    queue = make_queue(database)
+    missing = str(tmp_path / "no-such-dir" / "x.db")
+    future = queue.submit([("note", 1)], insert("x"), target=missing)
+    with pytest.raises(sqlite3.OperationalError):
+        future.result(timeout=5)
+    # The writer is still alive
+    assert queue.submit([("note", 1)], insert("y")).result(timeout=5) == 1
+    queue.close()
+
+
+def test_read_your_writes_and_commit_callback(database, caplog):
+    committed = []
+    queue = make_queue(database, on_commit=committed.append)
+    gate = threading.Event()
+    queue.submit([("gate",)], lambda conn: gate.wait(5))
+    queue.submit([("note", 7)], insert("x"))
+    # Another scope is not held up by the pending write
+    assert queue.wait_for([("note", 8)], timeout=0.01)
+    assert not queue.wait_for([("note", 7)], timeout=0.01)
+    assert "still pending" in caplog.text
+    gate.set()
+    assert queue.wait_for([("note", 7)], timeout=5)
+    assert count(database) == 1
+    assert any(("note", 7) in keys for keys in committed)
+    queue.close()
+
+
+def test_close_flushes_pending_writes_then_writes_synchronously(database):
+    queue = make_queue(database)
+    futures = [queue.submit([("note", i)], insert(f"note {i}")) for i in range(50)]
+    queue.close()
+    assert all(future.done() for future in futures)
+    assert count(database) == 50
+    after = queue.submit([("note", 99)], insert("after close"))
+    assert after.done() and after.result() == 51
+    duplicate = queue.submit([("note", 99)], insert("after close"))
+    assert isinstance(duplicate.exception(), sqlite3.IntegrityError)
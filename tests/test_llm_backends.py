@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+from llm_backends import GeminiBackend, MockBackend, MockUpstreamError, create_backend
+from retry_policy import is_transient_error, retry_after_hint
+from structured_output import ASK_SCHEMA, LEARNING_MATERIAL_SCHEMA, PLAN_SCHEMA, QUIZ_SCHEMA, parse_structured
+
+
+@pytest.mark.parametrize("prompt, kind, schema", [
+    ("Create a daily learning plan to learn 'Go' in 5 days.", "plan", PLAN_SCHEMA),
+    ('Write the learning_material for today. The topic is: "Goroutines"', "lesson", LEARNING_MATERIAL_SCHEMA),
+    ("Create a quiz about channels.", "quiz", QUIZ_SCHEMA),
+    ('Answer with is_knowledge_point. The user\'s question is: "What is a mutex?"', "ask", ASK_SCHEMA),
+])
+def test_mock_returns_schema_valid_json_for_each_page(prompt, kind, schema):
+    backend = MockBackend(latency_ms=0)
+    assert backend.classify(prompt) == kind
+    response = backend.generate("key", "model", prompt)
+    assert parse_structured(response.text, schema)[1] == "ok"
+    assert response.usage_metadata.total_token_count > 0
+
+
+def test_mock_answers_are_deterministic_per_prompt():
+    first, second = MockBackend(latency_ms=0, seed=1), MockBackend(latency_ms=0, seed=2)
+    assert first.generate("key", "model", "hello").text == second.generate("key", "model", "hello").text
+    assert MockBackend.classify("Grade the student's answer") == "grade"
+
+
+def test_mock_stream_matches_the_full_response():
+    backend = MockBackend(latency_ms=0)
+    prompt = 'Write the learning_material. The topic is: "Streams"'
+    usage = {}
+    chunks = list(backend.stream("key", "model", prompt, usage=usage))
+    assert len(chunks) > 1 and all(len(chunk) <= MockBackend.STREAM_CHUNK_CHARS for chunk in chunks)
+    assert "".join(chunks) == backend.generate("key", "model", prompt).text
+    assert usage["total_tokens"] > 0
+
+
+def test_injected_errors_are_transient():
+    backend = MockBackend(latency_ms=0, error_rate=1.0, seed=3)
+    codes = set()
+    for _ in range(20):
+        with pytest.raises(MockUpstreamError) as raised:
+            backend.generate("key", "model", "prompt")
+        assert is_transient_error(raised.value)
+        codes.add(raised.value.code)
+        if raised.value.code == 429:
+            assert retry_after_hint(raised.value) == 1.0
+    assert codes == {429, 503}
+    with pytest.raises(MockUpstreamError):
+        list(backend.stream("key", "model", "prompt"))
+
+
+def test_create_backend():
+    config = SimpleNamespace(
+        LLM_BACKEND="mock", LLM_MOCK_LATENCY_MS=0, LLM_MOCK_LATENCY_SIGMA=0.5, LLM_MOCK_ERROR_RATE=0,
+        GEMINI_CLIENT_IDLE_TIMEOUT=60,
+    )
+    assert isinstance(create_backend(config), MockBackend)
+    config.LLM_BACKEND = "gemini"
+    assert isinstance(create_backend(config), GeminiBackend)
+    config.LLM_BACKEND = "other"
+    with pytest.raises(ValueError):
+        create_backend(config)
@@ -0,0 +1,64 @@
+import pytest
+
+import llm_cache
+from llm_cache import LLMResponseCache, make_cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock.time)
+    return clock
+
+
+def test_keys_ignore_prompt_indentation_but_not_params():
+    key = make_cache_key("model", "  Line one\n      line two  ")
+    assert key == make_cache_key("model", "Line one\nline two")
+    assert key != make_cache_key("other-model", "Line one\nline two")
+    assert key != make_cache_key("model", "Line one\nline two", {"temperature": 0})
+
+
+def test_hits_survive_a_restart(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    LLMResponseCache(path, ttl_seconds=60, max_bytes=0).put("k", "model", "response")
+    cache = LLMResponseCache(path, ttl_seconds=60, max_bytes=0)
+    assert cache.get("k") == "response"
+    assert cache.get("missing") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1, "bytes": 8}
+
+
+def test_expired_entries_are_misses_and_purged(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), ttl_seconds=60, max_bytes=0)
+    cache.put("old", "model", "a")
+    clock.now += 30
+    cache.put("new", "model", "b")
+    clock.now += 45
+    assert cache.get("old") is None
+    assert cache.get("new") == "b"
+    cache.put("older", "model", "c")
+    clock.now += 61
+    assert cache.purge_expired() == 2
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_least_recently_used_entries_are_evicted_over_budget(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), ttl_seconds=0, max_bytes=10)
+    for key in ("a", "b", "c"):
+        cache.put(key, "model", key * 3)
+        clock.now += 1
+    cache.get("a")  # now more recent than b
+    clock.now += 1
+    cache.put("d", "model", "ddd")
+    assert [cache.get(key) for key in "abcd"] == ["aaa", None, "ccc", "ddd"]
+    # A response larger than the whole budget is not stored at all
+    cache.put("huge", "model", "x" * 11)
+    assert cache.get("huge") is None
+    assert cache.stats()["bytes"] == 9
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from llm_executor import LLMExecutor
+from rate_limiter import key_fingerprint
+
+
+@pytest.fixture
+def executor():
+    executor = LLMExecutor(max_workers=4, max_concurrency_per_key=2)
+    yield executor
+    executor.shutdown()
+
+
+def test_each_key_runs_at_most_its_cap(executor):
+    release = threading.Event()
+    lock = threading.Lock()
+    running, peak = {"a": 0}, {"a": 0}
+
+    def task():
+        with lock:
+            running["a"] += 1
+            peak["a"] = max(peak["a"], running["a"])
+        release.wait(5)
+        with lock:
+            running["a"] -= 1
+        return "done"
+
+    futures = [executor.submit("key-a", task) for _ in range(5)]
+    assert executor.stats()[key_fingerprint("key-a")] == {"queued": 3, "running": 2}
+    # A busy key does not hold up another key's calls
+    assert executor.submit("key-b", lambda: "other").result(timeout=5) == "other"
+    release.set()
+    assert [future.result(timeout=5) for future in futures] == ["done"] * 5
+    assert peak["a"] == 2
+    assert all(future.queue_wait >= 0 for future in futures)
+
+
+def test_errors_are_raised_from_the_future(executor):
+    def fail():
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError, match="bad prompt"):
+        executor.submit("key", fail).result(timeout=5)
+    # The slot is freed again
+    assert executor.submit("key", lambda: 1).result(timeout=5) == 1
+
+
+def test_cancelled_and_shut_down_tasks_never_run(executor):
+    release = threading.Event()
+    ran = []
+    blockers = [executor.submit("key", release.wait, 5) for _ in range(2)]
+    cancelled = executor.submit("key", ran.append, "cancelled")
+    assert cancelled.cancel()
+    queued = executor.submit("key", ran.append, "queued")
+    threading.Timer(0.05, release.set).start()
+    executor.shutdown()
+    assert all(future.result() for future in blockers)
+    assert queued.cancelled() and ran == []
+    with pytest.raises(RuntimeError):
+        executor.submit("key", ran.append, "late")
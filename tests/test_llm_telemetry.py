@@ -0,0 +1,76 @@
+import asyncio
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+
+from llm_telemetry import LLMTelemetry, calling_page, extract_usage, iter_records, percentile, summarize
+
+
+def finished(result=None, error=None, **stats):
+    future = Future()
+    future.call_stats = stats
+    future.queue_wait = 0.002
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+def test_records_are_written_as_jsonl(tmp_path):
+    path = str(tmp_path / "requests.jsonl")
+    telemetry = LLMTelemetry(path, max_bytes=0, backup_count=0)
+    record = telemetry.start("secret-key", "model", "3_Plan.py", "plan", "prompt")
+    telemetry.finish(record, finished("response", retries=1, total_tokens=30), cache_hit=False, coalesced=False)
+    record = telemetry.start("secret-key", "model", "3_Plan.py", "plan", "prompt")
+    telemetry.finish(record, finished(total_tokens=30, retries=1), coalesced=True)
+    record = telemetry.start("secret-key", "model", "7_Ask.py", "ask", "prompt")
+    telemetry.finish(record, finished(error=TimeoutError("slow")))
+    telemetry.close()
+
+    first, joined, failed = iter_records(path)
+    assert "secret" not in json.dumps(first)
+    assert (first["page"], first["response_chars"], first["retries"], first["queue_wait_ms"]) == ("3_Plan.py", 8, 1, 2.0)
+    # A coalesced call spent no tokens of its own
+    assert (joined["total_tokens"], joined["retries"]) == (0, 0)
+    assert (failed["outcome"], failed["error"]) == ("TimeoutError", "slow")
+
+
+def test_reader_goes_through_rotated_files_oldest_first(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    for name, page in (("requests.jsonl.2", "oldest"), ("requests.jsonl.1", "older"), ("requests.jsonl", "newest")):
+        (tmp_path / name).write_text(json.dumps({"page": page}) + "\nnot json\n\n")
+    assert [record["page"] for record in iter_records(str(path))] == ["oldest", "older", "newest"]
+
+
+def test_summary_per_page_and_prompt_type(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    records = [
+        {"page": "a.py", "prompt_type": "plan", "total_latency_ms": latency, "outcome": "ok", "total_tokens": 10}
+        for latency in range(1, 11)
+    ]
+    records.append({"page": "b.py", "total_latency_ms": 5, "outcome": "ValueError", "cache_hit": True, "retries": 2})
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    summary = summarize(str(path))
+    assert summary["page"]["a.py"] == {
+        "count": 10, "p50": 5, "p95": 10, "p99": 10, "cache_hit_rate": 0.0, "error_rate": 0.0,
+        "total_tokens": 100, "retries": 0,
+    }
+    assert summary["prompt_type"]["unknown"]["error_rate"] == 1.0
+    assert summary["page"]["b.py"]["cache_hit_rate"] == 1.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_usage_defaults_to_zero():
+    usage = SimpleNamespace(prompt_token_count=3, candidates_token_count=None, total_token_count=3)
+    assert extract_usage(SimpleNamespace(usage_metadata=usage)) == {"prompt_tokens": 3, "response_tokens": 0, "total_tokens": 3}
+    assert extract_usage(None)["total_tokens"] == 0
+
+
+def test_calling_page_skips_event_loop_and_worker_frames():
+    # Stands in for an LLM-layer coroutine awaited by this "page"
+    namespace = {"calling_page": calling_page}
+    exec(compile("async def layer():\n    return calling_page(('config.py',))\n", "config.py", "exec"), namespace)
+    assert asyncio.run(namespace["layer"]()) == "test_llm_telemetry.py"
+    with ThreadPoolExecutor(1) as pool:
+        assert pool.submit(calling_page).result() == "unknown"
@@ -0,0 +1,69 @@
+import pytest
+
+from rate_limiter import RateLimiter, TokenBucket, estimate_tokens, key_fingerprint
+
+
+def test_key_fingerprint_is_stable_and_hides_the_key():
+    assert key_fingerprint("secret-key") == key_fingerprint("secret-key")
+    assert key_fingerprint("secret-key") != key_fingerprint("other-key")
+    assert "secret" not in key_fingerprint("secret-key")
+    assert key_fingerprint(None) == key_fingerprint("") == "anonymous"
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abc") == 1
+    assert estimate_tokens("x" * 400) == 100
+
+
+def test_token_bucket_refills_continuously_up_to_capacity():
+    bucket = TokenBucket(capacity=10, refill_per_second=2)
+    start = bucket.updated_at
+    assert bucket.reserve(10, start) == 0.0
+    assert bucket.wait_time(4, start) == pytest.approx(2.0)
+    assert bucket.wait_time(4, start + 1) == pytest.approx(1.0)
+    assert bucket.wait_time(1, start + 100) == 0.0
+    assert bucket.tokens == 10
+
+
+def test_token_bucket_reservations_queue_first_come_first_served():
+    bucket = TokenBucket(capacity=2, refill_per_second=1)
+    now = bucket.updated_at
+    waits = [bucket.reserve(1, now) for _ in range(4)]
+    # Each reservation past the capacity goes into debt and waits one refill longer
+    assert waits == [0.0, 0.0, pytest.approx(1.0), pytest.approx(2.0)]
+    bucket.refund(1)
+    assert bucket.tokens == pytest.approx(-1.0)
+
+
+def test_token_bucket_caps_oversized_requests_at_capacity():
+    bucket = TokenBucket(capacity=5, refill_per_second=1)
+    assert bucket.reserve(50, bucket.updated_at) == 0.0
+    assert bucket.tokens == 0
+
+
+def test_rate_limiter_budgets_are_per_key():
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=1000)
+    assert limiter.acquire("key-a", "model") == 0.0
+    assert limiter.acquire("key-a", "model") == 0.0
+    assert limiter.acquire("key-a", "model") > 0
+    # Another key has its own buckets
+    assert limiter.acquire("key-b", "model") == 0.0
+
+
+def test_try_acquire_reserves_nothing_when_it_would_wait():
+    limiter = RateLimiter(requests_per_minute=1)
+    assert limiter.try_acquire("key", "model") == (True, 0.0)
+    allowed, wait = limiter.try_acquire("key", "model")
+    assert not allowed and wait > 0
+    limiter.refund("key", "model")
+    assert limiter.try_acquire("key", "model") == (True, 0.0)
+
+
+def test_record_usage_corrects_the_token_estimate():
+    limiter = RateLimiter(requests_per_minute=None, tokens_per_minute=1000)
+    limiter.acquire("key", "model", estimated_tokens=100)
+    limiter.record_usage("key", "model", estimated_tokens=100, actual_tokens=400)
+    (status,) = limiter.snapshot().values()
+    assert status["tokens_available"] == pytest.approx(600, abs=1)
+    assert status["requests_available"] is None
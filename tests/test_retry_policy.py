@@ -0,0 +1,164 @@
+import time
+
+import pytest
+
+from retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy, is_transient_error, retry_after_hint
+
+
+class Upstream(Exception):
+    def __init__(self, code, message=""):
+        self.code = code
+        super().__init__(f"{code} {message}")
+
+
+class LocalError(Exception):
+    """Stands in for the AIRequestErrors raised before or after the upstream call."""
+
+
+def open_then_half_open(breaker, key="key"):
+    """Open the circuit with one transient failure and let the reset timeout pass."""
+    breaker.before_call(key)
+    breaker.record_failure(key)
+    assert breaker.state(key) == CircuitBreaker.OPEN
+    time.sleep(breaker.reset_timeout * 2)
+
+
+def fail(error):
+    def fn():
+        raise error
+    return fn
+
+
+def test_transient_error_classification():
+    assert is_transient_error(Upstream(503))
+    assert is_transient_error(Upstream(429))
+    assert is_transient_error(TimeoutError())
+    assert is_transient_error(Exception("429 Resource exhausted"))
+    assert not is_transient_error(Upstream(400, "API_KEY_INVALID"))
+    assert not is_transient_error(ValueError("bad prompt"))
+
+
+def test_retry_after_hint():
+    assert retry_after_hint(Exception("retry_delay { seconds: 7 }")) == 7.0
+    assert retry_after_hint(Exception("Please retry in 1.5s.")) == 1.5
+    error = Upstream(429)
+    error.retry_after = 3
+    assert retry_after_hint(error) == 3.0
+    assert retry_after_hint(Exception("nothing here")) is None
+
+
+def test_backoff_uses_full_jitter_within_the_exponential_cap():
+    policy = RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=8.0, breaker=CircuitBreaker(5, 30))
+    for attempt, cap in ((1, 1.0), (2, 2.0), (3, 4.0), (4, 8.0), (6, 8.0)):
+        delays = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= cap for delay in delays)
+        # Jittered, not a fixed schedule
+        assert len(set(delays)) > 1
+    assert policy.backoff(1, hint=5.0) >= 5.0
+
+
+def test_circuit_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call("key")
+        breaker.record_failure("key")
+    assert breaker.state("key") == CircuitBreaker.CLOSED
+    breaker.before_call("key")
+    breaker.record_failure("key")
+    assert breaker.state("key") == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call("key")
+    # Other keys are unaffected
+    breaker.before_call("other-key")
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    open_then_half_open(breaker)
+    breaker.before_call("key")
+    assert breaker.state("key") == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call("key")
+    breaker.record_success("key")
+    assert breaker.state("key") == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    open_then_half_open(breaker)
+    breaker.before_call("key")
+    breaker.record_failure("key")
+    assert breaker.state("key") == CircuitBreaker.OPEN
+    assert breaker.snapshot()[next(iter(breaker.snapshot()))]["times_opened"] == 2
+
+
+def test_release_frees_the_trial_without_closing_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    open_then_half_open(breaker)
+    breaker.before_call("key")
+    breaker.release("key")
+    assert breaker.state("key") == CircuitBreaker.HALF_OPEN
+    # The next caller gets the trial instead of failing fast forever
+    breaker.before_call("key")
+
+
+def test_retry_policy_retries_transient_errors_then_succeeds():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.002, breaker=CircuitBreaker(5, 30))
+    outcomes = [Upstream(503), Upstream(503), "ok"]
+    retries = []
+
+    def fn():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert policy.call("key", fn, on_retry=lambda attempt, delay, error: retries.append(attempt)) == "ok"
+    assert retries == [1, 2]
+    assert policy.stats()["retries"] == 2
+
+
+def test_retry_policy_gives_up_after_max_attempts():
+    policy = RetryPolicy(max_attempts=2, base_delay=0.001, max_delay=0.002, breaker=CircuitBreaker(5, 30))
+    with pytest.raises(Upstream):
+        policy.call("key", fail(Upstream(503)))
+    assert policy.stats()["gave_up"] == 1
+
+
+def test_non_transient_errors_are_not_retried():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise Upstream(400, "API_KEY_INVALID")
+
+    policy = RetryPolicy(max_attempts=4, base_delay=0.001, max_delay=0.002, breaker=CircuitBreaker(5, 30))
+    with pytest.raises(Upstream):
+        policy.call("key", fn)
+    assert len(calls) == 1
+
+
+def test_local_error_during_half_open_trial_does_not_close_the_circuit():
+    # A rate-limit wait that is too long (or an empty response) is raised locally and
+    # says nothing about the upstream's health
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    policy = RetryPolicy(max_attempts=1, base_delay=0.001, max_delay=0.002, breaker=breaker)
+    open_then_half_open(breaker)
+    with pytest.raises(LocalError):
+        policy.call("key", fail(LocalError("AI returned empty response")))
+    assert breaker.state("key") == CircuitBreaker.HALF_OPEN
+    # ...and it released the trial, so a real call can still probe the upstream
+    assert policy.call("key", lambda: "ok") == "ok"
+    assert breaker.state("key") == CircuitBreaker.CLOSED
+
+
+def test_local_errors_do_not_reset_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    policy = RetryPolicy(max_attempts=1, base_delay=0.001, max_delay=0.002, breaker=breaker)
+    with pytest.raises(Upstream):
+        policy.call("key", fail(Upstream(503)))
+    with pytest.raises(LocalError):
+        policy.call("key", fail(LocalError()))
+    with pytest.raises(Upstream):
+        policy.call("key", fail(Upstream(503)))
+    assert breaker.state("key") == CircuitBreaker.OPEN
@@ -0,0 +1,37 @@
+from concurrent.futures import Future
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_identical_requests_share_one_future():
+    flight = SingleFlight()
+    started = []
+
+    def start():
+        started.append(1)
+        return Future()
+
+    first, shared_first = flight.do("prompt", start)
+    second, shared_second = flight.do("prompt", start)
+    assert first is second
+    assert (shared_first, shared_second) == (False, True)
+    assert len(started) == 1
+    assert flight.coalesced == 1
+    assert flight.in_flight() == 1
+
+
+def test_finished_requests_are_forgotten():
+    flight = SingleFlight()
+    first, _ = flight.do("prompt", Future)
+    first.set_result("text")
+    assert flight.in_flight() == 0
+    second, shared = flight.do("prompt", Future)
+    assert second is not first and not shared
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    first, _ = flight.do(("key-a", "prompt"), Future)
+    second, shared = flight.do(("key-b", "prompt"), Future)
+    assert first is not second and not shared
+    assert flight.in_flight() == 2
@@ -0,0 +1,44 @@
+import pytest
+
+from spaced_repetition import (
+    DEFAULT_EASE, EASY_BONUS, FIRST_INTERVALS, HARD_FACTOR, MIN_EASE, RELEARN_SECONDS, next_schedule,
+)
+
+
+def test_first_reviews_use_the_fixed_intervals():
+    ease, interval, reps, due_in = next_schedule(DEFAULT_EASE, 0.0, 0, "good")
+    assert (ease, interval, reps, due_in) == (DEFAULT_EASE, FIRST_INTERVALS[0], 1, FIRST_INTERVALS[0] * 86400)
+    assert next_schedule(ease, interval, reps, "good")[1] == FIRST_INTERVALS[1]
+
+
+def test_later_reviews_grow_by_the_ease():
+    assert next_schedule(2.5, 6.0, 2, "good") == (2.5, 15.0, 3, 15.0 * 86400)
+    ease, interval, reps, _ = next_schedule(2.5, 6.0, 2, "hard")
+    assert (ease, interval, reps) == (pytest.approx(2.35), pytest.approx(6.0 * HARD_FACTOR), 3)
+    ease, interval, _, _ = next_schedule(2.5, 6.0, 2, "easy")
+    assert ease == pytest.approx(2.65)
+    assert interval == pytest.approx(6.0 * 2.5 * EASY_BONUS)
+
+
+def test_again_relearns_soon_and_lowers_the_ease_to_a_floor():
+    assert next_schedule(2.5, 30.0, 5, "again") == (pytest.approx(2.3), 0.0, 0, RELEARN_SECONDS)
+    assert next_schedule(MIN_EASE, 30.0, 5, "again")[0] == MIN_EASE
+    assert next_schedule(MIN_EASE, 30.0, 5, "hard")[0] == MIN_EASE
+
+
+def test_unknown_grade():
+    with pytest.raises(ValueError):
+        next_schedule(2.5, 1.0, 1, "perfect")
+
+
+def test_grading_moves_a_card_out_of_the_due_queue(db, user, make_plan):
+    pid = make_plan(user)
+    db.add_knowledge_items_bulk(user, pid, [("concept", "a", "d"), ("concept", "b", "d")])
+    due = db.get_due_cards(user, pid)
+    assert [card["term"] for card in due] == ["a", "b"]
+    assert db.grade_card(user, due[0]["item_id"], "good") == FIRST_INTERVALS[0]
+    assert [card["term"] for card in db.get_due_cards(user, pid)] == ["b"]
+    # "again" comes back within the learn-ahead window of the same session
+    db.grade_card(user, due[1]["item_id"], "again")
+    assert db.count_due_cards(user, pid) == 1
+    assert db.grade_card(user, 10 ** 9, "good") is None
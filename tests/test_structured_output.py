@@ -0,0 +1,94 @@
+import pytest
+
+from structured_output import (
+    ASK_SCHEMA, LEARNING_MATERIAL_SCHEMA, JSONArrayStreamParser, StructuredOutputError, StructuredStream,
+    conform, parse_json_text, parse_structured,
+)
+
+
+def test_valid_json_is_not_marked_repaired():
+    assert parse_json_text('{"a": 1}') == ({"a": 1}, False)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('Here you go: {"a": [1, 2]} Hope it helps!', {"a": [1, 2]}),
+    ('{"a": [1, 2,], "b": 3,}', {"a": [1, 2], "b": 3}),
+    ('{"eq": "\\alpha + \\sqrt{2}"}', {"eq": "\\alpha + \\sqrt{2}"}),
+    ('{"text": "line one\nline two"}', {"text": "line one\nline two"}),
+])
+def test_common_model_mistakes_are_repaired(text, expected):
+    assert parse_json_text(text) == (expected, True)
+
+
+def test_truncated_output_keeps_the_complete_items():
+    value, repaired = parse_json_text('{"items": [{"n": 1}, {"n": 2}, {"n": ')
+    assert repaired
+    assert value == {"items": [{"n": 1}, {"n": 2}]}
+
+
+@pytest.mark.parametrize("text", [None, "", "no json here", "{{{"])
+def test_unusable_output_raises(text):
+    with pytest.raises(StructuredOutputError):
+        parse_json_text(text)
+
+
+def test_conform_coerces_scalars_and_fills_defaults():
+    schema = {
+        "type": "object",
+        "required": ["count", "flag", "mode"],
+        "properties": {
+            "count": {"type": "integer"},
+            "flag": {"type": "boolean", "default": False},
+            "mode": {"type": "string", "enum": ["a", "b"], "default": "a"},
+        },
+    }
+    value, dropped = conform({"count": "3", "flag": None, "mode": "B"}, schema)
+    assert value == {"count": 3, "flag": False, "mode": "b"}
+    assert dropped == 0
+
+
+def test_conform_drops_invalid_array_items():
+    schema = {"type": "array", "items": {"type": "object", "required": ["n"]}}
+    value, dropped = conform([{"n": 1}, "junk", {"n": 2}], schema)
+    assert value == [{"n": 1}, {"n": 2}]
+    assert dropped == 1
+    with pytest.raises(StructuredOutputError):
+        conform(["junk"], schema)
+
+
+def test_parse_structured_outcomes():
+    assert parse_structured('{"is_knowledge_point": true, "data": {}}', ASK_SCHEMA)[1] == "ok"
+    assert parse_structured('```json\n{"is_knowledge_point": false, "data": {}}\n```', ASK_SCHEMA)[1] == "repaired"
+    with pytest.raises(StructuredOutputError):
+        parse_structured('{"is_knowledge_point": true}', ASK_SCHEMA)
+
+
+def test_stream_parser_yields_items_as_they_complete():
+    parser = JSONArrayStreamParser("learning_material", {"type": "object", "required": ["type"]})
+    document = '{"learning_material": [{"type": "paragraph", "content": "a [b] {c}"}, {"type": "key_concept"}, 5]}'
+    completed = []
+    for i in range(0, len(document), 7):
+        completed.extend(parser.feed(document[i:i + 7]))
+    assert completed == [{"type": "paragraph", "content": "a [b] {c}"}, {"type": "key_concept"}]
+
+
+def test_stream_parser_ignores_other_arrays_and_escaped_quotes():
+    parser = JSONArrayStreamParser("items", {"type": "object"})
+    completed = parser.feed('{"other": [{"x": 1}], "title": "say \\"[hi]\\"", "items": [{"y": 2}]}')
+    assert completed == [{"y": 2}]
+
+
+def test_stream_parser_top_level_array_and_dropped_items():
+    parser = JSONArrayStreamParser(item_schema={"type": "object", "required": ["n"]})
+    assert parser.feed('[{"n": 1}, {"m": 2}, {"n"') == [{"n": 1}]
+    assert parser.feed(': 3}]') == [{"n": 3}]
+    assert parser.dropped == 1
+
+
+def test_structured_stream_rebuilds_the_document_from_items_after_truncation():
+    chunks = ['{"learning_material": [{"type": "paragraph", "content": "x"}, ', '{"type": "parag']
+    stream = StructuredStream(iter(chunks), LEARNING_MATERIAL_SCHEMA, "learning_material")
+    items = list(stream)
+    assert items == [{"type": "paragraph", "content": "x"}]
+    assert stream.document == {"learning_material": items}
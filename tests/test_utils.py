@@ -0,0 +1,38 @@
+from concurrent.futures import Future
+
+import pytest
+
+import utils
+from conftest import SessionState
+
+
+@pytest.fixture(autouse=True)
+def session(monkeypatch):
+    state = SessionState()
+    monkeypatch.setattr(utils.st, "session_state", state)
+    return state
+
+
+def test_saves_are_reported_once_they_finish(session):
+    errors, results = [], []
+    saved, failed, pending = Future(), Future(), Future()
+    utils.track_save(saved, errors.append, results.append)
+    utils.track_save(failed, errors.append)
+    utils.track_save(pending, errors.append, results.append)
+    saved.set_result(3)
+    failed.set_exception(RuntimeError("disk full"))
+
+    utils.report_saves()
+    assert results == [3]
+    assert [str(error) for error in errors] == ["disk full"]
+    assert [entry[0] for entry in session.pending_saves] == [pending]
+
+    pending.set_result(0)
+    utils.report_saves()
+    assert results == [3, 0]
+    assert session.pending_saves == []
+
+
+def test_report_saves_without_any_tracked():
+    utils.report_saves()
+    assert utils.st.session_state.pending_saves == []
@@ -21,4 +21,28 @@ def ensure_plan_selected():
         st.page_link("main.py", label="Go to Homepage", icon="🏠")
         st.stop()
     
-    return st.session_state['current_plan_id']
\ No newline at end of file
+    return st.session_state['current_plan_id']
+
+def track_save(future, on_error, on_result=None):
+    """
+    Keep the Future of a queued database write in the session instead of waiting
+    for it, so the page stays responsive. `report_saves` calls `on_error(error)` or
+    `on_result(result)` on a later run, once the write has been committed.
+    """
+    st.session_state.setdefault('pending_saves', []).append((future, on_error, on_result))
+
+
+def report_saves():
+    """
+    Report the outcome of queued writes from earlier runs that have finished since;
+    those still pending are checked again on the next run.
+    """
+    pending = []
+    for future, on_error, on_result in st.session_state.get('pending_saves', []):
+        if not future.done():
+            pending.append((future, on_error, on_result))
+        elif future.exception() is not None:
+            on_error(future.exception())
+        elif on_result is not None:
+            on_result(future.result())
+    st.session_state.pending_saves = pending